@@ -1,33 +1,241 @@
 """
 API Endpoints for Chatbot
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.database import get_db
+from app.core.database import AsyncReadSessionLocal, AsyncSessionLocal, get_db, get_read_db
 from app.core.rule_engine import RuleEngine
+from app.core.executor import RuleExecutor
+from app.core.tenants import RuleSetRegistry, TenantRulesError, UnknownTenantError
 from app.core.config import settings
-from app.services.conversation_service import ConversationService
+from app.services.conversation_service import ANALYTICS_GRANULARITIES, ConversationService
+from app.services.chat_writer import ChatWriter
+from app.services.archive import ArchiveJob, ArchiveStore
+from app.services.session_registry import SessionRegistry
+from app.services.history_buffer import HistoryBuffer
+from app.services.rule_catalog import rule_catalog
 from app.api.schemas import (
-    ChatRequest, ChatResponse, SessionResponse, SessionCreate,
-    ConversationHistoryResponse, AnalyticsResponse, IntentsResponse,
-    HealthResponse
+    ChatRequest, ChatResponse, BatchChatRequest, BatchChatResponse,
+    BatchChatItem, SessionResponse, SessionCreate,
+    ConversationHistoryResponse, AnalyticsResponse, AnalyticsDashboardResponse, IntentsResponse,
+    RuleDiagnosticsResponse, HealthResponse
 )
+import json
 import time
+import uuid
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # Initialize rule engine (singleton)
-rule_engine = RuleEngine(settings.RULES_FILE)
+rule_engine = RuleEngine(
+    settings.RULES_FILE,
+    match_strategy=settings.MATCH_STRATEGY,
+    prefilter=settings.MATCH_PREFILTER,
+    cache_size=settings.RESULT_CACHE_SIZE,
+    artifact_cache=settings.RULES_ARTIFACT_CACHE,
+    artifact_dir=settings.RULES_ARTIFACT_DIR or None,
+    match_time_budget_ms=settings.MATCH_TIME_BUDGET_MS,
+    redos_policy=settings.REDOS_POLICY,
+    scoring=settings.INTENT_SCORING,
+    top_k=settings.INTENT_TOP_K,
+    adaptive_order=settings.ADAPTIVE_ORDER,
+    reorder_interval=settings.REORDER_INTERVAL,
+    fuzzy_fallback=settings.FUZZY_FALLBACK,
+    fuzzy_max_distance=settings.FUZZY_MAX_DISTANCE,
+    fuzzy_vocabulary_file=settings.FUZZY_VOCABULARY_FILE or None
+)
+# Runs rule matching inline or on a worker pool, per EXECUTION_MODE
+rule_executor = RuleExecutor(
+    rule_engine,
+    mode=settings.EXECUTION_MODE,
+    workers=settings.EXECUTION_WORKERS
+)
+# Recent messages per session, filled by chat_writer once committed
+history_buffer = HistoryBuffer(
+    session_size=settings.HISTORY_BUFFER_SIZE,
+    max_memory_mb=settings.HISTORY_BUFFER_MEMORY_MB
+)
+# Saves chat turns per PERSISTENCE_MODE (one transaction per request or write-behind)
+chat_writer = ChatWriter(
+    AsyncSessionLocal,
+    mode=settings.PERSISTENCE_MODE,
+    max_batch=settings.WRITE_BATCH_SIZE,
+    flush_interval_ms=settings.WRITE_FLUSH_INTERVAL_MS,
+    max_queue=settings.WRITE_QUEUE_SIZE,
+    history_buffer=history_buffer,
+    retries=settings.WRITE_RETRIES
+)
+# Known session IDs, validated in memory; session activity written in batches
+session_registry = SessionRegistry(
+    AsyncSessionLocal,
+    cache_size=settings.SESSION_CACHE_SIZE,
+    filter_capacity=settings.SESSION_FILTER_CAPACITY,
+    filter_error_rate=settings.SESSION_FILTER_ERROR_RATE,
+    authoritative=settings.SESSION_FILTER_AUTHORITATIVE,
+    touch_interval_s=settings.SESSION_TOUCH_INTERVAL_S,
+    idle_minutes=settings.SESSION_IDLE_MINUTES
+)
+# Cold storage for messages and analytics older than ARCHIVE_AFTER_DAYS
+message_archive = ArchiveStore(settings.ARCHIVE_DIR)
+archive_job = ArchiveJob(
+    AsyncSessionLocal,
+    message_archive,
+    max_age_days=settings.ARCHIVE_AFTER_DAYS,
+    interval_s=settings.ARCHIVE_INTERVAL_S,
+    batch_size=settings.ARCHIVE_BATCH_SIZE,
+    on_archived=history_buffer.drop_before,
+    read_session_factory=AsyncReadSessionLocal
+)
+# Per-tenant rule sets sharing the default engine's settings, when TENANTS_DIR is set
+tenant_registry = None
+if settings.TENANTS_DIR:
+    tenant_registry = RuleSetRegistry(
+        settings.TENANTS_DIR,
+        engine_kwargs={
+            name: value for name, value in rule_engine.constructor_kwargs().items()
+            if name != 'rules_file'
+        },
+        max_memory_mb=settings.TENANT_MEMORY_MB
+    )
 start_time = time.time()
 
 
+async def resolve_engine(
+    http_request: Request,
+    db: Optional[AsyncSession] = None,
+    session_id: Optional[str] = None
+) -> Tuple[RuleEngine, Optional[str]]:
+    """
+    Pick the rule engine for a request
+    
+    The tenant comes from the TENANT_HEADER header, else from the tenant the
+    session was started with: the registry's in-memory binding or, when the
+    binding is not cached (another worker, a restart, an eviction), the
+    session's conversation row. Requests without a tenant use the default rules.
+    
+    Args:
+        http_request: Incoming request
+        db: Read-only database session for looking up session tenants
+        session_id: Conversation session ID, if any
+        
+    Returns:
+        Tuple of (rule engine, tenant name or None)
+        
+    Raises:
+        HTTPException: 404 if the tenant has no rules file, 500 if it cannot be loaded
+    """
+    if tenant_registry is None:
+        return rule_engine, None
+    tenant = http_request.headers.get(settings.TENANT_HEADER)
+    if not tenant and session_id:
+        tenant = tenant_registry.tenant_for_session(session_id)
+        if tenant is None and db is not None:
+            tenant = await ConversationService.get_session_tenant(db, session_id) or ''
+            tenant_registry.bind_session(session_id, tenant)
+    if not tenant:
+        return rule_engine, None
+    
+    try:
+        if tenant_registry.is_loaded(tenant):
+            engine = tenant_registry.get(tenant)
+        else:
+            # Compiling a tenant's rules is CPU-bound; keep the event loop serving
+            engine = await run_in_threadpool(tenant_registry.get, tenant)
+    except UnknownTenantError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown tenant '{tenant}'"
+        )
+    except TenantRulesError as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Rules for tenant '{tenant}' are invalid"
+        )
+    except Exception as e:
+        logger.error(f"Error loading rules for tenant '{tenant}': {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load tenant rules"
+        )
+    return engine, tenant
+
+
+async def resolve_request(
+    http_request: Request,
+    session_id: Optional[str]
+) -> Tuple[RuleEngine, Optional[str], str, bool]:
+    """
+    Resolve the rule engine and session of a chat request
+    
+    The lookups run on a read-only session that is closed before rule
+    matching, so the request holds the single writer connection only
+    while its turn is saved.
+    
+    Args:
+        http_request: Incoming request
+        session_id: Session ID from the request, if any
+        
+    Returns:
+        Tuple of (rule engine, tenant name or None, session ID, whether the session is new)
+    """
+    async with AsyncReadSessionLocal() as read_db:
+        engine, tenant = await resolve_engine(http_request, read_db, session_id)
+        session_id, new_session = await resolve_session(read_db, session_id)
+    return engine, tenant, session_id, new_session
+
+
+async def resolve_session(db: AsyncSession, session_id: Optional[str]) -> Tuple[str, bool]:
+    """
+    Validate a client-supplied session ID or start a new session
+    
+    A new session's conversation row is written together with its first
+    chat turn, not by a separate commit.
+    
+    Args:
+        db: Read-only database session (for IDs the session registry must look up)
+        session_id: Session ID from the request, if any
+        
+    Returns:
+        Tuple of (session ID, whether the session is new)
+        
+    Raises:
+        HTTPException: 404 if SESSION_VALIDATION is on and the session does not exist
+    """
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        session_registry.register(session_id)
+        return session_id, True
+    if settings.SESSION_VALIDATION and not await session_registry.exists(db, session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown session '{session_id}'")
+    return session_id, False
+
+
+async def register_rules(engine: RuleEngine):
+    """
+    Assign dictionary IDs to a loaded rules version
+    
+    Failures are only logged: IDs missing from the catalog are assigned
+    when the first message needing them is saved.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            await rule_catalog.register(db, engine.snapshot)
+    except Exception as e:
+        logger.error(f"Error registering rules version {engine.snapshot.version}: {e}")
+
+
 @router.post("/chat", response_model=ChatResponse, status_code=status.HTTP_200_OK)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -35,56 +243,45 @@ async def chat(
     
     Args:
         request: ChatRequest with message and optional session_id
-        db: Database session
+        http_request: Incoming request (for the tenant header)
+        db: Database session (only used to save the turn)
         
     Returns:
         ChatResponse with bot reply and metadata
     """
+    engine, tenant, session_id, new_session = await resolve_request(http_request, request.session_id)
     try:
         start = time.time()
         
-        # Create or validate session
-        session_id = request.session_id
-        if not session_id:
-            session_id = await ConversationService.create_session(db)
-        
-        # Save user message
-        await ConversationService.save_message(
-            db=db,
-            session_id=session_id,
-            message=request.message,
-            is_user=True
-        )
+        if tenant:
+            tenant_registry.bind_session(session_id, tenant)
         
         # Process message through rule engine
-        result = rule_engine.process_message(request.message)
+        rules_hash = engine.snapshot.source_hash
+        result = await rule_executor.process_message(request.message, engine=engine)
         
-        # Save bot response
-        await ConversationService.save_message(
-            db=db,
-            session_id=session_id,
-            message=result['response'],
-            is_user=False,
-            intent=result['intent'],
-            sentiment=result['sentiment']
-        )
-        
-        # Save analytics
+        # Save the session, both messages and analytics together
         response_time_ms = int((time.time() - start) * 1000)
-        await ConversationService.save_analytics(
+        await chat_writer.save(
             db=db,
             session_id=session_id,
-            intent=result['intent'],
-            matched_pattern=result['matched_pattern'],
-            response_time_ms=response_time_ms
+            messages=[request.message],
+            results=[result],
+            response_time_ms=response_time_ms,
+            new_session=new_session,
+            rules_hash=rules_hash,
+            tenant=tenant
         )
+        if not new_session:
+            session_registry.touch(session_id)
         
         return ChatResponse(
             response=result['response'],
             session_id=session_id,
             intent=result['intent'],
             sentiment=result['sentiment'],
-            confidence=result['confidence']
+            confidence=result['confidence'],
+            alternates=result['alternates']
         )
         
     except Exception as e:
@@ -95,6 +292,72 @@ async def chat(
         )
 
 
+@router.post("/chat/batch", response_model=BatchChatResponse, status_code=status.HTTP_200_OK)
+async def chat_batch(
+    request: BatchChatRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Batch chat endpoint - classifies many messages in one request
+    
+    Args:
+        request: BatchChatRequest with messages and optional session_id
+        http_request: Incoming request (for the tenant header)
+        db: Database session (only used to save the turn)
+        
+    Returns:
+        BatchChatResponse with per-message results in request order
+    """
+    engine, tenant, session_id, new_session = await resolve_request(http_request, request.session_id)
+    try:
+        start = time.time()
+        
+        if tenant:
+            tenant_registry.bind_session(session_id, tenant)
+        
+        # Process all messages through the rule engine
+        rules_hash = engine.snapshot.source_hash
+        results = await rule_executor.process_batch(request.messages, engine=engine)
+        
+        # Persist everything with a single bulk insert
+        response_time_ms = int((time.time() - start) * 1000 / len(results))
+        await chat_writer.save(
+            db=db,
+            session_id=session_id,
+            messages=request.messages,
+            results=results,
+            response_time_ms=response_time_ms,
+            new_session=new_session,
+            rules_hash=rules_hash,
+            tenant=tenant
+        )
+        if not new_session:
+            session_registry.touch(session_id)
+        
+        return BatchChatResponse(
+            session_id=session_id,
+            results=[
+                BatchChatItem(
+                    response=result['response'],
+                    intent=result['intent'],
+                    sentiment=result['sentiment'],
+                    confidence=result['confidence'],
+                    alternates=result['alternates']
+                )
+                for result in results
+            ],
+            total=len(results)
+        )
+        
+    except Exception as e:
+        logger.error(f"Error in batch chat endpoint: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred while processing your messages"
+        )
+
+
 @router.post("/session", response_model=SessionResponse, status_code=status.HTTP_201_CREATED)
 async def create_session(db: AsyncSession = Depends(get_db)):
     """
@@ -108,6 +371,7 @@ async def create_session(db: AsyncSession = Depends(get_db)):
     """
     try:
         session_id = await ConversationService.create_session(db)
+        session_registry.register(session_id)
         return SessionResponse(session_id=session_id)
     except Exception as e:
         logger.error(f"Error creating session: {e}")
@@ -120,33 +384,92 @@ async def create_session(db: AsyncSession = Depends(get_db)):
 @router.get("/history/{session_id}", response_model=ConversationHistoryResponse)
 async def get_history(
     session_id: str,
-    limit: int = 50,
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(50, ge=1, le=1000),
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    latest: bool = False,
+    include_archived: bool = False,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Get conversation history for a session
+    Get one page of conversation history for a session
+    
+    Without a cursor the oldest page is returned (the newest with latest=true).
+    Page forward with the returned next_cursor as `after` and backward with
+    prev_cursor as `before`.
     
     Args:
         session_id: Conversation session ID
         limit: Maximum number of messages to retrieve
+        after: Return messages following this cursor
+        before: Return messages preceding this cursor
+        latest: Start from the newest messages
+        include_archived: Also return messages moved to the archive
         db: Database session
         
     Returns:
-        ConversationHistoryResponse with message history
+        ConversationHistoryResponse with message history and page cursors
     """
     try:
-        messages = await ConversationService.get_conversation_history(db, session_id, limit)
-        return ConversationHistoryResponse(
-            session_id=session_id,
-            messages=messages,
-            total_messages=len(messages)
-        )
+        page = None
+        if not include_archived:
+            page = history_buffer.page(session_id, limit, after=after, before=before, latest=latest)
+        if page is None:
+            generation = history_buffer.generation()
+            page = await ConversationService.get_history_page(
+                db, session_id, limit, after=after, before=before, latest=latest,
+                archive=message_archive if include_archived else None
+            )
+            # A page without neighbours is the whole session: keep it for the next request
+            if not include_archived and not (after or before or page['prev_cursor'] or page['next_cursor']):
+                history_buffer.seed(session_id, page['messages'], generation)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching history: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve conversation history"
         )
+    
+    return ConversationHistoryResponse(
+        session_id=session_id,
+        messages=page['messages'],
+        total_messages=len(page['messages']),
+        prev_cursor=page['prev_cursor'],
+        next_cursor=page['next_cursor']
+    )
+
+
+@router.get("/history/{session_id}/export")
+async def export_history(session_id: str, include_archived: bool = False):
+    """
+    Stream a session's whole history as NDJSON (one message object per line)
+    
+    Args:
+        session_id: Conversation session ID
+        include_archived: Start with the messages moved to the archive
+        
+    Returns:
+        StreamingResponse of application/x-ndjson
+    """
+    async def lines():
+        # The session lives inside the generator: the response outlives the endpoint call
+        async with AsyncReadSessionLocal() as db:
+            try:
+                async for message in ConversationService.iter_conversation_history(
+                    db, session_id, archive=message_archive if include_archived else None
+                ):
+                    yield json.dumps(message, ensure_ascii=False) + "\n"
+            except Exception as e:
+                logger.error(f"Error exporting history: {e}")
+                raise
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="history.ndjson"'}
+    )
 
 
 @router.delete("/history/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -155,14 +478,15 @@ async def clear_history(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Clear conversation history for a session
+    Clear conversation history and analytics for a session, archived rows included
     
     Args:
         session_id: Conversation session ID
         db: Database session
     """
     try:
-        await ConversationService.clear_session(db, session_id)
+        await ConversationService.clear_session(db, session_id, archive=message_archive)
+        history_buffer.clear(session_id)
     except Exception as e:
         logger.error(f"Error clearing history: {e}")
         raise HTTPException(
@@ -171,10 +495,53 @@ async def clear_history(
         )
 
 
+@router.get("/dashboard", response_model=AnalyticsDashboardResponse)
+async def get_dashboard(
+    granularity: str = Query('hour', description="Bucket size: 'minute' or 'hour'"),
+    start: Optional[datetime] = Query(None, description="Range start (defaults to 60 buckets before end)"),
+    end: Optional[datetime] = Query(None, description="Range end, exclusive (defaults to now)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Get analytics across all sessions per minute or hour
+    
+    Args:
+        granularity: Bucket size
+        start: Range start (UTC unless it carries an offset)
+        end: Range end (UTC unless it carries an offset)
+        db: Database session
+        
+    Returns:
+        AnalyticsDashboardResponse with per-bucket counts, fallback rate and latency histogram
+    """
+    def utc(value: datetime) -> datetime:
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    
+    end = utc(end) if end else datetime.utcnow()
+    if start:
+        start = utc(start)
+    elif granularity in ANALYTICS_GRANULARITIES:
+        start = end - 60 * ANALYTICS_GRANULARITIES[granularity]
+    else:
+        start = end
+    
+    try:
+        dashboard = await ConversationService.get_analytics_buckets(db, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching dashboard analytics: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve dashboard analytics"
+        )
+    return AnalyticsDashboardResponse(start=start, end=end, **dashboard)
+
+
 @router.get("/analytics/{session_id}", response_model=AnalyticsResponse)
 async def get_analytics(
     session_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get analytics for a session
@@ -201,15 +568,19 @@ async def get_analytics(
 
 
 @router.get("/intents", response_model=IntentsResponse)
-async def get_intents():
+async def get_intents(http_request: Request):
     """
     Get list of available intents
     
+    Args:
+        http_request: Incoming request (for the tenant header)
+        
     Returns:
         IntentsResponse with all available intents
     """
+    engine, _ = await resolve_engine(http_request)
     try:
-        intents = rule_engine.get_available_intents()
+        intents = engine.get_available_intents()
         return IntentsResponse(
             intents=intents,
             total=len(intents)
@@ -223,22 +594,111 @@ async def get_intents():
 
 
 @router.post("/reload-rules", status_code=status.HTTP_200_OK)
-async def reload_rules():
+async def reload_rules(http_request: Request):
     """
     Reload chatbot rules from configuration file
     
+    With a tenant header only that tenant's rules are reloaded; other
+    tenants' compiled rules are left untouched.
+    
+    Args:
+        http_request: Incoming request (for the tenant header)
+        
     Returns:
         Success message
     """
+    tenant = http_request.headers.get(settings.TENANT_HEADER) if tenant_registry else None
     try:
-        rule_engine.reload_rules()
-        return {"message": "Rules reloaded successfully", "timestamp": datetime.utcnow()}
+        # Build the new snapshot in a worker thread so the event loop keeps serving chats
+        if tenant:
+            reloaded = await run_in_threadpool(tenant_registry.reload, tenant)
+        else:
+            reloaded = await run_in_threadpool(rule_engine.reload_rules)
+    except UnknownTenantError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown tenant '{tenant}'"
+        )
     except Exception as e:
         logger.error(f"Error reloading rules: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to reload rules"
         )
+    
+    if not reloaded:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Rules file is invalid; previous rules are still active"
+        )
+    if tenant:
+        loaded = tenant_registry.is_loaded(tenant)
+        if loaded:
+            await register_rules(tenant_registry.get(tenant))
+        return {
+            "message": f"Rules reloaded successfully for tenant '{tenant}'",
+            "version": tenant_registry.get(tenant).snapshot.version if loaded else None,
+            "timestamp": datetime.utcnow()
+        }
+    await register_rules(rule_engine)
+    return {
+        "message": "Rules reloaded successfully",
+        "version": rule_engine.snapshot.version,
+        "timestamp": datetime.utcnow()
+    }
+
+
+@router.get("/rules/diagnostics", response_model=RuleDiagnosticsResponse)
+async def get_rule_diagnostics(http_request: Request):
+    """
+    Report patterns prone to catastrophic backtracking and match time budget violations
+    
+    Args:
+        http_request: Incoming request (for the tenant header)
+        
+    Returns:
+        RuleDiagnosticsResponse for the currently loaded rules
+    """
+    engine, _ = await resolve_engine(http_request)
+    try:
+        return RuleDiagnosticsResponse(
+            version=engine.snapshot.version,
+            redos_policy=engine.redos_policy,
+            match_time_budget_ms=engine.match_time_budget_ms,
+            redos_risks=engine.get_redos_risks(),
+            budget_violations=[
+                {**entry, 'last_seen': datetime.utcfromtimestamp(entry['last_seen'])}
+                for entry in engine.get_budget_violations()
+            ]
+        )
+    except Exception as e:
+        logger.error(f"Error fetching rule diagnostics: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve rule diagnostics"
+        )
+
+
+@router.get("/engine/stats")
+async def get_engine_stats():
+    """
+    Rule execution pool and result cache statistics
+    
+    Returns:
+        Execution mode, queue depth, wait/run time percentiles, cache stats,
+        persistence queue, rule catalog and loaded tenant rule sets
+    """
+    return {
+        "execution": rule_executor.stats(),
+        "persistence": chat_writer.stats(),
+        "archive": archive_job.stats(),
+        "sessions": session_registry.stats(),
+        "history_buffer": history_buffer.stats(),
+        "rule_catalog": rule_catalog.stats(),
+        "result_cache": rule_executor.cache_stats(rule_engine),
+        "rules_version": rule_engine.snapshot.version,
+        "tenants": tenant_registry.stats() if tenant_registry else None
+    }
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -246,14 +706,18 @@ async def health_check():
     """
     Health check endpoint
     
+    Reports "degraded" while write-behind persistence has recently lost turns.
+    
     Returns:
         HealthResponse with system status
     """
     uptime = time.time() - start_time
+    persistence = chat_writer.health()
     return HealthResponse(
-        status="healthy",
+        status="healthy" if persistence['healthy'] else "degraded",
         version=settings.APP_VERSION,
         uptime=round(uptime, 2),
         database="connected",
-        rules_loaded=len(rule_engine.intents)
+        rules_loaded=len(rule_engine.intents),
+        persistence=persistence
     )
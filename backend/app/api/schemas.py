@@ -1,8 +1,8 @@
 """
 API Request and Response Schemas
 """
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Optional, List, Dict
 from datetime import datetime
 
 
@@ -12,6 +12,13 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Session ID for conversation tracking")
 
 
+class IntentCandidate(BaseModel):
+    """A runner-up intent from ranked scoring"""
+    intent: str
+    confidence: float
+    matched_pattern: Optional[str] = None
+
+
 class ChatResponse(BaseModel):
     """Response schema for chat endpoint"""
     response: str = Field(..., description="Bot response")
@@ -19,6 +26,41 @@ class ChatResponse(BaseModel):
     intent: Optional[str] = Field(None, description="Detected intent")
     sentiment: Optional[str] = Field(None, description="Detected sentiment")
     confidence: float = Field(..., description="Response confidence score")
+    alternates: List[IntentCandidate] = Field(
+        default_factory=list,
+        description="Other matching intents, best first (ranked scoring only)"
+    )
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BatchChatRequest(BaseModel):
+    """Request schema for batch chat endpoint"""
+    messages: List[str] = Field(..., min_length=1, max_length=1000, description="User messages")
+    session_id: Optional[str] = Field(None, description="Session ID the messages are recorded under")
+
+    @field_validator('messages')
+    @classmethod
+    def validate_message_lengths(cls, messages: List[str]) -> List[str]:
+        for message in messages:
+            if not 1 <= len(message) <= 1000:
+                raise ValueError("each message must be between 1 and 1000 characters")
+        return messages
+
+
+class BatchChatItem(BaseModel):
+    """Classification result for one message of a batch"""
+    response: str = Field(..., description="Bot response")
+    intent: Optional[str] = Field(None, description="Detected intent")
+    sentiment: Optional[str] = Field(None, description="Detected sentiment")
+    confidence: float = Field(..., description="Response confidence score")
+    alternates: List[IntentCandidate] = Field(default_factory=list, description="Other matching intents")
+
+
+class BatchChatResponse(BaseModel):
+    """Response schema for batch chat endpoint"""
+    session_id: str = Field(..., description="Session ID")
+    results: List[BatchChatItem] = Field(..., description="Results in request order")
+    total: int
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -48,6 +90,8 @@ class ConversationHistoryResponse(BaseModel):
     session_id: str
     messages: List[MessageHistory]
     total_messages: int
+    prev_cursor: Optional[str] = Field(None, description="Pass as 'before' to get the previous (older) page")
+    next_cursor: Optional[str] = Field(None, description="Pass as 'after' to get the next (newer) page")
 
 
 class AnalyticsResponse(BaseModel):
@@ -55,15 +99,62 @@ class AnalyticsResponse(BaseModel):
     session_id: str
     total_interactions: int
     avg_response_time_ms: float
+    max_response_time_ms: int = 0
     intent_distribution: Dict[str, int]
 
 
+class AnalyticsBucketSummary(BaseModel):
+    """Global analytics for one time bucket (or a whole range)"""
+    start: Optional[str] = Field(None, description="Bucket start (UTC); absent for range totals")
+    interactions: int
+    fallbacks: int
+    fallback_rate: float
+    avg_response_time_ms: float
+    intents: Dict[str, int]
+    latency_ms: Dict[str, int] = Field(..., description="Interactions per response time upper bound (ms)")
+
+
+class AnalyticsDashboardResponse(BaseModel):
+    """Response schema for cross-session analytics over a time range"""
+    granularity: str
+    start: datetime
+    end: datetime
+    latency_buckets_ms: List[str]
+    buckets: List[AnalyticsBucketSummary] = Field(..., description="Non-empty buckets in time order")
+    totals: AnalyticsBucketSummary
+
+
 class IntentsResponse(BaseModel):
     """Response schema for available intents"""
     intents: List[str]
     total: int
 
 
+class PatternRisk(BaseModel):
+    """A pattern flagged as prone to catastrophic backtracking"""
+    intent: str
+    pattern: str
+    risks: List[str]
+
+
+class BudgetViolation(BaseModel):
+    """Match time budget violations attributed to one pattern"""
+    intent: Optional[str] = None
+    pattern: Optional[str] = None
+    count: int
+    max_ms: float
+    last_seen: datetime
+
+
+class RuleDiagnosticsResponse(BaseModel):
+    """Response schema for rule safety diagnostics"""
+    version: int
+    redos_policy: str
+    match_time_budget_ms: float
+    redos_risks: List[PatternRisk]
+    budget_violations: List[BudgetViolation]
+
+
 class HealthResponse(BaseModel):
     """Response schema for health check"""
     status: str
@@ -71,3 +162,5 @@ class HealthResponse(BaseModel):
     uptime: float
     database: str
     rules_loaded: int
+    # Write-behind persistence: healthy, failed_turns, last_failure, last_error
+    persistence: Optional[Dict[str, Any]] = None
@@ -0,0 +1,125 @@
+"""
+Command Line Maintenance Tasks
+
+Usage:
+    python -m app.cli rescore-sentiment [--session-id ID] [--batch-size N]
+    python -m app.cli backfill-analytics [--session-id ID] [--batch-size N]
+    python -m app.cli archive [--older-than-days N] [--batch-size N]
+    python -m app.cli compact-db
+"""
+import argparse
+import asyncio
+import logging
+from app.core.config import settings
+from app.core.database import AsyncReadSessionLocal, AsyncSessionLocal, _drop_legacy_columns, engine, init_db
+from app.core.rule_engine import RuleEngine
+from app.services.archive import ArchiveJob, ArchiveStore
+from app.services.conversation_service import ConversationService
+
+logger = logging.getLogger(__name__)
+
+
+async def rescore_sentiment(args: argparse.Namespace):
+    """Re-score stored fallback replies with the rules file's sentiment lexicon"""
+    rule_engine = RuleEngine(settings.RULES_FILE)
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        count = await ConversationService.rescore_sentiment(
+            db,
+            rule_engine.snapshot.sentiment,
+            session_id=args.session_id,
+            batch_size=args.batch_size
+        )
+    print(f"Re-scored {count} messages")
+
+
+async def backfill_analytics(args: argparse.Namespace):
+    """Rebuild the per-session rollups and global time buckets from stored and archived analytics rows"""
+    await init_db()
+    archive_store = ArchiveStore(settings.ARCHIVE_DIR)
+    async with AsyncSessionLocal() as db:
+        try:
+            count = await ConversationService.rebuild_analytics_rollups(
+                db, session_id=args.session_id, archive=archive_store
+            )
+            print(f"Wrote {count} analytics rollups")
+            if args.session_id is None:
+                count = await ConversationService.rebuild_analytics_buckets(
+                    db, batch_size=args.batch_size, archive=archive_store
+                )
+                print(f"Counted {count} analytics rows into time buckets")
+        except ValueError as e:
+            raise SystemExit(f"Backfill refused: {e} (is ARCHIVE_DIR={settings.ARCHIVE_DIR} right?)")
+
+
+async def archive(args: argparse.Namespace):
+    """Move old messages and analytics to the archive once"""
+    await init_db()
+    job = ArchiveJob(
+        AsyncSessionLocal,
+        ArchiveStore(settings.ARCHIVE_DIR),
+        max_age_days=args.older_than_days,
+        batch_size=args.batch_size,
+        read_session_factory=AsyncReadSessionLocal
+    )
+    moved = await job.run_once()
+    print(f"Archived {moved['messages']} messages and {moved['analytics']} analytics rows")
+
+
+async def compact_db(args: argparse.Namespace):
+    """Drop the legacy string columns left after the dictionary ID migration and return the freed space"""
+    await init_db()
+    async with engine.begin() as conn:
+        await conn.run_sync(_drop_legacy_columns)
+    if engine.dialect.name != 'sqlite':
+        print("Legacy columns dropped; reclaim space with your database's own tools")
+        return
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        await conn.exec_driver_sql("VACUUM")
+    print("Legacy columns dropped and database vacuumed")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for all maintenance commands"""
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Chatbot maintenance tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rescore = commands.add_parser("rescore-sentiment", help="Re-score sentiment of stored fallback replies")
+    rescore.add_argument("--session-id", default=None, help="Only re-score one session")
+    rescore.add_argument("--batch-size", type=int, default=1000, help="Rows per transaction")
+    rescore.set_defaults(handler=rescore_sentiment)
+
+    backfill = commands.add_parser("backfill-analytics", help="Rebuild analytics rollups from stored analytics")
+    backfill.add_argument("--session-id", default=None, help="Only rebuild one session's rollups")
+    backfill.add_argument("--batch-size", type=int, default=10000, help="Rows read per query for time buckets")
+    backfill.set_defaults(handler=backfill_analytics)
+
+    archiving = commands.add_parser("archive", help="Move old messages and analytics to the archive")
+    archiving.add_argument(
+        "--older-than-days",
+        type=float,
+        default=settings.ARCHIVE_AFTER_DAYS or None,
+        required=not settings.ARCHIVE_AFTER_DAYS,
+        help="Age of archived rows (defaults to ARCHIVE_AFTER_DAYS when set)"
+    )
+    archiving.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE, help="Rows per transaction")
+    archiving.set_defaults(handler=archive)
+
+    compacting = commands.add_parser("compact-db", help="Drop legacy string columns and vacuum the database (not reversible)")
+    compacting.set_defaults(handler=compact_db)
+
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    args = build_parser().parse_args(argv)
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -29,12 +29,131 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./chatbot.db"
     
+    # SQLite storage profile (file databases only): one serialized writer
+    # connection plus DB_READ_POOL_SIZE read-only connections for history and
+    # analytics, with the pragmas below applied to every connection
+    SQLITE_STORAGE_PROFILE: bool = True
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    # NORMAL is durable in WAL mode except for the last commits on power loss
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE_MB: int = 256
+    DB_READ_POOL_SIZE: int = 4
+    
+    # Archival (off by default): a background job moves messages and analytics
+    # older than ARCHIVE_AFTER_DAYS (0 disables) out of the database into
+    # gzip-compressed per-day segment files under ARCHIVE_DIR, every
+    # ARCHIVE_INTERVAL_S seconds. ARCHIVE_DIR must be persistent storage.
+    ARCHIVE_DIR: str = "./archive"
+    ARCHIVE_AFTER_DAYS: int = 0
+    ARCHIVE_INTERVAL_S: float = 3600
+    # Rows moved per transaction
+    ARCHIVE_BATCH_SIZE: int = 5000
+    
     # Logging
     LOG_LEVEL: str = "INFO"
     
     # Rules file
     RULES_FILE: str = os.path.join(os.path.dirname(__file__), "../../../rules/chatbot_rules.yaml")
     
+    # Intent matching engine: "loop" (one regex per pattern) or "combined" (single-pass regex)
+    MATCH_STRATEGY: str = "loop"
+    # Skip patterns whose required literal substrings are absent from the message
+    MATCH_PREFILTER: bool = True
+    # Number of normalized messages whose classification is cached (0 disables)
+    RESULT_CACHE_SIZE: int = 4096
+    
+    # Cache the parsed, validated and analyzed rules to speed up startup, in
+    # RULES_ARTIFACT_DIR ($XDG_CACHE_HOME/chatbot/rules or ~/.cache/chatbot/rules
+    # when empty; RULES_FILE's directory may be read-only)
+    RULES_ARTIFACT_CACHE: bool = True
+    RULES_ARTIFACT_DIR: str = ""
+    
+    # Hot reload: poll RULES_FILE and reload it when it changes
+    RULES_WATCH: bool = False
+    RULES_WATCH_INTERVAL: float = 2.0
+    
+    # ReDoS protection: per-message matching budget in ms of CPU time, so a busy
+    # host does not push normal messages to the fallback (0 disables), and what
+    # to do with risky patterns at load time ("warn" or "reject")
+    MATCH_TIME_BUDGET_MS: float = 50.0
+    REDOS_POLICY: str = "warn"
+    
+    # Intent scoring: "first" (first match wins) or "ranked" (score all matches
+    # by coverage, specificity and priority and return the top INTENT_TOP_K)
+    INTENT_SCORING: str = "first"
+    INTENT_TOP_K: int = 3
+    
+    # Try frequently matched intents first within groups of consecutive intents
+    # sharing a `priority` value (loop matcher only)
+    ADAPTIVE_ORDER: bool = False
+    REORDER_INTERVAL: int = 1000
+    
+    # When no pattern matches, answer with the intent whose keywords the message
+    # most likely misspells ("helo", "thnaks"), at reduced confidence. Keywords
+    # of 8+ letters tolerate up to FUZZY_MAX_DISTANCE edits, 5-7 letters one,
+    # shorter ones none. Tokens that are real words ("hell") are never corrected:
+    # the words of the rules file's responses and `known_words`, plus those of
+    # FUZZY_VOCABULARY_FILE (one word per line, e.g. /usr/share/dict/words or a
+    # word frequency list) when set.
+    FUZZY_FALLBACK: bool = False
+    FUZZY_MAX_DISTANCE: int = 2
+    FUZZY_VOCABULARY_FILE: str = ""
+    
+    # Where rule matching runs: "inline" (event loop), "thread" or "process" pool
+    EXECUTION_MODE: str = "inline"
+    # Pool size for thread/process modes (0 uses the number of CPUs)
+    EXECUTION_WORKERS: int = 0
+    
+    # Chat persistence: "sync" saves each request in one transaction before
+    # responding; "write_behind" (opt-in) queues turns and group-commits them in
+    # bulk (faster, but reads lag writes and queued turns are lost if the process dies)
+    PERSISTENCE_MODE: str = "sync"
+    # Commit once this many turns are queued or the oldest waited WRITE_FLUSH_INTERVAL_MS
+    WRITE_BATCH_SIZE: int = 500
+    WRITE_FLUSH_INTERVAL_MS: float = 50
+    # Queued turns before requests wait for the writer
+    WRITE_QUEUE_SIZE: int = 10000
+    # Extra attempts for a failed write-behind commit before turns are written one by one
+    WRITE_RETRIES: int = 2
+    
+    # Session registry: reject chat requests for unknown session IDs (404),
+    # checked against an LRU of SESSION_CACHE_SIZE recent sessions and a Bloom
+    # filter of all session IDs loaded at startup
+    SESSION_VALIDATION: bool = True
+    SESSION_CACHE_SIZE: int = 100000
+    SESSION_FILTER_CAPACITY: int = 1000000
+    SESSION_FILTER_ERROR_RATE: float = 0.01
+    # Each process has its own filter, so by default IDs the filter hasn't seen
+    # are confirmed in the database; True skips that query, safe only with one worker process
+    SESSION_FILTER_AUTHORITATIVE: bool = False
+    # Session updated_at/is_active are written in batches every SESSION_TOUCH_INTERVAL_S;
+    # sessions idle for SESSION_IDLE_MINUTES are marked inactive (0 never)
+    SESSION_TOUCH_INTERVAL_S: float = 5
+    SESSION_IDLE_MINUTES: float = 30
+    
+    # Recent messages kept in memory per session to serve /history without a
+    # query (0 disables), within an estimated HISTORY_BUFFER_MEMORY_MB overall.
+    # Only this process's writes are seen: disable with several worker processes.
+    HISTORY_BUFFER_SIZE: int = 200
+    HISTORY_BUFFER_MEMORY_MB: float = 64
+    
+    # Multi-tenant rule sets: directory of <tenant>.yaml files (empty disables).
+    # The tenant is taken from TENANT_HEADER or from the tenant the session was
+    # started with; requests without one use RULES_FILE.
+    TENANTS_DIR: str = ""
+    TENANT_HEADER: str = "X-Tenant"
+    # Estimated memory cap for loaded tenant rule sets; least recently used are evicted
+    TENANT_MEMORY_MB: float = 256
+    
+    # Prometheus-style /metrics endpoint
+    METRICS_ENABLED: bool = True
+    # Shared directory where each worker process publishes its metrics so any
+    # worker can serve the aggregate (empty: this process only). Clear it on deploy.
+    METRICS_DIR: str = ""
+    METRICS_FLUSH_INTERVAL: float = 1.0
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,22 +1,102 @@
 """
 Database Configuration and Session Management
 """
+import sqlite3
+from datetime import datetime
+from sqlalchemy import event, inspect, insert, select, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
-from app.models.conversation import Base
+from app.models.conversation import Base, IntentName, RulePattern, RuleVersion, SentimentLabel, pattern_hash
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    future=True
-)
+SQLITE_JOURNAL_MODES = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY')
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _sqlite_file(url: str):
+    """Database file path of a file-backed SQLite URL, or None"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != 'sqlite':
+        return None
+    database = parsed.database or ''
+    if not database or database == ':memory:' or database.startswith('file:'):
+        return None
+    return database
+
+
+def _sqlite_pragmas(read_only: bool):
+    """Connect hook applying the SQLite storage profile to every new connection"""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            # The journal mode is stored in the database file; readers inherit it
+            cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        # Negative cache_size is in KiB
+        cursor.execute(f"PRAGMA cache_size={-int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_MB) * 1024 * 1024}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return on_connect
+
+
+def _create_engines():
+    """
+    Create the write and read engines
 
-# Create async session factory
+    File-backed SQLite gets the storage profile: a single writer connection,
+    so writes queue in the pool instead of failing with "database is locked",
+    and a pool of read-only connections that, under WAL, read concurrently
+    with the writer. Other databases share one engine for reads and writes.
+    """
+    path = _sqlite_file(settings.DATABASE_URL)
+    if path is None or not settings.SQLITE_STORAGE_PROFILE:
+        shared = create_async_engine(settings.DATABASE_URL, echo=settings.DEBUG, future=True)
+        return shared, shared
+
+    if settings.SQLITE_JOURNAL_MODE.upper() not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Unknown SQLITE_JOURNAL_MODE '{settings.SQLITE_JOURNAL_MODE}'")
+    if settings.SQLITE_SYNCHRONOUS.upper() not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"Unknown SQLITE_SYNCHRONOUS '{settings.SQLITE_SYNCHRONOUS}'")
+
+    connect_args = {'timeout': settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    writer = create_async_engine(
+        settings.DATABASE_URL,
+        echo=settings.DEBUG,
+        future=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        connect_args=connect_args
+    )
+    event.listen(writer.sync_engine, 'connect', _sqlite_pragmas(read_only=False))
+
+    url = make_url(settings.DATABASE_URL)
+    read_url = url.set(database=f"file:{path}", query={**url.query, 'mode': 'ro', 'uri': 'true'})
+    reader = create_async_engine(
+        read_url,
+        echo=settings.DEBUG,
+        future=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_READ_POOL_SIZE,
+        max_overflow=0,
+        connect_args=connect_args
+    )
+    event.listen(reader.sync_engine, 'connect', _sqlite_pragmas(read_only=True))
+    return writer, reader
+
+
+# Create async engines (the same engine unless the SQLite storage profile applies)
+engine, read_engine = _create_engines()
+
+# Create async session factories
 AsyncSessionLocal = sessionmaker(
     engine,
     class_=AsyncSession,
@@ -25,18 +105,224 @@ AsyncSessionLocal = sessionmaker(
     autoflush=False
 )
 
+AsyncReadSessionLocal = sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
+
+def _create_missing_indexes(connection):
+    """Add indexes introduced after a table was created (create_all skips existing tables)"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+# Columns added to tables created before them (create_all skips existing tables)
+_ADDED_COLUMNS = {
+    'conversations': ('tenant VARCHAR(64)',)
+}
+
+
+def _create_missing_columns(connection):
+    """Add the columns of _ADDED_COLUMNS missing from existing tables"""
+    inspector = inspect(connection)
+    for table, definitions in _ADDED_COLUMNS.items():
+        if not inspector.has_table(table):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        for definition in definitions:
+            if definition.split()[0] not in existing:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {definition}"))
+
+
+# Dictionary ID columns added to tables created before dictionary encoding
+_DICTIONARY_COLUMNS = {
+    'messages': ('intent_id INTEGER', 'sentiment_id SMALLINT'),
+    'analytics': ('intent_id INTEGER', 'pattern_id INTEGER', 'rule_version_id INTEGER')
+}
+
+# String columns those tables stored instead
+_LEGACY_COLUMNS = {
+    'messages': ('intent', 'sentiment'),
+    'analytics': ('intent', 'matched_pattern')
+}
+
+# Dictionary ID column each string column is migrated to
+_LEGACY_TARGETS = {
+    ('messages', 'intent'): 'intent_id',
+    ('messages', 'sentiment'): 'sentiment_id',
+    ('analytics', 'intent'): 'intent_id',
+    ('analytics', 'matched_pattern'): 'pattern_id'
+}
+
+
+def _add_dictionary_values(connection, model, values):
+    """Insert the dictionary rows missing for a set of values"""
+    existing = {row[0] for row in connection.execute(select(model.name))}
+    missing = sorted(set(values) - existing)
+    if missing:
+        connection.execute(insert(model), [{'name': name} for name in missing])
+
+
+def _legacy_columns(connection):
+    """Return the legacy string columns still present, per table"""
+    inspector = inspect(connection)
+    legacy = {}
+    for table, names in _LEGACY_COLUMNS.items():
+        if inspector.has_table(table):
+            existing = {column['name'] for column in inspector.get_columns(table)}
+            legacy[table] = [name for name in names if name in existing]
+    return legacy
+
+
+def _unmigrated(table, name):
+    """SQL condition for rows whose string value has not been moved to its ID yet"""
+    return f"({name} IS NOT NULL AND {_LEGACY_TARGETS[(table, name)]} IS NULL)"
+
+
+def _migrate_dictionary_columns(connection):
+    """
+    Move messages and analytics stored with intent, sentiment and pattern
+    strings to dictionary IDs
+
+    The ID columns are added, the dictionaries are filled from the distinct
+    stored values (patterns under a 'legacy' rules version) and the rows
+    whose ID is still empty are rewritten. The migration is additive: the
+    string columns are kept so the previous release can still read the rows
+    it wrote, and are only dropped by _drop_legacy_columns
+    (python -m app.cli compact-db).
+    """
+    inspector = inspect(connection)
+    columns = {
+        table: {column['name'] for column in inspector.get_columns(table)}
+        for table in _LEGACY_COLUMNS if inspector.has_table(table)
+    }
+    legacy = _legacy_columns(connection)
+    if not any(legacy.values()):
+        return
+
+    for table, definitions in _DICTIONARY_COLUMNS.items():
+        for definition in definitions:
+            if table in columns and definition.split()[0] not in columns[table]:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {definition}"))
+
+    intents, sentiments, patterns = set(), set(), set()
+    if 'intent' in legacy.get('messages', ()):
+        intents.update(row[0] for row in connection.execute(text(
+            f"SELECT DISTINCT intent FROM messages WHERE {_unmigrated('messages', 'intent')}"
+        )))
+    if 'sentiment' in legacy.get('messages', ()):
+        sentiments.update(row[0] for row in connection.execute(text(
+            f"SELECT DISTINCT sentiment FROM messages WHERE {_unmigrated('messages', 'sentiment')}"
+        )))
+    if 'intent' in legacy.get('analytics', ()):
+        intents.update(row[0] for row in connection.execute(text(
+            f"SELECT DISTINCT intent FROM analytics WHERE {_unmigrated('analytics', 'intent')}"
+        )))
+    if 'matched_pattern' in legacy.get('analytics', ()):
+        intent = "COALESCE(intent, 'unknown')" if 'intent' in legacy['analytics'] else "'unknown'"
+        patterns.update(tuple(row) for row in connection.execute(text(
+            f"SELECT DISTINCT {intent}, matched_pattern FROM analytics "
+            f"WHERE {_unmigrated('analytics', 'matched_pattern')}"
+        )))
+        intents.update(intent for intent, _ in patterns)
+    _add_dictionary_values(connection, IntentName, intents)
+    _add_dictionary_values(connection, SentimentLabel, sentiments)
+
+    if patterns:
+        version_id = connection.execute(
+            select(RuleVersion.id).where(RuleVersion.source_hash == 'legacy')
+        ).scalar()
+        if version_id is None:
+            version_id = connection.execute(
+                insert(RuleVersion).values(source_hash='legacy', created_at=datetime.utcnow())
+            ).inserted_primary_key[0]
+        intent_ids = dict(connection.execute(select(IntentName.name, IntentName.id)).all())
+        existing = {tuple(row) for row in connection.execute(select(RulePattern.intent_id, RulePattern.source_hash))}
+        rows = [
+            {'intent_id': intent_ids[intent], 'source_hash': pattern_hash(source), 'source': source, 'version_id': version_id}
+            for intent, source in sorted(patterns)
+        ]
+        rows = [row for row in rows if (row['intent_id'], row['source_hash']) not in existing]
+        if rows:
+            connection.execute(insert(RulePattern), rows)
+        # Legacy rows have no rules version of their own
+        connection.execute(text(
+            "UPDATE analytics SET rule_version_id = :version_id "
+            f"WHERE rule_version_id IS NULL AND {_unmigrated('analytics', 'matched_pattern')}"
+        ), {'version_id': version_id})
+
+    assignments = {
+        ('messages', 'intent'): "intent_id = (SELECT id FROM intent_names WHERE name = messages.intent)",
+        ('messages', 'sentiment'): "sentiment_id = (SELECT id FROM sentiment_labels WHERE name = messages.sentiment)",
+        ('analytics', 'intent'): "intent_id = (SELECT id FROM intent_names WHERE name = analytics.intent)",
+        ('analytics', 'matched_pattern'): (
+            "pattern_id = (SELECT p.id FROM rule_patterns p JOIN intent_names i ON i.id = p.intent_id "
+            "WHERE i.name = COALESCE(analytics.intent, 'unknown') AND p.source = analytics.matched_pattern)"
+            if 'intent' in legacy.get('analytics', ()) else
+            "pattern_id = (SELECT p.id FROM rule_patterns p JOIN intent_names i ON i.id = p.intent_id "
+            "WHERE i.name = 'unknown' AND p.source = analytics.matched_pattern)"
+        )
+    }
+    for table, names in legacy.items():
+        if not names:
+            continue
+        for name in names:
+            result = connection.execute(text(
+                f"UPDATE {table} SET {assignments[(table, name)]} WHERE {_unmigrated(table, name)}"
+            ))
+            if result.rowcount:
+                logger.info(f"Moved {result.rowcount} {table}.{name} values to dictionary IDs")
+
+
+def _drop_legacy_columns(connection):
+    """
+    Drop the string columns left by _migrate_dictionary_columns
+
+    Any rows not yet migrated are moved first. SQLite older than 3.35 cannot
+    drop columns, so they are emptied instead. This cannot be undone: the
+    previous release reads intents and sentiments from these columns.
+    """
+    _migrate_dictionary_columns(connection)
+    for table, names in _legacy_columns(connection).items():
+        if not names:
+            continue
+        if connection.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 35, 0):
+            for name in names:
+                connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {name}"))
+        else:
+            pending = ' OR '.join(f"{name} IS NOT NULL" for name in names)
+            connection.execute(text(
+                f"UPDATE {table} SET {', '.join(f'{name} = NULL' for name in names)} WHERE {pending}"
+            ))
+        logger.info(f"Dropped legacy columns {', '.join(names)} from {table}")
+
 
 async def init_db():
     """Initialize database tables"""
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_create_missing_columns)
+            await conn.run_sync(_create_missing_indexes)
+            await conn.run_sync(_migrate_dictionary_columns)
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
 
 
+async def close_db():
+    """Close all pooled connections"""
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
 async def get_db():
     """Dependency for getting database session"""
     async with AsyncSessionLocal() as session:
@@ -44,3 +330,12 @@ async def get_db():
             yield session
         finally:
             await session.close()
+
+
+async def get_read_db():
+    """Dependency for getting a read-only database session (history, analytics)"""
+    async with AsyncReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
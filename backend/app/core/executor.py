@@ -0,0 +1,300 @@
+"""
+Rule Execution Pool
+Runs CPU-bound rule matching inline, on a thread pool or on a process pool
+so that expensive messages do not block the event loop
+"""
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_MODES = ('inline', 'thread', 'process')
+
+# Number of recent jobs kept for wait/run time percentiles
+_SAMPLE_WINDOW = 1024
+
+# Rule engines owned by a process pool worker, by rules file, least recently used first
+_worker_engines: 'OrderedDict[str, Any]' = OrderedDict()
+
+# Rule sets (e.g. tenants) a process pool worker keeps compiled
+_WORKER_MAX_ENGINES = 16
+
+# Parent rules hash each worker engine last reloaded to match, by rules file
+_worker_targets: Dict[str, str] = {}
+
+
+def _worker_engine(engine_kwargs: Dict):
+    """Get or compile the worker's private copy of a rule set"""
+    key = engine_kwargs['rules_file']
+    engine = _worker_engines.get(key)
+    if engine is None:
+        from app.core.rule_engine import RuleEngine
+        engine = _worker_engines[key] = RuleEngine(**engine_kwargs)
+        while len(_worker_engines) > _WORKER_MAX_ENGINES:
+            _worker_engines.popitem(last=False)
+    else:
+        _worker_engines.move_to_end(key)
+    return engine
+
+
+def _init_worker(engine_kwargs: Dict):
+    """Process pool initializer: compile a private copy of the default rules"""
+    _worker_engine(engine_kwargs)
+
+
+def _warm_up() -> bool:
+    """No-op job that forces a worker to start and compile its rules"""
+    return bool(_worker_engines)
+
+
+def _run_in_worker(method: str, engine_kwargs: Dict, source_hash: str, *args) -> Tuple[float, Any, Dict]:
+    """
+    Run an engine method in a process worker, first catching up with the parent's rules
+
+    The worker reloads once per new parent rules hash. If the file changed
+    again before the parent reloaded, the worker keeps what it loaded rather
+    than re-reading the file on every call until the parent catches up.
+
+    Returns:
+        Tuple of (start time, result, report of the call's result cache
+        lookups and budget violations for the parent to aggregate)
+    """
+    started = time.time()
+    key = engine_kwargs['rules_file']
+    engine = _worker_engine(engine_kwargs)
+    if engine.snapshot.source_hash != source_hash and _worker_targets.get(key) != source_hash:
+        _worker_targets[key] = source_hash
+        engine.reload_rules()
+
+    cache = engine.result_cache
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    result = getattr(engine, method)(*args)
+    report = {'pid': os.getpid(), 'violations': engine.drain_budget_violations(), 'cache': None}
+    if cache is not None:
+        report['cache'] = {'hits': cache.hits - hits, 'misses': cache.misses - misses, 'size': len(cache)}
+    return started, result, report
+
+
+def _run_timed(func: Callable, *args) -> Tuple[float, Any]:
+    """Run a callable in a pool thread and report when it started"""
+    return time.time(), func(*args)
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class RuleExecutor:
+    """
+    Dispatches rule engine calls according to the configured execution mode
+
+    - inline: run on the event loop (no overhead, but blocks it)
+    - thread: run on a thread pool sharing the engine and its result cache
+    - process: run on a process pool where each worker holds its own copy of
+      the compiled rules, so matching runs truly in parallel. Workers reload
+      their rules when the parent's rules content hash changes, and report
+      their result cache lookups and budget violations back with each call.
+    """
+
+    def __init__(self, engine, mode: str = 'inline', workers: int = 0):
+        """
+        Initialize the executor
+
+        Args:
+            engine: RuleEngine used directly (inline/thread) or as the source
+                of configuration and rules version (process)
+            mode: Execution mode ('inline', 'thread' or 'process')
+            workers: Pool size (0 uses the number of CPUs)
+        """
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{mode}', expected one of {list(EXECUTION_MODES)}")
+        self.engine = engine
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[Executor] = None
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._wait_ms: deque = deque(maxlen=_SAMPLE_WINDOW)
+        self._run_ms: deque = deque(maxlen=_SAMPLE_WINDOW)
+        # Result cache lookups reported by process workers, by rules file
+        self._worker_caches: Dict[str, Dict] = {}
+
+    def start(self):
+        """
+        Create the worker pool (done lazily on first use if not called)
+
+        In process mode this blocks until every worker has compiled its rules.
+        """
+        if self._pool is not None or self.mode == 'inline':
+            return
+        if self.mode == 'thread':
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rule-engine")
+        else:
+            # Spawned workers don't inherit the parent's event loop or threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.engine.constructor_kwargs(),)
+            )
+            # Spawn and initialize every worker now rather than on the first requests
+            wait([self._pool.submit(_warm_up) for _ in range(self.workers)])
+        logger.info(f"Started {self.mode} pool with {self.workers} workers for rule matching")
+
+    def shutdown(self):
+        """Stop the worker pool, waiting for running jobs"""
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+
+    async def process_message(self, message: str, engine=None) -> Dict:
+        """
+        Run RuleEngine.process_message according to the execution mode
+
+        Args:
+            message: Raw user message
+            engine: Rule engine to use, e.g. a tenant's (defaults to the executor's engine)
+        """
+        return await self._submit(engine or self.engine, 'process_message', message)
+
+    async def process_batch(self, messages: List[str], engine=None) -> List[Dict]:
+        """
+        Run RuleEngine.process_batch according to the execution mode
+
+        Args:
+            messages: Raw user messages
+            engine: Rule engine to use, e.g. a tenant's (defaults to the executor's engine)
+        """
+        return await self._submit(engine or self.engine, 'process_batch', messages)
+
+    async def _submit(self, engine, method: str, *args):
+        submitted = time.time()
+        self._submitted += 1
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        try:
+            if self.mode == 'inline':
+                started, result = submitted, getattr(engine, method)(*args)
+            elif self.mode == 'thread':
+                self.start()
+                loop = asyncio.get_running_loop()
+                started, result = await loop.run_in_executor(self._pool, _run_timed, getattr(engine, method), *args)
+            else:
+                self.start()
+                loop = asyncio.get_running_loop()
+                started, result, report = await loop.run_in_executor(
+                    self._pool, _run_in_worker, method, engine.constructor_kwargs(), engine.snapshot.source_hash, *args
+                )
+                self._merge_report(engine, report)
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+
+        finished = time.time()
+        wait_s = max(started - submitted, 0.0)
+        self._completed += 1
+        self._wait_ms.append(wait_s * 1000)
+        self._run_ms.append((finished - started) * 1000)
+        self._record_metrics(method, result, wait_s, finished - started)
+        return result
+
+    def _record_metrics(self, method: str, result, wait_s: float, run_s: float):
+        """Count results per intent and pattern and record stage latencies"""
+        # Recorded here rather than in the engine so process pool results are counted too
+        if method == 'process_batch':
+            metrics.observe('chatbot_stage_duration_seconds', run_s, ('rule_engine_batch',))
+            for item in result:
+                metrics.record_result(item)
+        else:
+            metrics.observe('chatbot_stage_duration_seconds', run_s, ('rule_engine',))
+            metrics.record_result(result)
+        if self.mode != 'inline':
+            metrics.observe('chatbot_stage_duration_seconds', wait_s, ('rule_engine_queue',))
+
+    def _merge_report(self, engine, report: Dict):
+        """Fold a process worker's cache lookups and budget violations into the parent's view"""
+        if report['violations']:
+            engine.merge_budget_violations(report['violations'])
+        cache = report['cache']
+        if cache is not None:
+            totals = self._worker_caches.setdefault(engine.rules_file, {'hits': 0, 'misses': 0, 'sizes': {}})
+            totals['hits'] += cache['hits']
+            totals['misses'] += cache['misses']
+            totals['sizes'][report['pid']] = cache['size']
+
+    def cache_stats(self, engine=None) -> Optional[Dict]:
+        """
+        Get the result cache statistics of an engine as used by this executor
+
+        In process mode each worker has its own cache: hits and misses are
+        summed over the workers' reports and the size over their caches.
+
+        Args:
+            engine: Rule engine (defaults to the executor's engine)
+
+        Returns:
+            Cache statistics dictionary, or None if caching is disabled
+        """
+        engine = engine or self.engine
+        if self.mode != 'process' or engine.result_cache is None:
+            return engine.get_cache_stats()
+        totals = self._worker_caches.get(engine.rules_file, {'hits': 0, 'misses': 0, 'sizes': {}})
+        lookups = totals['hits'] + totals['misses']
+        return {
+            'size': sum(totals['sizes'].values()),
+            'max_size': engine.result_cache.max_size * self.workers,
+            'hits': totals['hits'],
+            'misses': totals['misses'],
+            'hit_rate': round(totals['hits'] / lookups, 4) if lookups else 0.0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs submitted but not yet picked up by a worker (estimated from jobs in flight)"""
+        if self.mode == 'inline':
+            return 0
+        return max(self._in_flight - self.workers, 0)
+
+    def stats(self) -> Dict:
+        """
+        Get execution statistics
+
+        Returns:
+            Dictionary with the mode, pool size, job counters, current queue
+            depth and wait/run time percentiles (ms) over recent jobs
+        """
+        wait_ms = list(self._wait_ms)
+        run_ms = list(self._run_ms)
+        return {
+            'mode': self.mode,
+            'workers': self.workers if self.mode != 'inline' else 0,
+            'submitted': self._submitted,
+            'completed': self._completed,
+            'failed': self._failed,
+            'in_flight': self._in_flight,
+            'max_in_flight': self._max_in_flight,
+            'queue_depth': self.queue_depth,
+            'wait_ms_p50': round(_percentile(wait_ms, 0.5), 3),
+            'wait_ms_p99': round(_percentile(wait_ms, 0.99), 3),
+            'wait_ms_max': round(max(wait_ms, default=0.0), 3),
+            'run_ms_p50': round(_percentile(run_ms, 0.5), 3),
+            'run_ms_p99': round(_percentile(run_ms, 0.99), 3),
+            'run_ms_max': round(max(run_ms, default=0.0), 3),
+        }
@@ -0,0 +1,316 @@
+"""
+Typo-Tolerant Fallback Matching
+SymSpell-style deletion index over the keywords of every intent pattern,
+consulted only when no regex matches a message
+"""
+import re
+import logging
+import functools
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+from app.core.prefilter import extract_literal_runs, normalize_text
+
+if TYPE_CHECKING:
+    from app.core.rule_engine import CompiledPattern
+
+logger = logging.getLogger(__name__)
+
+# Confidence of a fuzzy match with no edits; scaled down by the edit distance
+FUZZY_CONFIDENCE = 0.7
+
+# Keywords shorter than this must be spelled exactly ("ship" is one edit from "shop")
+MIN_FUZZY_LENGTH = 5
+
+# Keywords up to this length tolerate one edit, longer ones up to max_distance
+SHORT_KEYWORD_LENGTH = 7
+
+# Longer message tokens are not corrected (their deletions grow quadratically)
+MAX_TOKEN_LENGTH = 32
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split normalized text into word tokens"""
+    return _TOKEN.findall(normalize_text(text))
+
+
+@functools.lru_cache(maxsize=4)
+def load_word_list(path: str) -> FrozenSet[str]:
+    """
+    Read a vocabulary file shared by every rule set
+
+    One word per line; anything after the first whitespace (such as the
+    counts of a word frequency list) and lines starting with '#' are ignored.
+
+    Args:
+        path: Path of the word list
+
+    Returns:
+        Normalized words
+    """
+    words: Set[str] = set()
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            fields = line.split(None, 1)
+            if fields and not fields[0].startswith('#'):
+                words.update(tokenize(fields[0]))
+    logger.info(f"Loaded {len(words)} words from fuzzy vocabulary {path}")
+    return frozenset(words)
+
+
+def rule_vocabulary(rules: Dict) -> Set[str]:
+    """
+    Real words known from a rules mapping
+
+    Every word written in the responses and fallback responses, plus the
+    rules file's optional `known_words` list for words users type that
+    resemble a keyword (such as "score" and "store").
+
+    Args:
+        rules: Parsed rules mapping
+
+    Returns:
+        Normalized words
+    """
+    texts = list(rules.get('known_words') or [])
+    texts.extend(rules.get('fallback_responses') or [])
+    for intent in rules.get('intents') or []:
+        if isinstance(intent, dict):
+            texts.extend(intent.get('responses') or [])
+    words: Set[str] = set()
+    for text in texts:
+        if isinstance(text, str):
+            words.update(tokenize(text))
+    return words
+
+
+def _deletes(word: str, distance: int) -> Dict[str, int]:
+    """Every string obtained by deleting up to `distance` characters from a word, with the fewest deletions"""
+    found = {word: 0}
+    level = {word}
+    for count in range(1, min(distance, len(word) - 1) + 1):
+        level = {item[:index] + item[index + 1:] for item in level for index in range(len(item))}
+        for deleted in level:
+            found.setdefault(deleted, count)
+    return found
+
+
+def _one_edit_apart(a: str, b: str) -> bool:
+    """Whether two different words are exactly one edit or adjacent transposition apart"""
+    if len(a) != len(b):
+        if abs(len(a) - len(b)) != 1:
+            return False
+        if len(a) > len(b):
+            a, b = b, a
+        index = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), len(a))
+        return a[index:] == b[index + 1:]
+    mismatches = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+    if len(mismatches) == 1:
+        return True
+    return (
+        len(mismatches) == 2 and mismatches[1] == mismatches[0] + 1
+        and a[mismatches[0]] == b[mismatches[1]] and a[mismatches[1]] == b[mismatches[0]]
+    )
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (edits plus adjacent transpositions)
+
+    Only the diagonal band of width 2 * limit + 1 is computed.
+
+    Returns:
+        The distance, or limit + 1 once it is known to exceed the limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    width = len(b)
+    previous2: List[int] = []
+    previous = [j if j <= limit else over for j in range(width + 1)]
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        low = max(1, i - limit)
+        high = min(width, i + limit)
+        current = [over] * (width + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        for j in range(low, high + 1):
+            value = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            if value > over:
+                value = over
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return over
+        previous2, previous = previous, current
+    return previous[width]
+
+
+class FuzzyIndex:
+    """
+    Precomputed typo index for a compiled pattern table
+
+    Each pattern is reduced to the literal runs every match must contain,
+    each run to its alternative spellings and each spelling to keywords.
+    Every keyword and all its deletions up to the tolerated edit distance are
+    indexed, so correcting a message token costs a handful of dictionary
+    probes for its own deletions, independent of the number of rules. A
+    pattern is a fuzzy match when every one of its runs is found in the
+    message, at least one keyword through a correction. Message tokens found
+    in the vocabulary are real words and are taken at face value.
+    """
+
+    def __init__(
+        self,
+        patterns: Sequence['CompiledPattern'],
+        max_distance: int = 2,
+        vocabulary: Iterable[str] = ()
+    ):
+        """
+        Build the index
+
+        Args:
+            patterns: Compiled pattern table in evaluation order
+            max_distance: Largest edit distance tolerated for long keywords
+            vocabulary: Known words that are never corrected into a keyword
+        """
+        self.patterns = tuple(patterns)
+        self.max_distance = max(max_distance, 1)
+        self.vocabulary = frozenset(vocabulary)
+        # Per pattern position: runs, each a tuple of alternative keyword tuples
+        self._runs: Dict[int, Tuple[Tuple[Tuple[str, ...], ...], ...]] = {}
+        self._positions_by_keyword: Dict[str, Set[int]] = {}
+        # deletion -> [(keyword, characters deleted from it)]
+        self._keywords_by_delete: Dict[str, List[Tuple[str, int]]] = {}
+
+        for position, compiled in enumerate(self.patterns):
+            runs = []
+            for run in extract_literal_runs(compiled.source, compiled.flags):
+                spellings = tuple(filter(None, (tuple(tokenize(spelling)) for spelling in sorted(run))))
+                if spellings:
+                    runs.append(spellings)
+            if not runs:
+                continue
+            self._runs[position] = tuple(runs)
+            for spellings in runs:
+                for keywords in spellings:
+                    for keyword in keywords:
+                        self._positions_by_keyword.setdefault(keyword, set()).add(position)
+
+        for keyword in self._positions_by_keyword:
+            if len(keyword) >= MIN_FUZZY_LENGTH:
+                for deleted, count in _deletes(keyword, self._allowed(keyword)).items():
+                    self._keywords_by_delete.setdefault(deleted, []).append((keyword, count))
+
+        logger.debug(
+            f"Fuzzy index: {len(self._positions_by_keyword)} keywords, "
+            f"{len(self._keywords_by_delete)} deletions"
+        )
+
+    def _allowed(self, keyword: str) -> int:
+        """Edit distance tolerated for a keyword"""
+        if len(keyword) < MIN_FUZZY_LENGTH:
+            return 0
+        return 1 if len(keyword) <= SHORT_KEYWORD_LENGTH else self.max_distance
+
+    def corrections(self, token: str) -> Dict[str, int]:
+        """
+        Find the keywords a message token may be a misspelling of
+
+        Args:
+            token: Normalized message token
+
+        Returns:
+            Mapping of keyword to edit distance (0 if the token is a keyword)
+        """
+        if token in self._positions_by_keyword:
+            return {token: 0}
+        if token in self.vocabulary:
+            return {}
+        if not MIN_FUZZY_LENGTH - 1 <= len(token) <= MAX_TOKEN_LENGTH:
+            return {}
+
+        found: Dict[str, int] = {}
+        checked: Set[str] = set()
+        for deleted, token_count in _deletes(token, self.max_distance).items():
+            for keyword, keyword_count in self._keywords_by_delete.get(deleted, ()):
+                limit = self._allowed(keyword)
+                if token_count > limit or keyword in checked:
+                    continue
+                checked.add(keyword)
+                if token_count + keyword_count == 1:
+                    # A single insertion or deletion apart: no need to align
+                    distance = 1
+                elif limit == 1:
+                    distance = 1 if _one_edit_apart(token, keyword) else 2
+                else:
+                    distance = edit_distance(token, keyword, limit)
+                if distance <= limit:
+                    found[keyword] = distance
+        return found
+
+    def _similarity(self, position: int, seen: Dict[str, int]) -> Optional[float]:
+        """
+        How closely the message spells a pattern's keywords
+
+        Returns:
+            Mean per-keyword similarity over the best spelling of each run,
+            or None if a run is missing or nothing had to be corrected
+        """
+        scores: List[float] = []
+        corrected = False
+        for spellings in self._runs[position]:
+            best: Optional[List[float]] = None
+            for keywords in spellings:
+                if all(keyword in seen for keyword in keywords):
+                    run_scores = [1 - seen[keyword] / len(keyword) for keyword in keywords]
+                    if best is None or sum(run_scores) / len(run_scores) > sum(best) / len(best):
+                        best = run_scores
+            if best is None:
+                return None
+            corrected = corrected or min(best) < 1
+            scores.extend(best)
+        return sum(scores) / len(scores) if corrected else None
+
+    def match(self, message: str) -> Optional[Tuple['CompiledPattern', float]]:
+        """
+        Find the pattern a misspelled message most likely meant
+
+        Args:
+            message: Preprocessed user message
+
+        Returns:
+            Tuple of (compiled pattern, confidence) or None. Ties go to the
+            pattern that comes first in the rules file.
+        """
+        # Closest distance at which each keyword occurs in the message
+        seen: Dict[str, int] = {}
+        for token in set(tokenize(message)):
+            for keyword, distance in self.corrections(token).items():
+                if distance < seen.get(keyword, distance + 1):
+                    seen[keyword] = distance
+
+        candidates: Set[int] = set()
+        for keyword, distance in seen.items():
+            if distance:
+                candidates.update(self._positions_by_keyword[keyword])
+
+        best: Optional[Tuple[float, int]] = None
+        for position in sorted(candidates):
+            similarity = self._similarity(position, seen)
+            if similarity is not None and (best is None or similarity > best[0]):
+                best = (similarity, position)
+
+        if best is None:
+            return None
+        similarity, position = best
+        return self.patterns[position], round(FUZZY_CONFIDENCE * similarity, 3)
@@ -0,0 +1,344 @@
+"""
+Intent Matching Strategies
+Interchangeable engines that find the first compiled pattern matching a message
+"""
+import re
+import time
+import logging
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+from app.core.prefilter import LiteralIndex
+from app.core.redos import GUARD_WALL_CLOCK_FACTOR, MatchBudgetExceeded
+
+if TYPE_CHECKING:
+    from app.core.rule_engine import CompiledPattern
+
+logger = logging.getLogger(__name__)
+
+# Constructs whose meaning depends on group numbering inside the original pattern
+_GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+def _non_capturing(source: str) -> str:
+    """
+    Rewrite capturing groups in a regex source as non-capturing groups
+
+    Capture groups only cost time inside the combined regex, because the
+    engine has to save and restore their marks on every backtrack.
+    """
+    out = []
+    i = 0
+    in_class = False
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            out.append(source[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+            out.append(char)
+            i += 1
+            # A leading ']' (optionally after '^') is a literal inside the class
+            if source[i:i + 1] == '^':
+                out.append('^')
+                i += 1
+            if source[i:i + 1] == ']':
+                out.append(']')
+                i += 1
+            continue
+        elif char == '(':
+            if source[i + 1:i + 2] != '?':
+                out.append('(?:')
+                i += 1
+                continue
+            if source[i + 1:i + 4] == '?P<':
+                out.append('(?:')
+                i = source.index('>', i) + 1
+                continue
+        out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+class LoopMatcher:
+    """
+    Evaluate compiled patterns one by one in priority order
+
+    With a prefilter, only the patterns whose required literals occur in
+    the message are evaluated. Under a time budget the thread's CPU time is
+    checked between patterns, and each pattern runs on its guarded
+    (interruptible) copy when one is available.
+
+    The evaluation order can be changed with set_order, e.g. to try
+    frequently matched intents first where that cannot change the winner.
+    """
+
+    name = 'loop'
+    reorderable = True
+
+    def __init__(self, patterns: List['CompiledPattern'], prefilter: bool = False):
+        self.patterns = patterns
+        self.index = LiteralIndex(patterns) if prefilter else None
+        # (rank of each position, positions and patterns in evaluation order), or None for table order
+        self._order: Optional[Tuple[List[int], List[int], List['CompiledPattern']]] = None
+
+    def set_order(self, positions: Optional[List[int]]):
+        """
+        Change the order in which patterns are evaluated
+
+        Args:
+            positions: Every table position in the new evaluation order,
+                or None to restore table order
+        """
+        if positions is None:
+            self._order = None
+            return
+        if sorted(positions) != list(range(len(self.patterns))):
+            raise ValueError("evaluation order must be a permutation of the pattern table")
+        rank = [0] * len(positions)
+        for order, position in enumerate(positions):
+            rank[position] = order
+        # Published with a single assignment so concurrent matches see either order
+        self._order = (rank, list(positions), [self.patterns[position] for position in positions])
+
+    def evaluation_order(self) -> List['CompiledPattern']:
+        """Patterns in the order they are currently evaluated"""
+        order = self._order
+        return list(order[2]) if order is not None else list(self.patterns)
+
+    def _positions(self, message: str) -> Iterable[int]:
+        """Table positions to evaluate for a message, in evaluation order"""
+        order = self._order
+        if self.index is not None:
+            candidates = self.index.candidates(message)
+            return sorted(candidates, key=order[0].__getitem__) if order is not None else candidates
+        if order is not None:
+            return order[1]
+        return range(len(self.patterns))
+
+    def match(self, message: str, budget_ms: Optional[float] = None) -> Optional['CompiledPattern']:
+        """
+        Find the first pattern that matches the message
+
+        Args:
+            message: Preprocessed user message
+            budget_ms: Maximum matching time in milliseconds (None for no limit)
+
+        Returns:
+            The matching compiled pattern or None
+
+        Raises:
+            MatchBudgetExceeded: If the budget runs out before a pattern matches
+        """
+        if budget_ms is not None:
+            return self._match_within_budget(message, budget_ms)
+
+        order = self._order
+        if self.index is not None:
+            patterns = self.patterns
+            candidates = self.index.candidates(message)
+            if order is not None:
+                candidates = sorted(candidates, key=order[0].__getitem__)
+            for position in candidates:
+                if patterns[position].regex.search(message):
+                    return patterns[position]
+            return None
+
+        for compiled in (order[2] if order is not None else self.patterns):
+            if compiled.regex.search(message):
+                return compiled
+        return None
+
+    def match_all(
+        self,
+        message: str,
+        budget_ms: Optional[float] = None
+    ) -> List[Tuple['CompiledPattern', Tuple[int, int]]]:
+        """
+        Find every pattern that matches the message
+
+        Args:
+            message: Preprocessed user message
+            budget_ms: Maximum matching time in milliseconds (None for no limit)
+
+        Returns:
+            (compiled pattern, match span) pairs in evaluation order
+
+        Raises:
+            MatchBudgetExceeded: If the budget runs out before all patterns are evaluated
+        """
+        if budget_ms is not None:
+            return list(self._search_within_budget(message, budget_ms))
+
+        patterns = self.patterns
+        positions = self.index.candidates(message) if self.index is not None else range(len(patterns))
+        matches = []
+        for position in positions:
+            found = patterns[position].regex.search(message)
+            if found:
+                matches.append((patterns[position], found.span()))
+        return matches
+
+    def _match_within_budget(self, message: str, budget_ms: float) -> Optional['CompiledPattern']:
+        for compiled, _ in self._search_within_budget(message, budget_ms):
+            return compiled
+        return None
+
+    def _search_within_budget(
+        self,
+        message: str,
+        budget_ms: float
+    ) -> Iterator[Tuple['CompiledPattern', Tuple[int, int]]]:
+        """Yield matching patterns and spans, raising MatchBudgetExceeded once the budget is spent"""
+        patterns = self.patterns
+        positions = self._positions(message)
+
+        # CPU time of this thread, so waiting for the CPU or the GIL does not count
+        start = time.thread_time()
+        deadline = start + budget_ms / 1000
+        for position in positions:
+            compiled = patterns[position]
+            if compiled.guarded is not None:
+                timeout = max(deadline - time.thread_time(), 0) * GUARD_WALL_CLOCK_FACTOR
+                try:
+                    found = compiled.guarded.search(message, timeout=timeout)
+                except TimeoutError:
+                    raise MatchBudgetExceeded(compiled, (time.thread_time() - start) * 1000) from None
+            else:
+                found = compiled.regex.search(message)
+            if found:
+                yield compiled, found.span()
+
+            now = time.thread_time()
+            if now > deadline:
+                raise MatchBudgetExceeded(compiled, (now - start) * 1000)
+
+
+class CombinedMatcher:
+    """
+    Merge every pattern into a single regex evaluated with one scan
+
+    Each pattern becomes a lookahead alternative anchored at the start of the
+    message, followed by an empty marker group. The regex engine tries the
+    alternatives in order, so the first pattern that matches anywhere in the
+    message wins, exactly like the loop strategy.
+
+    The single regex call cannot be interrupted, so a time budget (CPU time)
+    is only checked once it returns; the violation is attributed to the pattern that
+    matched, or to no pattern when nothing did.
+    """
+
+    name = 'combined'
+    # The order is compiled into the regex
+    reorderable = False
+
+    def __init__(self, patterns: List['CompiledPattern'], prefilter: bool = False):
+        # The combined regex already evaluates everything in one scan
+        self.patterns = patterns
+        self.prefilter = prefilter
+        self.index = None
+        self.regex = self._build(patterns)
+        # Per-pattern matcher for ranked scoring, built on first use
+        self._loop: Optional[LoopMatcher] = None
+
+    @staticmethod
+    def _build(patterns: List['CompiledPattern']) -> Optional[re.Pattern]:
+        """
+        Build the combined regex
+
+        Raises:
+            ValueError: If the patterns cannot be merged safely
+        """
+        if not patterns:
+            return None
+
+        flags = {compiled.flags for compiled in patterns}
+        if len(flags) > 1:
+            raise ValueError("patterns use different regex flags")
+
+        alternatives = []
+        for index, compiled in enumerate(patterns):
+            if _GROUP_REFERENCE.search(compiled.source):
+                raise ValueError(f"pattern uses group references: {compiled.source}")
+            source = _non_capturing(compiled.source)
+            alternatives.append(f"(?=[\\s\\S]*?(?:{source}))(?P<_m{index}>)")
+
+        try:
+            return re.compile(r'\A(?:' + '|'.join(alternatives) + ')', flags.pop())
+        except re.error as e:
+            raise ValueError(f"patterns cannot be combined: {e}") from e
+
+    def match(self, message: str, budget_ms: Optional[float] = None) -> Optional['CompiledPattern']:
+        """
+        Find the first pattern that matches the message
+
+        Args:
+            message: Preprocessed user message
+            budget_ms: Maximum matching time in milliseconds (None for no limit)
+
+        Returns:
+            The matching compiled pattern or None
+
+        Raises:
+            MatchBudgetExceeded: If the scan took longer than the budget
+        """
+        if self.regex is None:
+            return None
+
+        start = time.thread_time()
+        match = self.regex.match(message)
+        # Marker groups are the only capturing groups left in the regex
+        compiled = self.patterns[int(match.lastgroup[2:])] if match else None
+
+        if budget_ms is not None:
+            elapsed_ms = (time.thread_time() - start) * 1000
+            if elapsed_ms > budget_ms:
+                raise MatchBudgetExceeded(compiled, elapsed_ms)
+        return compiled
+
+    def match_all(
+        self,
+        message: str,
+        budget_ms: Optional[float] = None
+    ) -> List[Tuple['CompiledPattern', Tuple[int, int]]]:
+        """
+        Find every pattern that matches the message
+
+        A single regex only reports one alternative, so this evaluates the
+        patterns one by one, with the literal prefilter if it is enabled.
+        """
+        if self._loop is None:
+            self._loop = LoopMatcher(self.patterns, prefilter=self.prefilter)
+        return self._loop.match_all(message, budget_ms)
+
+
+MATCHERS: Dict[str, Type] = {
+    LoopMatcher.name: LoopMatcher,
+    CombinedMatcher.name: CombinedMatcher,
+}
+
+
+def build_matcher(strategy: str, patterns: List['CompiledPattern'], prefilter: bool = False):
+    """
+    Create the matcher for a strategy, falling back to the loop matcher
+    when the patterns cannot be handled by the requested engine
+
+    Args:
+        strategy: Matching strategy name
+        patterns: Compiled pattern table in priority order
+        prefilter: Skip patterns whose required literals are absent from the message
+
+    Returns:
+        Matcher instance
+    """
+    if strategy not in MATCHERS:
+        raise ValueError(f"Unknown match strategy '{strategy}', expected one of {sorted(MATCHERS)}")
+
+    try:
+        return MATCHERS[strategy](patterns, prefilter=prefilter)
+    except ValueError as e:
+        logger.warning(f"Cannot use '{strategy}' matcher ({e}); falling back to '{LoopMatcher.name}'")
+        return LoopMatcher(patterns, prefilter=prefilter)
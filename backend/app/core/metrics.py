@@ -0,0 +1,319 @@
+"""
+In-Process Metrics
+Counters and latency histograms rendered in the Prometheus text format,
+optionally aggregated across worker processes through a shared directory
+"""
+import os
+import json
+import time
+import bisect
+import logging
+import tempfile
+import functools
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, label names)
+METRIC_DEFINITIONS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    'chatbot_messages_total': ('counter', 'Messages classified by the rule engine', ()),
+    'chatbot_fallback_total': ('counter', 'Messages answered with a fallback response', ()),
+    'chatbot_intent_total': ('counter', 'Messages classified per intent', ('intent',)),
+    'chatbot_pattern_matches_total': ('counter', 'Messages matched per intent pattern', ('intent', 'pattern')),
+    'chatbot_stage_duration_seconds': ('histogram', 'Time spent per processing stage', ('stage',)),
+    'chatbot_http_requests_total': ('counter', 'HTTP requests per route', ('method', 'route', 'status')),
+    'chatbot_http_request_duration_seconds': ('histogram', 'HTTP request latency per route', ('method', 'route')),
+    'chatbot_persistence_failed_turns_total': ('counter', 'Queued chat turns lost after failed commits', ()),
+}
+
+_SNAPSHOT_PREFIX = 'metrics-'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counters and histograms
+
+    Each process records into its own registry. When a shared directory is
+    configured, a background thread of every process writes its totals there
+    each flush_interval and a scrape merges all of them, so /metrics reports the whole deployment no
+    matter which worker answers it.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.enabled = True
+        self.buckets = tuple(buckets)
+        self.directory: Optional[str] = None
+        self.flush_interval = 1.0
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._histograms: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+        # Serializes snapshot writes; the flush thread is per process (restarted after a fork)
+        self._flush_lock = threading.Lock()
+        self._flusher_pid: Optional[int] = None
+        self._closed = threading.Event()
+
+    def configure(self, enabled: bool = True, directory: str = '', flush_interval: float = 1.0):
+        """
+        Apply settings
+
+        Args:
+            enabled: Record metrics at all
+            directory: Shared directory for cross-process aggregation ('' for this process only)
+            flush_interval: Seconds between background writes of this process's totals
+        """
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.directory = directory or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._closed.clear()
+            self._ensure_flusher()
+
+    def inc(self, name: str, labels: Tuple[str, ...] = (), value: float = 1.0):
+        """Increment a counter"""
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        self._ensure_flusher()
+
+    def observe(self, name: str, seconds: float, labels: Tuple[str, ...] = ()):
+        """Record a duration in a histogram"""
+        if not self.enabled:
+            return
+        key = (name, labels)
+        position = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0.0] * (len(self.buckets) + 2)
+            if position < len(self.buckets):
+                series[position] += 1
+            series[-2] += seconds
+            series[-1] += 1
+        self._ensure_flusher()
+
+    def record_result(self, result: Dict):
+        """Count one rule engine result by intent, pattern and fallback"""
+        if not self.enabled:
+            return
+        intent = result.get('intent')
+        if intent is None:
+            return
+        self.inc('chatbot_messages_total')
+        self.inc('chatbot_intent_total', (intent,))
+        if intent == 'fallback':
+            self.inc('chatbot_fallback_total')
+        elif result.get('matched_pattern'):
+            self.inc('chatbot_pattern_matches_total', (intent, result['matched_pattern']))
+
+    def reset(self):
+        """Drop everything recorded by this process"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict:
+        """Copy of this process's totals in a JSON-serializable layout"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self._histograms.items()]
+            }
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, f'{_SNAPSHOT_PREFIX}{os.getpid()}.json')
+
+    def _ensure_flusher(self):
+        """Start the background thread writing this process's snapshots, unless running"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._flush_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            # A forked worker inherits the parent's pid here but not its thread
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        """Write a snapshot every flush_interval seconds until closed, off the request path"""
+        pid = os.getpid()
+        while not self._closed.wait(self.flush_interval) and self._flusher_pid == pid:
+            self.flush()
+
+    def flush(self):
+        """
+        Write this process's totals to the shared directory
+
+        The snapshot goes to a uniquely named temporary file that replaces the
+        previous one atomically, so concurrent flushes and scrapes never see a
+        partial file.
+        """
+        if not self.directory:
+            return
+        path = self._snapshot_path()
+        with self._flush_lock:
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=self.directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp'
+                )
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    json.dump(self.snapshot(), file)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write metrics snapshot {path}: {e}")
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+    def close(self):
+        """Stop the flush thread and write a final snapshot"""
+        self._closed.set()
+        self._flusher_pid = None
+        self.flush()
+
+    def _collect(self) -> Iterable[Dict]:
+        """This process's live totals plus the last snapshot of every other process"""
+        yield self.snapshot()
+        if not self.directory:
+            return
+        own = os.path.basename(self._snapshot_path())
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name == own or not name.startswith(_SNAPSHOT_PREFIX) or not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as file:
+                    yield json.load(file)
+            except (OSError, ValueError):
+                continue
+
+    def render(self) -> str:
+        """
+        Render all processes' metrics in the Prometheus text exposition format
+
+        Returns:
+            Exposition text
+        """
+        counters: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        histograms: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+        for snapshot in self._collect():
+            for name, labels, value in snapshot.get('counters', []):
+                key = (name, tuple(labels))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, series in snapshot.get('histograms', []):
+                key = (name, tuple(labels))
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = list(series)
+                elif len(merged) == len(series):
+                    histograms[key] = [a + b for a, b in zip(merged, series)]
+
+        lines: List[str] = []
+        for name, (kind, help_text, label_names) in METRIC_DEFINITIONS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(label_names, labels)} {_format_number(value)}')
+                continue
+
+            for (metric, labels), series in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f'{name}_bucket{_format_labels(label_names, labels, le)} {_format_number(cumulative)}')
+                le = 'le="+Inf"'
+                lines.append(f'{name}_bucket{_format_labels(label_names, labels, le)} {_format_number(series[-1])}')
+                lines.append(f'{name}_sum{_format_labels(label_names, labels)} {series[-2]!r}')
+                lines.append(f'{name}_count{_format_labels(label_names, labels)} {_format_number(series[-1])}')
+
+        total = counters.get(('chatbot_messages_total', ()), 0.0)
+        fallback = counters.get(('chatbot_fallback_total', ()), 0.0)
+        lines.append('# HELP chatbot_fallback_ratio Share of messages answered with a fallback response')
+        lines.append('# TYPE chatbot_fallback_ratio gauge')
+        lines.append(f'chatbot_fallback_ratio {fallback / total if total else 0.0!r}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
+
+
+def timed_stage(stage: str):
+    """
+    Decorator recording the duration of an async function as a processing stage
+
+    Args:
+        stage: Value of the 'stage' label
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                metrics.observe('chatbot_stage_duration_seconds', time.perf_counter() - start, (stage,))
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and their latency per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get('route')
+            path = getattr(route, 'path', 'unmatched')
+            method = scope.get('method', '')
+            metrics.observe('chatbot_http_request_duration_seconds', time.perf_counter() - start, (method, path))
+            metrics.inc('chatbot_http_requests_total', (method, path, str(status_code)))
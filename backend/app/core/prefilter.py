@@ -0,0 +1,298 @@
+"""
+Literal Prefilter
+Extracts the literal substrings a pattern cannot match without and indexes them,
+so a message only runs the regexes whose literals actually appear in it
+"""
+import logging
+import functools
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+if TYPE_CHECKING:
+    from app.core.rule_engine import CompiledPattern
+
+logger = logging.getLogger(__name__)
+
+# Literals shorter than this are checked directly instead of through the n-gram index
+GRAM_SIZE = 3
+
+# Upper bound on the number of alternative strings tracked for one literal run
+MAX_EXPANSION = 64
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) + (
+    (sre_constants.POSSESSIVE_REPEAT,) if hasattr(sre_constants, 'POSSESSIVE_REPEAT') else ()
+)
+
+# Non-ASCII characters that IGNORECASE matches against ASCII letters but casefold() keeps apart
+_CASE_EQUIVALENTS = str.maketrans({'ı': 'i'})
+
+
+def normalize_text(text: str) -> str:
+    """
+    Fold a message so that every case-insensitive regex match of an ASCII
+    literal is also a plain substring match
+    """
+    folded = text.casefold()
+    if not folded.isascii():
+        folded = folded.translate(_CASE_EQUIVALENTS)
+    return folded
+
+
+def _best(candidates: List[Set[str]]) -> Optional[Set[str]]:
+    """Pick the most selective alternative set: longest shortest literal, then fewest literals"""
+    if not candidates:
+        return None
+    return max(candidates, key=lambda lits: (min(len(lit) for lit in lits), -len(lits)))
+
+
+def _expand(items) -> Optional[Set[str]]:
+    """
+    Expand a parsed regex sequence into every string it can match, if that
+    language is a small finite set of ASCII literals
+    """
+    strings = {''}
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            char = chr(av)
+            if not char.isascii():
+                return None
+            options = {char.lower()}
+        elif op is sre_constants.AT:
+            continue
+        elif op is sre_constants.SUBPATTERN:
+            options = _expand(av[-1])
+        elif op is sre_constants.BRANCH:
+            options = set()
+            for branch in av[1]:
+                sub = _expand(branch)
+                if sub is None:
+                    return None
+                options |= sub
+        elif op is sre_constants.IN:
+            options = set()
+            for item_op, item_av in av:
+                if item_op is not sre_constants.LITERAL or not chr(item_av).isascii():
+                    return None
+                options.add(chr(item_av).lower())
+        elif op in _REPEATS and av[1] == 1:
+            options = _expand(av[2])
+            if options is not None and av[0] == 0:
+                options = options | {''}
+        else:
+            return None
+
+        if options is None or len(strings) * len(options) > MAX_EXPANSION:
+            return None
+        strings = {prefix + option for prefix in strings for option in options}
+    return strings
+
+
+def _required(items) -> Optional[Set[str]]:
+    """
+    Walk a parsed regex sequence and return a set of literals of which at
+    least one must appear in any matching string, or None if there is none
+    """
+    candidates: List[Set[str]] = []
+    run: Set[str] = {''}
+
+    def flush():
+        nonlocal run
+        if all(run):
+            candidates.append(run)
+        run = {''}
+
+    for item in items:
+        op, av = item
+        options = _expand([item])
+        if options is not None and len(run) * len(options) <= MAX_EXPANSION:
+            run = {prefix + option for prefix in run for option in options}
+            continue
+
+        flush()
+        if op is sre_constants.SUBPATTERN:
+            sub = _required(av[-1])
+            if sub:
+                candidates.append(sub)
+        elif op is sre_constants.BRANCH:
+            alternatives: Set[str] = set()
+            for branch in av[1]:
+                sub = _required(branch)
+                if not sub:
+                    alternatives = set()
+                    break
+                alternatives |= sub
+            if alternatives:
+                candidates.append(alternatives)
+        elif op in _REPEATS:
+            min_count, _, body = av
+            if min_count >= 1:
+                sub = _required(body)
+                if sub:
+                    candidates.append(sub)
+
+    flush()
+    return _best(candidates)
+
+
+def extract_literals(source: str, flags: int = 0) -> Optional[FrozenSet[str]]:
+    """
+    Extract the required literals of a regex
+
+    Args:
+        source: Regex source
+        flags: Regex flags the pattern is compiled with
+
+    Returns:
+        Lowercase literals of which at least one must occur in any match,
+        or None if the pattern has no extractable literal
+    """
+    try:
+        parsed = sre_parse.parse(source, flags)
+    except Exception as e:
+        logger.debug(f"Cannot parse pattern '{source}' for literals: {e}")
+        return None
+
+    literals = _required(parsed)
+    if not literals:
+        return None
+    # A literal containing another one is redundant: the shorter one must occur too
+    return frozenset(
+        literal for literal in literals
+        if not any(other != literal and other in literal for other in literals)
+    )
+
+
+def _runs(items) -> List[Set[str]]:
+    """
+    Walk a parsed regex sequence and return every literal run a match must
+    contain, each as the set of its alternative spellings
+    """
+    runs: List[Set[str]] = []
+    run: Set[str] = {''}
+
+    def flush():
+        nonlocal run
+        if all(run):
+            runs.append(run)
+        run = {''}
+
+    for item in items:
+        op, av = item
+        options = _expand([item])
+        if options is not None and len(run) * len(options) <= MAX_EXPANSION:
+            run = {prefix + option for prefix in run for option in options}
+            continue
+
+        flush()
+        if op is sre_constants.SUBPATTERN:
+            runs.extend(_runs(av[-1]))
+        elif op is sre_constants.BRANCH:
+            # Only alternatives made of one run each can be merged into one run
+            alternatives: Set[str] = set()
+            for branch in av[1]:
+                sub = _runs(branch)
+                if len(sub) != 1:
+                    alternatives = set()
+                    break
+                alternatives |= sub[0]
+            if alternatives:
+                runs.append(alternatives)
+        elif op in _REPEATS and av[0] >= 1:
+            runs.extend(_runs(av[2]))
+
+    flush()
+    return runs
+
+
+@functools.lru_cache(maxsize=65536)
+def extract_literal_runs(source: str, flags: int = 0) -> Tuple[FrozenSet[str], ...]:
+    """
+    Extract every literal run of a regex, with all its spellings
+
+    Unlike extract_literals, which keeps the single most selective set and
+    drops literals containing shorter ones, this keeps the full vocabulary
+    (e.g. both "product" and "products" for `products?`).
+
+    Args:
+        source: Regex source
+        flags: Regex flags the pattern is compiled with
+
+    Returns:
+        Lowercase runs that must all occur in any match, each as a set of
+        alternatives; empty if the pattern has no extractable literal
+    """
+    try:
+        parsed = sre_parse.parse(source, flags)
+    except Exception as e:
+        logger.debug(f"Cannot parse pattern '{source}' for literals: {e}")
+        return ()
+    return tuple(frozenset(run) for run in _runs(parsed))
+
+
+class LiteralIndex:
+    """
+    Index of required literals for a compiled pattern table
+
+    Literals are bucketed by their first n-gram, so looking up a message
+    costs one dictionary probe per n-gram of the message plus a substring
+    check for each literal sharing an n-gram with it.
+    """
+
+    def __init__(self, patterns: List['CompiledPattern']):
+        self.always: Set[int] = set()
+        self._by_literal: Dict[str, List[int]] = {}
+        self._by_gram: Dict[str, List[str]] = {}
+        self._short: List[str] = []
+
+        for position, compiled in enumerate(patterns):
+            literals = compiled.literals
+            if not literals:
+                self.always.add(position)
+                continue
+            for literal in literals:
+                self._by_literal.setdefault(literal, []).append(position)
+
+        for literal in self._by_literal:
+            if len(literal) < GRAM_SIZE:
+                self._short.append(literal)
+            else:
+                self._by_gram.setdefault(literal[:GRAM_SIZE], []).append(literal)
+
+        logger.debug(
+            f"Literal index: {len(self._by_literal)} literals, "
+            f"{len(self.always)} of {len(patterns)} patterns always checked"
+        )
+
+    def candidates(self, message: str) -> List[int]:
+        """
+        Get the positions of the patterns that can possibly match a message
+
+        Args:
+            message: Preprocessed user message
+
+        Returns:
+            Sorted pattern positions in the compiled table
+        """
+        text = normalize_text(message)
+        found = set(self.always)
+        by_gram = self._by_gram
+        by_literal = self._by_literal
+
+        grams = {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+        for gram in grams:
+            bucket = by_gram.get(gram)
+            if bucket:
+                for literal in bucket:
+                    if literal in text:
+                        found.update(by_literal[literal])
+
+        for literal in self._short:
+            if literal in text:
+                found.update(by_literal[literal])
+
+        return sorted(found)
@@ -0,0 +1,257 @@
+"""
+ReDoS Protection
+Static detection of catastrophic-backtracking constructs and a per-message
+matching time budget
+"""
+import logging
+from typing import FrozenSet, List, Tuple, Union
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+try:
+    import regex as regex_module
+except ImportError:  # Optional: without it a running regex cannot be interrupted
+    regex_module = None
+
+logger = logging.getLogger(__name__)
+
+# The budget is CPU time of the matching thread, but the regex module's
+# timeout is wall-clock time: a guarded search may take this many times the
+# remaining budget in wall time, so a busy host does not cut normal messages short
+GUARD_WALL_CLOCK_FACTOR = 10
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) + (
+    (sre_constants.POSSESSIVE_REPEAT,) if hasattr(sre_constants, 'POSSESSIVE_REPEAT') else ()
+)
+
+# A first-character set is either a finite set of characters or ANY (unknown / very large)
+ANY = None
+CharSet = Union[FrozenSet[str], None]
+
+# Character ranges wider than this are treated as ANY
+_MAX_RANGE = 256
+
+
+class MatchBudgetExceeded(Exception):
+    """Raised when matching a message uses more CPU time than the time budget"""
+
+    def __init__(self, pattern, elapsed_ms: float):
+        """
+        Args:
+            pattern: CompiledPattern that was running, or None if unknown
+            elapsed_ms: CPU time spent matching the message so far
+        """
+        self.pattern = pattern
+        self.elapsed_ms = elapsed_ms
+        where = f" at pattern '{pattern.source}'" if pattern is not None else ""
+        super().__init__(f"Matching exceeded time budget after {elapsed_ms:.1f}ms{where}")
+
+
+# Character categories are tracked as pseudo-members of a first-character set
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: '\0d',
+    sre_constants.CATEGORY_SPACE: '\0s',
+    sre_constants.CATEGORY_WORD: '\0w',
+}
+_CATEGORY_TESTS = {
+    '\0d': str.isdigit,
+    '\0s': str.isspace,
+    '\0w': lambda char: char.isalnum() or char == '_',
+}
+_OVERLAPPING_CATEGORIES = {frozenset({'\0d', '\0w'})}
+
+
+def _member_overlaps(first: str, second: str) -> bool:
+    if first == second:
+        return True
+    first_category = first in _CATEGORY_TESTS
+    second_category = second in _CATEGORY_TESTS
+    if first_category and second_category:
+        return frozenset({first, second}) in _OVERLAPPING_CATEGORIES
+    if first_category:
+        return _CATEGORY_TESTS[first](second)
+    if second_category:
+        return _CATEGORY_TESTS[second](first)
+    return False
+
+
+def _overlaps(first: CharSet, second: CharSet) -> bool:
+    if first is ANY or second is ANY:
+        return True
+    if first & second:
+        return True
+    return any(_member_overlaps(a, b) for a in first for b in second)
+
+
+def _union(first: CharSet, second: CharSet) -> CharSet:
+    if first is ANY or second is ANY:
+        return ANY
+    return first | second
+
+
+def _first_chars(items) -> Tuple[CharSet, bool]:
+    """
+    Characters a parsed sequence can start with
+
+    Returns:
+        Tuple of (first character set, whether the sequence can match empty)
+    """
+    chars: CharSet = frozenset()
+    for op, av in items:
+        nullable = False
+        if op is sre_constants.LITERAL:
+            first = frozenset({chr(av).lower()})
+        elif op is sre_constants.AT:
+            continue
+        elif op is sre_constants.IN:
+            first = frozenset()
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL:
+                    first = first | {chr(item_av).lower()}
+                elif item_op is sre_constants.RANGE and item_av[1] - item_av[0] <= _MAX_RANGE:
+                    first = first | {chr(code).lower() for code in range(item_av[0], item_av[1] + 1)}
+                elif item_op is sre_constants.CATEGORY and item_av in _CATEGORIES:
+                    first = first | {_CATEGORIES[item_av]}
+                else:
+                    first = ANY
+                    break
+        elif op is sre_constants.SUBPATTERN:
+            first, nullable = _first_chars(av[-1])
+        elif op is sre_constants.BRANCH:
+            first = frozenset()
+            for branch in av[1]:
+                branch_first, branch_nullable = _first_chars(branch)
+                first = _union(first, branch_first)
+                nullable = nullable or branch_nullable
+        elif op in _REPEATS:
+            first, nullable = _first_chars(av[2])
+            nullable = nullable or av[0] == 0
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue
+        else:
+            first = ANY
+
+        chars = _union(chars, first)
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def _has_unbounded_repeat(items) -> bool:
+    """Whether a parsed sequence contains a repeat without an upper bound"""
+    for op, av in items:
+        if op in _REPEATS:
+            if av[1] == sre_constants.MAXREPEAT or _has_unbounded_repeat(av[2]):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _has_unbounded_repeat(av[-1]):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_has_unbounded_repeat(branch) for branch in av[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _has_unbounded_repeat(av[1]):
+                return True
+    return False
+
+
+def _ambiguous_alternation(items) -> bool:
+    """Whether a sequence contains an alternation whose branches overlap or can match empty"""
+    for op, av in items:
+        if op is sre_constants.SUBPATTERN:
+            if _ambiguous_alternation(av[-1]):
+                return True
+        elif op is sre_constants.BRANCH:
+            firsts = []
+            for branch in av[1]:
+                first, nullable = _first_chars(branch)
+                if nullable:
+                    return True
+                firsts.append(first)
+            if any(
+                _overlaps(firsts[i], firsts[j])
+                for i in range(len(firsts)) for j in range(i + 1, len(firsts))
+            ):
+                return True
+    return False
+
+
+def _scan(items, risks: List[str]):
+    """Collect risky constructs in a parsed sequence and everything nested in it"""
+    # First characters of the unbounded repeat just before the current item, or False
+    previous = False
+    for op, av in items:
+        if op is sre_constants.AT:
+            continue
+
+        if op in _REPEATS:
+            _, max_count, body = av
+            unbounded = max_count == sre_constants.MAXREPEAT
+            if unbounded or max_count > 10:
+                if _has_unbounded_repeat(body):
+                    risks.append("nested quantifier (a repeated group contains an unbounded repeat)")
+                if _ambiguous_alternation(body):
+                    risks.append("repeated alternation with overlapping branches")
+            if unbounded:
+                first = _first_chars(body)[0]
+                if previous is not False and _overlaps(previous, first):
+                    risks.append("adjacent unbounded repeats over overlapping characters")
+                previous = first
+            else:
+                previous = False
+            _scan(body, risks)
+            continue
+
+        previous = False
+        if op is sre_constants.SUBPATTERN:
+            _scan(av[-1], risks)
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                _scan(branch, risks)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _scan(av[1], risks)
+
+
+def analyze_pattern(source: str, flags: int = 0) -> Tuple[str, ...]:
+    """
+    Statically flag constructs that can cause catastrophic backtracking
+
+    Args:
+        source: Regex source
+        flags: Regex flags the pattern is compiled with
+
+    Returns:
+        Tuple of human-readable risk descriptions (empty if none found)
+    """
+    try:
+        parsed = sre_parse.parse(source, flags)
+    except Exception:
+        return ()
+
+    risks: List[str] = []
+    _scan(parsed, risks)
+    return tuple(dict.fromkeys(risks))
+
+
+def compile_guarded(source: str, flags: int):
+    """
+    Compile a pattern with the interruptible `regex` engine, if installed
+
+    Args:
+        source: Regex source
+        flags: Regex flags (re and regex share the flag values used here)
+
+    Returns:
+        A regex-module pattern supporting search(timeout=...), or None
+    """
+    if regex_module is None:
+        return None
+    try:
+        return regex_module.compile(source, flags)
+    except Exception as e:
+        logger.warning(f"Cannot compile '{source}' with the regex module: {e}")
+        return None
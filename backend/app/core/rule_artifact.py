@@ -0,0 +1,154 @@
+"""
+Compiled Rules Artifact
+Caches the parsed and validated rules, each pattern's required literals and
+its ReDoS analysis, keyed by the YAML content hash, so startup can skip YAML
+parsing, literal extraction and pattern analysis. The regexes themselves are
+still compiled on every load. Artifacts live in a cache directory (the user
+cache by default), not next to the rules file, which may be read-only.
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Bump when the artifact layout, the literal extraction or the ReDoS analysis changes
+ARTIFACT_FORMAT = 2
+
+ARTIFACT_SUFFIX = '.compiled.json'
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of raw file content"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def intent_hash(intent: Dict) -> str:
+    """Stable content hash of a single intent definition"""
+    encoded = json.dumps(intent, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def default_artifact_dir() -> Path:
+    """Artifact directory used when none is configured: $XDG_CACHE_HOME or ~/.cache, else the temp directory"""
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        try:
+            base = str(Path.home() / '.cache')
+        except (KeyError, RuntimeError):
+            base = tempfile.gettempdir()
+    return Path(base) / 'chatbot' / 'rules'
+
+
+def artifact_path(rules_file: str, directory: Optional[str] = None) -> Path:
+    """
+    Location of the compiled artifact for a rules file
+
+    The name carries a hash of the rules file's absolute path, so rules files
+    with the same name (tenants in different directories) do not collide.
+
+    Args:
+        rules_file: Path to the YAML rules file
+        directory: Artifact directory (defaults to default_artifact_dir())
+    """
+    rules_path = Path(rules_file)
+    location = hashlib.sha256(str(rules_path.resolve()).encode('utf-8')).hexdigest()[:16]
+    base = Path(directory) if directory else default_artifact_dir()
+    return base / f"{rules_path.name}.{location}{ARTIFACT_SUFFIX}"
+
+
+def load_artifact(rules_file: str, source_hash: str, directory: Optional[str] = None) -> Optional[Dict]:
+    """
+    Load the compiled artifact if it was built from the current rules content
+
+    Args:
+        rules_file: Path to the YAML rules file
+        source_hash: Content hash of the YAML file as it is now
+        directory: Artifact directory (defaults to default_artifact_dir())
+
+    Returns:
+        Artifact dictionary with 'rules', 'literals' and 'risks', or None if missing or stale
+    """
+    path = artifact_path(rules_file, directory)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            artifact = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable rules artifact {path}: {e}")
+        return None
+
+    if (
+        not isinstance(artifact, dict)
+        or artifact.get('format') != ARTIFACT_FORMAT
+        or artifact.get('source_sha256') != source_hash
+        or not isinstance(artifact.get('rules'), dict)
+        or not isinstance(artifact.get('literals'), list)
+        or not isinstance(artifact.get('risks'), list)
+    ):
+        logger.info(f"Rules artifact {path} is stale; rebuilding from YAML")
+        return None
+    return artifact
+
+
+def save_artifact(
+    rules_file: str,
+    source_hash: str,
+    rules: Dict,
+    literals: Sequence[Sequence[Optional[List[str]]]],
+    risks: Sequence[Sequence[List[str]]],
+    directory: Optional[str] = None
+) -> bool:
+    """
+    Atomically write the compiled artifact into the artifact directory
+
+    Args:
+        rules_file: Path to the YAML rules file
+        source_hash: Content hash of the YAML the rules were parsed from
+        rules: Parsed and validated rules mapping
+        literals: Required literals per intent and pattern (None when a pattern has none)
+        risks: ReDoS risks found per intent and pattern
+        directory: Artifact directory (defaults to default_artifact_dir())
+
+    Returns:
+        True if the artifact was written
+    """
+    path = artifact_path(rules_file, directory)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    artifact = {
+        'format': ARTIFACT_FORMAT,
+        'source_sha256': source_hash,
+        'rules': rules,
+        'literals': literals,
+        'risks': risks
+    }
+    try:
+        encoded = json.dumps(artifact, ensure_ascii=False)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Rules cannot be stored as an artifact: {e}")
+        return False
+    if json.loads(encoded)['rules'] != rules:
+        # e.g. YAML dates or non-string keys would not survive the round trip
+        logger.warning("Rules do not round-trip through JSON; skipping artifact")
+        return False
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(encoded)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write rules artifact {path}: {e}")
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+
+    logger.info(f"Wrote rules artifact {path}")
+    return True
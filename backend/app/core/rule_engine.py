@@ -6,11 +6,245 @@ import re
 import yaml
 import random
 import logging
-from typing import Dict, List, Optional, Tuple
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Pattern, Sequence, Tuple
 from pathlib import Path
+from app.core.cache import LRUCache
+from app.core.fuzzy import FuzzyIndex, load_word_list, rule_vocabulary
+from app.core.matchers import LoopMatcher, build_matcher
+from app.core.prefilter import extract_literals
+from app.core.redos import MatchBudgetExceeded, analyze_pattern, compile_guarded
+from app.core.scoring import rank_matches
+from app.core.rule_artifact import content_hash, intent_hash, load_artifact, save_artifact
+from app.core.sentiment import SentimentAnalyzer
 
 logger = logging.getLogger(__name__)
 
+# Flags applied to every intent pattern
+DEFAULT_PATTERN_FLAGS = re.IGNORECASE
+
+# What to do with patterns flagged as prone to catastrophic backtracking
+REDOS_POLICIES = ('warn', 'reject')
+
+# 'first' returns the first matching intent, 'ranked' scores every matching intent
+SCORING_MODES = ('first', 'ranked')
+
+# Use the libyaml parser when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class RuleValidationError(ValueError):
+    """Raised when a rules file contains patterns that cannot be compiled"""
+
+
+@dataclass(frozen=True)
+class CompiledPattern:
+    """A precompiled intent pattern and its position in the rules file"""
+    regex: Pattern
+    source: str
+    flags: int
+    intent: Dict
+    intent_index: int
+    pattern_index: int
+    intent_hash: str = ''
+    literals: Optional[FrozenSet[str]] = None
+    risks: Tuple[str, ...] = ()
+    # Interruptible copy of the pattern (regex module), used under a time budget
+    guarded: Any = field(default=None, compare=False)
+
+    @property
+    def intent_name(self) -> str:
+        return self.intent.get('intent', 'unknown')
+
+
+def compile_patterns(
+    intents: List[Dict],
+    flags: int = DEFAULT_PATTERN_FLAGS,
+    previous: Optional[Mapping[str, Sequence[CompiledPattern]]] = None,
+    literals: Optional[Sequence[Sequence[Optional[Sequence[str]]]]] = None,
+    redos_policy: str = 'warn',
+    guard_all: bool = False,
+    risks: Optional[Sequence[Sequence[Sequence[str]]]] = None
+) -> List[CompiledPattern]:
+    """
+    Compile every intent pattern into a flat table in evaluation order
+    
+    Args:
+        intents: Intent definitions from the rules file
+        flags: Regex flags applied to each pattern
+        previous: Compiled patterns of a previous table grouped by intent hash;
+            unchanged intents reuse them instead of being recompiled
+        literals: Precomputed required literals per intent and pattern
+        redos_policy: 'warn' logs patterns prone to catastrophic backtracking,
+            'reject' treats them as invalid
+        guard_all: Give every pattern an interruptible copy, not only those
+            flagged as ReDoS risks (used when a time budget is set)
+        risks: Precomputed ReDoS risks per intent and pattern (skips the analysis)
+        
+    Returns:
+        List of compiled patterns, ordered by intent then pattern position
+        
+    Raises:
+        RuleValidationError: If any pattern is not a valid regular expression,
+            or is flagged as a ReDoS risk under the 'reject' policy
+    """
+    if redos_policy not in REDOS_POLICIES:
+        raise ValueError(f"Unknown ReDoS policy '{redos_policy}', expected one of {list(REDOS_POLICIES)}")
+    
+    table: List[CompiledPattern] = []
+    errors: List[str] = []
+    for intent_index, intent in enumerate(intents):
+        digest = intent_hash(intent)
+        sources = [str(pattern) for pattern in intent.get('patterns') or []]
+        
+        reused = previous.get(digest) if previous else None
+        if reused and len(reused) == len(sources) and all(c.flags == flags for c in reused):
+            for compiled in reused:
+                table.append(CompiledPattern(
+                    regex=compiled.regex,
+                    source=compiled.source,
+                    flags=flags,
+                    intent=intent,
+                    intent_index=intent_index,
+                    pattern_index=compiled.pattern_index,
+                    intent_hash=digest,
+                    literals=compiled.literals,
+                    risks=compiled.risks,
+                    guarded=(
+                        compile_guarded(compiled.source, flags)
+                        if compiled.guarded is None and guard_all else compiled.guarded
+                    )
+                ))
+            continue
+        
+        for pattern_index, source in enumerate(sources):
+            try:
+                regex = re.compile(source, flags)
+            except re.error as e:
+                errors.append(
+                    f"intent '{intent.get('intent', 'unknown')}' pattern #{pattern_index} "
+                    f"'{source}': {e}"
+                )
+                continue
+            
+            if risks is not None:
+                pattern_risks = tuple(risks[intent_index][pattern_index])
+            else:
+                pattern_risks = analyze_pattern(source, flags)
+            if pattern_risks:
+                message = (
+                    f"intent '{intent.get('intent', 'unknown')}' pattern #{pattern_index} "
+                    f"'{source}' risks catastrophic backtracking: {', '.join(pattern_risks)}"
+                )
+                if redos_policy == 'reject':
+                    errors.append(message)
+                    continue
+                logger.warning(message)
+            
+            if literals is not None:
+                known = literals[intent_index][pattern_index]
+                pattern_literals = frozenset(known) if known else None
+            else:
+                pattern_literals = extract_literals(source, flags)
+            
+            table.append(CompiledPattern(
+                regex=regex,
+                source=source,
+                flags=flags,
+                intent=intent,
+                intent_index=intent_index,
+                pattern_index=pattern_index,
+                intent_hash=digest,
+                literals=pattern_literals,
+                risks=pattern_risks,
+                guarded=compile_guarded(source, flags) if pattern_risks or guard_all else None
+            ))
+    
+    if errors:
+        raise RuleValidationError("Invalid intent patterns: " + "; ".join(errors))
+    return table
+
+
+def priority_groups(intents: Sequence[Dict]) -> List[Tuple[int, ...]]:
+    """
+    Split intents into groups whose evaluation order may be changed
+    
+    Consecutive intents with the same optional `priority` value declare that
+    their patterns never match the same message, so trying them in any order
+    picks the same intent. Every other intent forms a group of its own, and
+    groups always keep file order.
+    
+    Args:
+        intents: Intent definitions in file order
+        
+    Returns:
+        Intent index groups in file order
+        
+    Raises:
+        RuleValidationError: If a priority is not an integer
+    """
+    groups: List[List[int]] = []
+    previous = None
+    for index, intent in enumerate(intents):
+        priority = intent.get('priority')
+        if priority is not None and (isinstance(priority, bool) or not isinstance(priority, int)):
+            raise RuleValidationError(
+                f"intent '{intent.get('intent', 'unknown')}' priority must be an integer, got {priority!r}"
+            )
+        if priority is not None and priority == previous and groups:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+        previous = priority
+    return [tuple(group) for group in groups]
+
+
+def _literal_table(intents: Sequence[Dict], patterns: Sequence[CompiledPattern]) -> List[List[Optional[List[str]]]]:
+    """Required literals per intent and pattern, in the layout stored in rule artifacts"""
+    table: List[List[Optional[List[str]]]] = [
+        [None] * len(intent.get('patterns') or []) for intent in intents
+    ]
+    for compiled in patterns:
+        if compiled.literals:
+            table[compiled.intent_index][compiled.pattern_index] = sorted(compiled.literals)
+    return table
+
+
+def _risk_table(intents: Sequence[Dict], patterns: Sequence[CompiledPattern]) -> List[List[List[str]]]:
+    """ReDoS risks per intent and pattern, in the layout stored in rule artifacts"""
+    table: List[List[List[str]]] = [
+        [[] for _ in intent.get('patterns') or []] for intent in intents
+    ]
+    for compiled in patterns:
+        table[compiled.intent_index][compiled.pattern_index] = list(compiled.risks)
+    return table
+
+
+@dataclass(frozen=True)
+class RuleSnapshot:
+    """
+    Immutable, fully compiled rule set
+    
+    Snapshots are built off the request path and published with a single
+    reference swap, so a request always sees one consistent rule set.
+    """
+    intents: Tuple[Dict, ...]
+    fallback_responses: Tuple[str, ...]
+    sentiment_modifiers: Mapping[str, str]
+    patterns: Tuple[CompiledPattern, ...]
+    matcher: Any = field(compare=False)
+    sentiment: SentimentAnalyzer = field(compare=False, default_factory=lambda: SentimentAnalyzer.from_config(None))
+    version: int = 0
+    source: str = 'default'
+    source_hash: str = ''
+    priority_groups: Tuple[Tuple[int, ...], ...] = ()
+    # Typo-tolerant index consulted when no pattern matches (None when disabled)
+    fuzzy: Optional[FuzzyIndex] = field(compare=False, default=None)
+
 
 class RuleEngine:
     """
@@ -18,53 +252,301 @@ class RuleEngine:
     Uses regex pattern matching and intent classification
     """
     
-    def __init__(self, rules_file: str):
+    def __init__(
+        self,
+        rules_file: str,
+        match_strategy: str = LoopMatcher.name,
+        prefilter: bool = True,
+        cache_size: int = 0,
+        artifact_cache: bool = False,
+        artifact_dir: Optional[str] = None,
+        match_time_budget_ms: float = 0,
+        redos_policy: str = 'warn',
+        scoring: str = 'first',
+        top_k: int = 3,
+        adaptive_order: bool = False,
+        reorder_interval: int = 1000,
+        fuzzy_fallback: bool = False,
+        fuzzy_max_distance: int = 2,
+        fuzzy_vocabulary_file: Optional[str] = None
+    ):
         """
         Initialize the rule engine with a YAML rules file
         
         Args:
             rules_file: Path to the YAML rules configuration file
+            match_strategy: Matching engine name ('loop' or 'combined')
+            prefilter: Only evaluate patterns whose required literals occur in the message
+            cache_size: Number of classified messages to cache (0 disables the cache)
+            artifact_cache: Load and write a compiled rules artifact
+            artifact_dir: Directory of the compiled artifacts (defaults to the user cache directory)
+            match_time_budget_ms: Maximum CPU time spent matching one message
+                before falling back (0 disables the budget)
+            redos_policy: 'warn' or 'reject' patterns prone to catastrophic backtracking
+            scoring: 'first' (first matching intent, fixed confidence) or 'ranked'
+                (score every matching intent and keep the top_k)
+            top_k: Number of intents returned in ranked mode, the best one included
+            adaptive_order: Try frequently matched intents first within their
+                priority group (loop matcher only)
+            reorder_interval: Matches between re-evaluations of the order
+            fuzzy_fallback: When no pattern matches, look for pattern keywords
+                misspelled in the message and answer with reduced confidence
+            fuzzy_max_distance: Largest edit distance tolerated for long keywords
+            fuzzy_vocabulary_file: Word list of real words never corrected into
+                keywords, in addition to the words of the rules file
         """
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode '{scoring}', expected one of {list(SCORING_MODES)}")
+        
         self.rules_file = rules_file
-        self.intents: List[Dict] = []
-        self.fallback_responses: List[str] = []
-        self.sentiment_modifiers: Dict[str, str] = {}
+        self.match_strategy = match_strategy
+        self.prefilter = prefilter
+        self.artifact_cache = artifact_cache
+        self.artifact_dir = artifact_dir
+        self.cache_size = cache_size
+        self.match_time_budget_ms = match_time_budget_ms
+        self.redos_policy = redos_policy
+        self.scoring = scoring
+        self.top_k = max(top_k, 1)
+        self.adaptive_order = adaptive_order
+        self.reorder_interval = max(reorder_interval, 1)
+        self.fuzzy_fallback = fuzzy_fallback
+        self.fuzzy_max_distance = fuzzy_max_distance
+        self.fuzzy_vocabulary_file = fuzzy_vocabulary_file
+        self.result_cache: Optional[LRUCache] = LRUCache(cache_size) if cache_size > 0 else None
+        self._versions = itertools.count(1)
+        self._reload_lock = threading.Lock()
+        self._violations: Dict[Tuple[str, str], Dict] = {}
+        self._violations_lock = threading.Lock()
+        # Matches per intent of the published snapshot, for adaptive ordering
+        self._intent_hits: List[int] = []
+        self._hits_since_reorder = 0
+        self._order_lock = threading.Lock()
+        self._snapshot: Optional[RuleSnapshot] = None
         self.load_rules()
     
-    def load_rules(self):
-        """Load rules from YAML configuration file"""
-        try:
-            rules_path = Path(self.rules_file)
-            if not rules_path.exists():
-                logger.error(f"Rules file not found: {self.rules_file}")
-                self._load_default_rules()
-                return
-            
-            with open(rules_path, 'r', encoding='utf-8') as file:
-                rules = yaml.safe_load(file)
-                
-            self.intents = rules.get('intents', [])
-            self.fallback_responses = rules.get('fallback_responses', [])
-            self.sentiment_modifiers = rules.get('sentiment_modifiers', {})
+    @property
+    def snapshot(self) -> RuleSnapshot:
+        """Currently published rule snapshot"""
+        return self._snapshot
+    
+    @property
+    def intents(self) -> Tuple[Dict, ...]:
+        return self._snapshot.intents
+    
+    @property
+    def fallback_responses(self) -> Tuple[str, ...]:
+        return self._snapshot.fallback_responses
+    
+    @property
+    def sentiment_modifiers(self) -> Mapping[str, str]:
+        return self._snapshot.sentiment_modifiers
+    
+    @property
+    def patterns(self) -> Tuple[CompiledPattern, ...]:
+        return self._snapshot.patterns
+    
+    @property
+    def matcher(self):
+        return self._snapshot.matcher
+    
+    def build_snapshot(self) -> RuleSnapshot:
+        """
+        Read, validate and compile the rules file into a new snapshot
+        
+        Returns:
+            Unpublished rule snapshot
             
-            logger.info(f"Loaded {len(self.intents)} intents from rules file")
+        Raises:
+            FileNotFoundError: If the rules file does not exist
+            RuleValidationError: If the file is malformed or has invalid patterns
+        """
+        rules_path = Path(self.rules_file)
+        if not rules_path.exists():
+            raise FileNotFoundError(f"Rules file not found: {self.rules_file}")
+        
+        data = rules_path.read_bytes()
+        source_hash = content_hash(data)
+        
+        artifact = load_artifact(self.rules_file, source_hash, self.artifact_dir) if self.artifact_cache else None
+        if artifact is not None:
+            try:
+                snapshot = self._compile_snapshot(
+                    artifact['rules'],
+                    source=str(rules_path),
+                    source_hash=source_hash,
+                    literals=artifact['literals'],
+                    risks=artifact['risks']
+                )
+                logger.info(f"Loaded rules from compiled artifact for {rules_path}")
+                return snapshot
+            except Exception as e:
+                logger.warning(f"Compiled rules artifact is unusable ({e}); parsing YAML instead")
+        
+        rules = yaml.load(data, Loader=_YAML_LOADER)
+        if not isinstance(rules, dict):
+            raise RuleValidationError("Rules file must contain a mapping")
+        
+        snapshot = self._compile_snapshot(rules, source=str(rules_path), source_hash=source_hash)
+        if self.artifact_cache:
+            save_artifact(
+                self.rules_file,
+                source_hash,
+                rules,
+                _literal_table(snapshot.intents, snapshot.patterns),
+                _risk_table(snapshot.intents, snapshot.patterns),
+                self.artifact_dir
+            )
+        return snapshot
+    
+    def _compile_snapshot(
+        self,
+        rules: Dict,
+        source: str,
+        source_hash: str = '',
+        literals: Optional[Sequence] = None,
+        risks: Optional[Sequence] = None
+    ) -> RuleSnapshot:
+        """
+        Compile a parsed rules mapping into a snapshot
+        
+        Intents whose content hash matches one in the current snapshot reuse
+        its compiled patterns instead of being recompiled.
+        """
+        previous: Dict[str, List[CompiledPattern]] = {}
+        if self._snapshot is not None:
+            for compiled in self._snapshot.patterns:
+                previous.setdefault(compiled.intent_hash, []).append(compiled)
+        
+        intents = tuple(rules.get('intents') or [])
+        patterns = tuple(compile_patterns(
+            list(intents),
+            previous=previous,
+            literals=literals,
+            redos_policy=self.redos_policy,
+            guard_all=bool(self.match_time_budget_ms),
+            risks=risks
+        ))
+        return RuleSnapshot(
+            intents=intents,
+            fallback_responses=tuple(rules.get('fallback_responses') or []),
+            sentiment_modifiers=MappingProxyType(dict(rules.get('sentiment_modifiers') or {})),
+            patterns=patterns,
+            matcher=build_matcher(self.match_strategy, list(patterns), self.prefilter),
+            sentiment=SentimentAnalyzer.from_config(rules.get('sentiment_lexicon')),
+            version=next(self._versions),
+            source=source,
+            source_hash=source_hash,
+            priority_groups=tuple(priority_groups(intents)),
+            fuzzy=self._build_fuzzy_index(rules, patterns) if self.fuzzy_fallback else None
+        )
+    
+    def _build_fuzzy_index(self, rules: Dict, patterns: Sequence[CompiledPattern]) -> FuzzyIndex:
+        """Build the typo index, with the rules' own words and the vocabulary file as known words"""
+        vocabulary = rule_vocabulary(rules)
+        if self.fuzzy_vocabulary_file:
+            try:
+                vocabulary |= load_word_list(self.fuzzy_vocabulary_file)
+            except OSError as e:
+                logger.warning(f"Fuzzy vocabulary file unreadable ({e}); using the rules' own words only")
+        return FuzzyIndex(patterns, self.fuzzy_max_distance, vocabulary)
+    
+    def _publish(self, snapshot: RuleSnapshot):
+        """Make a snapshot visible to new requests with a single reference swap"""
+        # Carry match frequencies over to intents that still exist
+        previous_hits = {}
+        if self._snapshot is not None:
+            for intent, hits in zip(self._snapshot.intents, self._intent_hits):
+                previous_hits[intent.get('intent')] = hits
+        
+        with self._order_lock:
+            self._intent_hits = [previous_hits.get(intent.get('intent'), 0) for intent in snapshot.intents]
+            self._hits_since_reorder = 0
+        self._snapshot = snapshot
+        self._invalidate_cache()
+        if self.adaptive_order and any(self._intent_hits):
+            self.reorder(snapshot)
+    
+    def load_rules(self) -> bool:
+        """
+        Load rules from YAML configuration file
+        
+        On failure the last good snapshot stays active. Minimal default rules
+        are only used when no rules have been loaded yet.
+        
+        Returns:
+            True if the rules file was loaded and published
+        """
+        with self._reload_lock:
+            try:
+                snapshot = self.build_snapshot()
+            except Exception as e:
+                logger.error(f"Error loading rules: {e}")
+                if self._snapshot is None:
+                    self._load_default_rules()
+                else:
+                    logger.warning(f"Keeping previously loaded rules (version {self._snapshot.version})")
+                return False
             
-        except Exception as e:
-            logger.error(f"Error loading rules: {e}")
-            self._load_default_rules()
+            self._publish(snapshot)
+            logger.info(f"Loaded {len(snapshot.intents)} intents from rules file (version {snapshot.version})")
+            return True
     
     def _load_default_rules(self):
         """Load minimal default rules if file loading fails"""
-        self.intents = [
-            {
-                'intent': 'greeting',
-                'patterns': [r'\b(hi|hello|hey)\b'],
-                'responses': ['Hello! How can I help you?'],
-                'sentiment': 'positive'
-            }
-        ]
-        self.fallback_responses = ["I'm not sure I understand. Can you rephrase that?"]
-        self.sentiment_modifiers = {'positive': '😊', 'neutral': '👍'}
+        self._publish(self._compile_snapshot({
+            'intents': [
+                {
+                    'intent': 'greeting',
+                    'patterns': [r'\b(hi|hello|hey)\b'],
+                    'responses': ['Hello! How can I help you?'],
+                    'sentiment': 'positive'
+                }
+            ],
+            'fallback_responses': ["I'm not sure I understand. Can you rephrase that?"],
+            'sentiment_modifiers': {'positive': '😊', 'neutral': '👍'}
+        }, source='default'))
+    
+    def _invalidate_cache(self):
+        """Drop cached classifications made with the previous rule set"""
+        if self.result_cache is not None:
+            self.result_cache.clear()
+    
+    def get_cache_stats(self) -> Optional[Dict]:
+        """
+        Get result cache statistics
+        
+        Returns:
+            Cache statistics dictionary, or None if caching is disabled
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.stats()
+    
+    def constructor_kwargs(self) -> Dict:
+        """
+        Get the arguments needed to build an equivalent engine, e.g. in a worker process
+        
+        Returns:
+            Keyword arguments for RuleEngine()
+        """
+        return {
+            'rules_file': self.rules_file,
+            'match_strategy': self.match_strategy,
+            'prefilter': self.prefilter,
+            'cache_size': self.cache_size,
+            'artifact_cache': self.artifact_cache,
+            'artifact_dir': self.artifact_dir,
+            'match_time_budget_ms': self.match_time_budget_ms,
+            'redos_policy': self.redos_policy,
+            'scoring': self.scoring,
+            'top_k': self.top_k,
+            'adaptive_order': self.adaptive_order,
+            'reorder_interval': self.reorder_interval,
+            'fuzzy_fallback': self.fuzzy_fallback,
+            'fuzzy_max_distance': self.fuzzy_max_distance,
+            'fuzzy_vocabulary_file': self.fuzzy_vocabulary_file
+        }
     
     def preprocess_message(self, message: str) -> str:
         """
@@ -80,28 +562,94 @@ class RuleEngine:
             return ""
         return message.strip().lower()
     
-    def match_intent(self, message: str) -> Tuple[Optional[Dict], Optional[str]]:
+    def match_intent(
+        self,
+        message: str,
+        snapshot: Optional[RuleSnapshot] = None
+    ) -> Tuple[Optional[Dict], Optional[str]]:
         """
         Match user message against defined intent patterns
         
         Args:
             message: Preprocessed user message
+            snapshot: Rule snapshot to match against (defaults to the current one)
             
         Returns:
             Tuple of (matched_intent, matched_pattern) or (None, None)
+            
+        Raises:
+            MatchBudgetExceeded: If matching takes longer than match_time_budget_ms
         """
-        for intent in self.intents:
-            patterns = intent.get('patterns', [])
-            for pattern in patterns:
-                try:
-                    if re.search(pattern, message, re.IGNORECASE):
-                        logger.debug(f"Matched intent: {intent.get('intent')} with pattern: {pattern}")
-                        return intent, pattern
-                except re.error as e:
-                    logger.error(f"Invalid regex pattern '{pattern}': {e}")
-                    continue
+        snapshot = snapshot or self._snapshot
+        compiled = snapshot.matcher.match(message, self.match_time_budget_ms or None)
+        if compiled is None:
+            return None, None
         
-        return None, None
+        logger.debug(f"Matched intent: {compiled.intent_name} with pattern: {compiled.source}")
+        if self.adaptive_order and snapshot is self._snapshot:
+            self._record_hit(snapshot, compiled.intent_index)
+        return compiled.intent, compiled.source
+    
+    def _record_hit(self, snapshot: RuleSnapshot, intent_index: int):
+        """Count a match and periodically re-evaluate the evaluation order"""
+        # Unlocked increments may occasionally lose a count, which only blurs the statistics
+        hits = self._intent_hits
+        if intent_index < len(hits):
+            hits[intent_index] += 1
+        self._hits_since_reorder += 1
+        if self._hits_since_reorder >= self.reorder_interval:
+            self.reorder(snapshot)
+    
+    def reorder(self, snapshot: Optional[RuleSnapshot] = None) -> bool:
+        """
+        Evaluate frequently matched intents first within their priority groups
+        
+        Groups keep file order, so the winning intent is unchanged for rules
+        that honour the priority group contract. Frequencies are halved after
+        each reorder so the order follows changes in traffic.
+        
+        Args:
+            snapshot: Snapshot whose matcher is reordered (defaults to the current one)
+            
+        Returns:
+            True if a new evaluation order was applied
+        """
+        snapshot = snapshot or self._snapshot
+        matcher = snapshot.matcher
+        if not getattr(matcher, 'reorderable', False) or all(len(group) == 1 for group in snapshot.priority_groups):
+            return False
+        if not self._order_lock.acquire(blocking=False):
+            return False  # Another thread is already reordering
+        try:
+            if snapshot is not self._snapshot:
+                return False
+            hits = list(self._intent_hits)
+            self._intent_hits[:] = [count // 2 for count in hits]
+            self._hits_since_reorder = 0
+        finally:
+            self._order_lock.release()
+        
+        positions_by_intent: Dict[int, List[int]] = {}
+        for position, compiled in enumerate(snapshot.patterns):
+            positions_by_intent.setdefault(compiled.intent_index, []).append(position)
+        
+        order: List[int] = []
+        for group in snapshot.priority_groups:
+            # sorted() is stable, so ties keep file order
+            for intent_index in sorted(group, key=lambda index: -hits[index]):
+                order.extend(positions_by_intent.get(intent_index, ()))
+        matcher.set_order(order)
+        return True
+    
+    def get_evaluation_order(self) -> List[str]:
+        """
+        Get intent names in the order the matcher currently tries them
+        
+        Returns:
+            List of intent names
+        """
+        patterns = getattr(self._snapshot.matcher, 'evaluation_order', lambda: self._snapshot.patterns)()
+        return list(dict.fromkeys(compiled.intent_name for compiled in patterns))
     
     def get_response(self, intent: Dict) -> str:
         """
@@ -115,7 +663,7 @@ class RuleEngine:
         """
         responses = intent.get('responses', [])
         if not responses:
-            return random.choice(self.fallback_responses)
+            return self.get_fallback_response()
         
         return random.choice(responses)
     
@@ -132,7 +680,7 @@ class RuleEngine:
     
     def analyze_sentiment(self, message: str) -> str:
         """
-        Basic sentiment analysis based on keywords
+        Lexicon-based sentiment analysis using the rules file's sentiment_lexicon
         
         Args:
             message: User message
@@ -140,20 +688,89 @@ class RuleEngine:
         Returns:
             Sentiment category ('positive', 'negative', 'neutral')
         """
-        positive_keywords = ['good', 'great', 'excellent', 'happy', 'love', 'awesome', 'wonderful', 'fantastic']
-        negative_keywords = ['bad', 'terrible', 'hate', 'awful', 'poor', 'sad', 'angry', 'frustrated']
+        return self._snapshot.sentiment.analyze(message)
+    
+    def classify_message(
+        self,
+        message: str,
+        snapshot: Optional[RuleSnapshot] = None
+    ) -> Tuple[Optional[Dict], Optional[str], str, float, Tuple]:
+        """
+        Classify a preprocessed message without generating a response
         
-        message_lower = message.lower()
+        When no pattern matches and the fuzzy fallback is enabled, the intent
+        whose keywords the message most likely misspells is returned with a
+        confidence below that of a pattern match.
+        
+        Args:
+            message: Preprocessed user message
+            snapshot: Rule snapshot to classify against (defaults to the current one)
+            
+        Returns:
+            Tuple of (matched_intent, matched_pattern, sentiment, confidence, alternates),
+            where alternates holds (intent_name, matched_pattern, confidence) for the
+            runner-up intents in ranked mode and is empty otherwise
+            
+        Raises:
+            MatchBudgetExceeded: If matching takes longer than match_time_budget_ms
+        """
+        snapshot = snapshot or self._snapshot
+        alternates: Tuple = ()
+        if self.scoring == 'ranked':
+            ranked = self.rank_intents(message, snapshot)
+            if ranked:
+                best, confidence = ranked[0]
+                matched_intent, matched_pattern = best.intent, best.source
+                alternates = tuple(
+                    (compiled.intent_name, compiled.source, round(score, 3))
+                    for compiled, score in ranked[1:]
+                )
+                confidence = round(confidence, 3)
+            else:
+                matched_intent, matched_pattern = None, None
+        else:
+            matched_intent, matched_pattern = self.match_intent(message, snapshot)
+            confidence = 0.95  # High confidence for direct pattern match
         
-        positive_count = sum(1 for word in positive_keywords if word in message_lower)
-        negative_count = sum(1 for word in negative_keywords if word in message_lower)
+        if not matched_intent and snapshot.fuzzy is not None:
+            fuzzy_match = snapshot.fuzzy.match(message)
+            if fuzzy_match:
+                compiled, confidence = fuzzy_match
+                matched_intent, matched_pattern = compiled.intent, compiled.source
+                logger.debug(f"Fuzzy matched intent: {compiled.intent_name} with pattern: {compiled.source}")
         
-        if positive_count > negative_count:
-            return 'positive'
-        elif negative_count > positive_count:
-            return 'negative'
+        if matched_intent:
+            sentiment = matched_intent.get('sentiment', 'neutral')
         else:
-            return 'neutral'
+            sentiment = snapshot.sentiment.analyze(message)
+            confidence = 0.3  # Low confidence for fallback
+        
+        return matched_intent, matched_pattern, sentiment, confidence, alternates
+    
+    def rank_intents(
+        self,
+        message: str,
+        snapshot: Optional[RuleSnapshot] = None
+    ) -> List[Tuple[CompiledPattern, float]]:
+        """
+        Score every intent matching the message
+        
+        Uses the same compiled patterns and literal prefilter as first-match
+        mode, but evaluates all candidate patterns instead of stopping early.
+        
+        Args:
+            message: Preprocessed user message
+            snapshot: Rule snapshot to match against (defaults to the current one)
+            
+        Returns:
+            Up to top_k (best matching pattern, score) pairs, best first
+            
+        Raises:
+            MatchBudgetExceeded: If matching takes longer than match_time_budget_ms
+        """
+        snapshot = snapshot or self._snapshot
+        matches = snapshot.matcher.match_all(message, self.match_time_budget_ms or None)
+        return rank_matches(matches, len(message), len(snapshot.intents), self.top_k)
     
     def process_message(self, message: str) -> Dict:
         """
@@ -169,37 +786,180 @@ class RuleEngine:
         processed_msg = self.preprocess_message(message)
         
         if not processed_msg:
-            return {
-                'response': 'Please say something! 😊',
-                'intent': None,
-                'sentiment': 'neutral',
-                'matched_pattern': None,
-                'confidence': 0.0
-            }
-        
-        # Match intent
-        matched_intent, matched_pattern = self.match_intent(processed_msg)
-        
-        # Generate response
+            return self._empty_result()
+        
+        return self._build_result(self._classify_cached(processed_msg, self._snapshot))
+    
+    def _empty_result(self) -> Dict:
+        """Result returned for blank messages"""
+        return {
+            'response': 'Please say something! 😊',
+            'intent': None,
+            'sentiment': 'neutral',
+            'matched_pattern': None,
+            'confidence': 0.0,
+            'alternates': []
+        }
+    
+    def _classify_cached(self, processed_msg: str, snapshot: RuleSnapshot) -> Tuple:
+        """Classify a preprocessed message, reusing the cached result for a message seen before"""
+        if self.result_cache is None:
+            return self._classify_within_budget(processed_msg, snapshot)[0]
+        
+        # Keyed by version so an in-flight request can't cache results from a replaced snapshot
+        key = (snapshot.version, processed_msg)
+        classification = self.result_cache.get(key)
+        if classification is None:
+            classification, complete = self._classify_within_budget(processed_msg, snapshot)
+            if complete:
+                self.result_cache.put(key, classification)
+        return classification
+    
+    def _classify_within_budget(self, processed_msg: str, snapshot: RuleSnapshot) -> Tuple[Tuple, bool]:
+        """
+        Classify a message, answering with the fallback when matching runs over budget
+        
+        Returns:
+            Tuple of (classification, whether matching completed)
+        """
+        try:
+            return self.classify_message(processed_msg, snapshot), True
+        except MatchBudgetExceeded as e:
+            self._record_violation(e)
+            logger.warning(f"{e}; answering with fallback")
+            return (None, None, snapshot.sentiment.analyze(processed_msg), 0.0, ()), False
+    
+    def _record_violation(self, error: MatchBudgetExceeded):
+        """Count a time budget violation against the pattern that was running"""
+        compiled = error.pattern
+        intent_name = compiled.intent_name if compiled is not None else None
+        source = compiled.source if compiled is not None else None
+        with self._violations_lock:
+            entry = self._violations.get((intent_name, source))
+            if entry is None:
+                entry = self._violations[(intent_name, source)] = {
+                    'intent': intent_name,
+                    'pattern': source,
+                    'count': 0,
+                    'max_ms': 0.0,
+                    'last_seen': None
+                }
+            entry['count'] += 1
+            entry['max_ms'] = max(entry['max_ms'], round(error.elapsed_ms, 3))
+            entry['last_seen'] = time.time()
+    
+    def get_budget_violations(self) -> List[Dict]:
+        """
+        Get match time budget violations per pattern since startup
+        
+        Returns:
+            List of dictionaries with intent, pattern, count, max_ms and
+            last_seen (epoch seconds), most frequent first
+        """
+        with self._violations_lock:
+            entries = [dict(entry) for entry in self._violations.values()]
+        return sorted(entries, key=lambda entry: entry['count'], reverse=True)
+    
+    def drain_budget_violations(self) -> List[Dict]:
+        """
+        Get the budget violations recorded since the last drain and forget them
+        
+        Used by process pool workers to report violations to the parent.
+        
+        Returns:
+            List of violation dictionaries as returned by get_budget_violations
+        """
+        with self._violations_lock:
+            if not self._violations:
+                return []
+            entries = list(self._violations.values())
+            self._violations = {}
+        return entries
+    
+    def merge_budget_violations(self, entries: List[Dict]):
+        """
+        Add budget violations recorded by another copy of this engine
+        
+        Args:
+            entries: Violation dictionaries as returned by drain_budget_violations
+        """
+        with self._violations_lock:
+            for reported in entries:
+                key = (reported['intent'], reported['pattern'])
+                entry = self._violations.get(key)
+                if entry is None:
+                    self._violations[key] = dict(reported)
+                    continue
+                entry['count'] += reported['count']
+                entry['max_ms'] = max(entry['max_ms'], reported['max_ms'])
+                entry['last_seen'] = max(entry['last_seen'] or 0, reported['last_seen'] or 0) or None
+    
+    def get_redos_risks(self) -> List[Dict]:
+        """
+        Get the loaded patterns flagged as prone to catastrophic backtracking
+        
+        Returns:
+            List of dictionaries with intent, pattern and risks
+        """
+        return [
+            {'intent': compiled.intent_name, 'pattern': compiled.source, 'risks': list(compiled.risks)}
+            for compiled in self._snapshot.patterns
+            if compiled.risks
+        ]
+    
+    def _build_result(self, classification: Tuple) -> Dict:
+        """Turn a classification into a result dictionary with a freshly drawn response"""
+        matched_intent, matched_pattern, sentiment, confidence, alternates = classification
+        
+        # Generate response (drawn per call so cached messages still vary)
         if matched_intent:
             response = self.get_response(matched_intent)
             intent_name = matched_intent.get('intent', 'unknown')
-            sentiment = matched_intent.get('sentiment', 'neutral')
-            confidence = 0.95  # High confidence for direct pattern match
         else:
             response = self.get_fallback_response()
             intent_name = 'fallback'
-            sentiment = self.analyze_sentiment(processed_msg)
-            confidence = 0.3  # Low confidence for fallback
         
         return {
             'response': response,
             'intent': intent_name,
             'sentiment': sentiment,
             'matched_pattern': matched_pattern,
-            'confidence': confidence
+            'confidence': confidence,
+            'alternates': [
+                {'intent': intent, 'matched_pattern': pattern, 'confidence': score}
+                for intent, pattern, score in alternates
+            ]
         }
     
+    def process_batch(self, messages: List[str]) -> List[Dict]:
+        """
+        Process many messages against the same loaded rule set
+        
+        Each distinct normalized message is classified once per batch, even
+        when the result cache is disabled.
+        
+        Args:
+            messages: Raw user messages
+            
+        Returns:
+            List of result dictionaries in input order, as returned by process_message
+        """
+        snapshot = self._snapshot
+        classified: Dict[str, Tuple] = {}
+        results = []
+        for message in messages:
+            processed_msg = self.preprocess_message(message)
+            if not processed_msg:
+                results.append(self._empty_result())
+                continue
+            
+            classification = classified.get(processed_msg)
+            if classification is None:
+                classification = self._classify_cached(processed_msg, snapshot)
+                classified[processed_msg] = classification
+            results.append(self._build_result(classification))
+        return results
+    
     def get_available_intents(self) -> List[str]:
         """
         Get list of all available intent names
@@ -209,7 +969,12 @@ class RuleEngine:
         """
         return [intent.get('intent', 'unknown') for intent in self.intents]
     
-    def reload_rules(self):
-        """Reload rules from file (useful for dynamic updates)"""
+    def reload_rules(self) -> bool:
+        """
+        Reload rules from file (useful for dynamic updates)
+        
+        Returns:
+            True if the new rules were published, False if the previous ones were kept
+        """
         logger.info("Reloading rules...")
-        self.load_rules()
+        return self.load_rules()
@@ -0,0 +1,83 @@
+"""
+Rules File Watcher
+Polls the rules file and hot-reloads the rule engine when it changes
+"""
+import os
+import logging
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RulesFileWatcher:
+    """
+    Background thread that reloads a RuleEngine when its rules file changes
+
+    Reloads run on the watcher thread, so snapshots are built off the
+    request path and published atomically by the engine.
+    """
+
+    def __init__(self, engine, interval: float = 2.0):
+        """
+        Initialize the watcher
+
+        Args:
+            engine: RuleEngine whose rules_file is watched
+            interval: Polling interval in seconds
+        """
+        self.engine = engine
+        self.interval = interval
+        self._signature = self._stat()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        """Get the (mtime, size) signature of the rules file, or None if it is missing"""
+        try:
+            stat = os.stat(self.engine.rules_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """
+        Reload the rules if the file changed since the last check
+
+        Returns:
+            True if a reload was attempted
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+
+        # Remember the signature even if the reload fails, so a broken file
+        # is only retried after it is edited again
+        self._signature = signature
+        logger.info(f"Rules file changed: {self.engine.rules_file}")
+        self.engine.reload_rules()
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Rules watcher error: {e}")
+
+    def start(self):
+        """Start polling in a daemon thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rules-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching rules file every {self.interval}s: {self.engine.rules_file}")
+
+    def stop(self):
+        """Stop polling and wait for the thread to exit"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
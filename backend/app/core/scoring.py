@@ -0,0 +1,84 @@
+"""
+Intent Scoring
+Ranks every matching intent by match coverage, pattern specificity and
+intent priority
+"""
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from app.core.rule_engine import CompiledPattern
+
+# Relative weight of each component in the final score (they sum to 1)
+COVERAGE_WEIGHT = 0.5
+SPECIFICITY_WEIGHT = 0.3
+PRIORITY_WEIGHT = 0.2
+
+# A pattern whose longest required literal has this many characters is fully specific
+SPECIFIC_LITERAL_LENGTH = 8
+
+
+def specificity(compiled: 'CompiledPattern') -> float:
+    """
+    How specific a pattern is, from the longest literal it requires
+
+    Returns:
+        Value in [0, 1]; 0 for patterns that require no literal text
+    """
+    if not compiled.literals:
+        return 0.0
+    longest = max(len(literal) for literal in compiled.literals)
+    return min(longest / SPECIFIC_LITERAL_LENGTH, 1.0)
+
+
+def score_match(compiled: 'CompiledPattern', span: Tuple[int, int], message_length: int, intent_count: int) -> float:
+    """
+    Score one pattern match
+
+    Args:
+        compiled: Matching compiled pattern
+        span: (start, end) of the match in the message
+        message_length: Length of the preprocessed message
+        intent_count: Number of intents in the rule set
+
+    Returns:
+        Score in [0, 1]
+    """
+    coverage = (span[1] - span[0]) / message_length if message_length else 0.0
+    # Intents listed earlier in the rules file take precedence
+    priority = 1.0 - compiled.intent_index / intent_count if intent_count else 1.0
+    return (
+        COVERAGE_WEIGHT * min(coverage, 1.0)
+        + SPECIFICITY_WEIGHT * specificity(compiled)
+        + PRIORITY_WEIGHT * priority
+    )
+
+
+def rank_matches(
+    matches: Sequence[Tuple['CompiledPattern', Tuple[int, int]]],
+    message_length: int,
+    intent_count: int,
+    top_k: int
+) -> List[Tuple['CompiledPattern', float]]:
+    """
+    Rank intents by the score of their best matching pattern
+
+    Args:
+        matches: (compiled pattern, match span) for every pattern that matched,
+            in evaluation order
+        message_length: Length of the preprocessed message
+        intent_count: Number of intents in the rule set
+        top_k: Maximum number of intents to return
+
+    Returns:
+        Up to top_k (best pattern, score) pairs, one per intent, best first;
+        ties keep evaluation order
+    """
+    best: Dict[int, Tuple['CompiledPattern', float]] = {}
+    for compiled, span in matches:
+        score = score_match(compiled, span, message_length, intent_count)
+        current = best.get(compiled.intent_index)
+        if current is None or score > current[1]:
+            best[compiled.intent_index] = (compiled, score)
+
+    ranked = sorted(best.values(), key=lambda item: (-item[1], item[0].intent_index))
+    return ranked[:top_k]
@@ -0,0 +1,151 @@
+"""
+Lexicon Sentiment Analyzer
+Tokenizes a message once and scores the tokens against a weighted lexicon
+with negation handling
+"""
+import re
+import logging
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lexicon used when the rules file has no sentiment_lexicon section
+DEFAULT_LEXICON = {
+    'positive': {
+        'good': 1.0, 'great': 1.0, 'excellent': 1.0, 'happy': 1.0,
+        'love': 1.0, 'awesome': 1.0, 'wonderful': 1.0, 'fantastic': 1.0
+    },
+    'negative': {
+        'bad': 1.0, 'terrible': 1.0, 'hate': 1.0, 'awful': 1.0,
+        'poor': 1.0, 'sad': 1.0, 'angry': 1.0, 'frustrated': 1.0
+    },
+    'negations': ['not', 'no', 'never', 'none', 'nothing', 'neither', 'nor', 'cannot'],
+    'negation_window': 3
+}
+
+# Words, plus clause punctuation that ends a negation's scope
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[.,;:!?]")
+_CLAUSE_BREAKS = frozenset('.,;:!?')
+
+
+class SentimentAnalyzer:
+    """
+    Token-based sentiment scorer
+
+    Positive words add their weight and negative words subtract it. A
+    negation word flips the polarity of the next few words until the end
+    of the clause.
+    """
+
+    def __init__(
+        self,
+        weights: Dict[str, float],
+        negations: Iterable[str] = (),
+        negation_window: int = 3
+    ):
+        """
+        Initialize the analyzer
+
+        Args:
+            weights: Signed weight per lowercase token (positive > 0, negative < 0)
+            negations: Tokens that flip the polarity of the following words
+            negation_window: Number of tokens a negation applies to
+        """
+        self.weights = dict(weights)
+        self.negations: FrozenSet[str] = frozenset(negations)
+        self.negation_window = negation_window
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'SentimentAnalyzer':
+        """
+        Build an analyzer from a rules file sentiment_lexicon section
+
+        Args:
+            config: Mapping with 'positive' and 'negative' word lists or
+                word-to-weight mappings, optional 'negations' and 'negation_window'
+
+        Returns:
+            SentimentAnalyzer instance
+        """
+        config = config or DEFAULT_LEXICON
+
+        weights: Dict[str, float] = {}
+        for polarity, sign in (('positive', 1.0), ('negative', -1.0)):
+            words = config.get(polarity) or {}
+            if not isinstance(words, dict):
+                words = {word: 1.0 for word in words}
+            for word, weight in words.items():
+                weights[str(word).lower()] = sign * abs(float(weight))
+
+        negations = config.get('negations', DEFAULT_LEXICON['negations'])
+        window = int(config.get('negation_window', DEFAULT_LEXICON['negation_window']))
+        return cls(weights, (str(word).lower() for word in negations), window)
+
+    def score(self, message: str) -> float:
+        """
+        Compute the signed sentiment score of a message
+
+        Args:
+            message: User message
+
+        Returns:
+            Sum of token weights, negated inside negation scopes
+        """
+        weights = self.weights
+        negations = self.negations
+        window = self.negation_window
+        total = 0.0
+        negated = 0
+        for token in _TOKEN.findall(message.lower()):
+            weight = weights.get(token)
+            if weight is not None:
+                total += -weight if negated else weight
+                if negated:
+                    negated -= 1
+            elif token in negations or token.endswith("n't"):
+                negated = window
+            elif token in _CLAUSE_BREAKS:
+                negated = 0
+            elif negated:
+                negated -= 1
+        return total
+
+    @staticmethod
+    def label(score: float) -> str:
+        """Map a score to a sentiment category"""
+        if score > 0:
+            return 'positive'
+        elif score < 0:
+            return 'negative'
+        return 'neutral'
+
+    def analyze(self, message: str) -> str:
+        """
+        Classify the sentiment of a message
+
+        Args:
+            message: User message
+
+        Returns:
+            Sentiment category ('positive', 'negative', 'neutral')
+        """
+        return self.label(self.score(message))
+
+    def analyze_batch(self, messages: Iterable[str]) -> List[str]:
+        """
+        Classify many messages, scoring each distinct text only once
+
+        Args:
+            messages: User messages
+
+        Returns:
+            Sentiment categories in input order
+        """
+        seen: Dict[str, str] = {}
+        results = []
+        for message in messages:
+            sentiment = seen.get(message)
+            if sentiment is None:
+                sentiment = seen[message] = self.label(self.score(message or ''))
+            results.append(sentiment)
+        return results
@@ -0,0 +1,249 @@
+"""
+Multi-Tenant Rule Sets
+Loads one RuleEngine per tenant rules file on first use and evicts the
+least recently used tenants when their estimated memory exceeds a cap
+"""
+import re
+import sys
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.core.cache import LRUCache
+from app.core.rule_engine import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+# Tenant names double as file names, so keep them to a safe alphabet
+_TENANT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+_RULES_SUFFIXES = ('.yaml', '.yml')
+
+# Rough per-object overheads used by the memory estimate (bytes)
+_PATTERN_OVERHEAD = 400
+_CACHE_ENTRY_OVERHEAD = 300
+_PARSED_YAML_FACTOR = 4
+
+
+class UnknownTenantError(KeyError):
+    """Raised when a tenant name is invalid or has no rules file"""
+
+
+class TenantRulesError(ValueError):
+    """Raised when a tenant's rules file cannot be loaded"""
+
+
+def estimate_engine_bytes(engine: RuleEngine) -> int:
+    """
+    Estimate the memory held by a loaded engine
+
+    Counts compiled regex objects and sources, a fixed overhead per pattern
+    for the table and prefilter index, the parsed rules (from the file size)
+    and the result cache at full size.
+
+    Args:
+        engine: Loaded rule engine
+
+    Returns:
+        Estimated size in bytes
+    """
+    total = 0
+    for compiled in engine.patterns:
+        total += sys.getsizeof(compiled.regex) + sys.getsizeof(compiled.source) + _PATTERN_OVERHEAD
+    try:
+        total += Path(engine.rules_file).stat().st_size * _PARSED_YAML_FACTOR
+    except OSError:
+        pass
+    total += engine.cache_size * _CACHE_ENTRY_OVERHEAD
+    return total
+
+
+class RuleSetRegistry:
+    """
+    Per-tenant rule engines loaded from <directory>/<tenant>.yaml
+
+    Engines are compiled on first use, kept in least-recently-used order and
+    evicted once the estimated memory of all loaded tenants exceeds the cap.
+    Reloading one tenant builds and publishes a new snapshot for that engine
+    only; other tenants' compiled state is untouched.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        engine_kwargs: Optional[Dict] = None,
+        max_memory_mb: float = 256,
+        session_capacity: int = 100_000
+    ):
+        """
+        Initialize the registry
+
+        Args:
+            directory: Directory holding one YAML rules file per tenant
+            engine_kwargs: RuleEngine arguments shared by all tenants (besides rules_file)
+            max_memory_mb: Estimated memory cap for all loaded tenants
+            session_capacity: Number of session-to-tenant bindings remembered
+        """
+        self.directory = Path(directory)
+        self.engine_kwargs = dict(engine_kwargs or {})
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self._engines: 'OrderedDict[str, RuleEngine]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._sessions = LRUCache(session_capacity)
+        self.loads = 0
+        self.evictions = 0
+
+    def rules_file(self, tenant: str) -> Path:
+        """
+        Locate a tenant's rules file
+
+        Raises:
+            UnknownTenantError: If the name is invalid or no rules file exists
+        """
+        if not tenant or not _TENANT_NAME.match(tenant):
+            raise UnknownTenantError(tenant)
+        for suffix in _RULES_SUFFIXES:
+            path = self.directory / f"{tenant}{suffix}"
+            if path.is_file():
+                return path
+        raise UnknownTenantError(tenant)
+
+    def available(self) -> List[str]:
+        """Names of all tenants with a rules file"""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            path.stem for path in self.directory.iterdir()
+            if path.suffix in _RULES_SUFFIXES and _TENANT_NAME.match(path.stem)
+        )
+
+    def is_loaded(self, tenant: str) -> bool:
+        """Whether a tenant's engine is currently in memory"""
+        return tenant in self._engines
+
+    def get(self, tenant: str) -> RuleEngine:
+        """
+        Get a tenant's engine, loading and compiling it on first use
+
+        Args:
+            tenant: Tenant name
+
+        Returns:
+            Loaded RuleEngine
+
+        Raises:
+            UnknownTenantError: If the tenant has no rules file
+            TenantRulesError: If the tenant's rules file is invalid
+        """
+        with self._lock:
+            engine = self._engines.get(tenant)
+            if engine is not None:
+                self._engines.move_to_end(tenant)
+                return engine
+
+        rules_file = self.rules_file(tenant)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(tenant, threading.Lock())
+
+        # One thread compiles a tenant; concurrent requests for it wait here
+        with load_lock:
+            with self._lock:
+                engine = self._engines.get(tenant)
+                if engine is not None:
+                    self._engines.move_to_end(tenant)
+                    return engine
+
+            engine = RuleEngine(str(rules_file), **self.engine_kwargs)
+            # A first load that fails publishes the built-in default rules; never serve those as the tenant's
+            if engine.snapshot.source == 'default':
+                raise TenantRulesError(f"Rules file for tenant '{tenant}' could not be loaded: {rules_file}")
+            size = estimate_engine_bytes(engine)
+            with self._lock:
+                self._engines[tenant] = engine
+                self._sizes[tenant] = size
+                self.loads += 1
+                self._evict_over_cap(keep=tenant)
+            logger.info(f"Loaded rules for tenant '{tenant}' ({len(engine.intents)} intents, ~{size // 1024} KiB)")
+            return engine
+
+    def _evict_over_cap(self, keep: str):
+        """Evict least recently used tenants until under the memory cap (caller holds the lock)"""
+        while sum(self._sizes.values()) > self.max_memory_bytes and len(self._engines) > 1:
+            tenant = next(iter(self._engines))
+            if tenant == keep:
+                break
+            self._engines.pop(tenant)
+            self._sizes.pop(tenant, None)
+            self.evictions += 1
+            logger.info(f"Evicted rules for tenant '{tenant}' (memory cap {self.max_memory_bytes // 1024} KiB)")
+
+    def evict(self, tenant: str) -> bool:
+        """
+        Drop a tenant's engine from memory
+
+        Returns:
+            True if it was loaded
+        """
+        with self._lock:
+            self._sizes.pop(tenant, None)
+            return self._engines.pop(tenant, None) is not None
+
+    def reload(self, tenant: str) -> bool:
+        """
+        Reload one tenant's rules without touching other tenants
+
+        A tenant that is not loaded is simply loaded on its next use.
+
+        Returns:
+            True if the new rules were published (or the tenant is not loaded)
+
+        Raises:
+            UnknownTenantError: If the tenant has no rules file
+        """
+        self.rules_file(tenant)
+        with self._lock:
+            engine = self._engines.get(tenant)
+        if engine is None:
+            return True
+        reloaded = engine.reload_rules()
+        with self._lock:
+            if tenant in self._engines:
+                self._sizes[tenant] = estimate_engine_bytes(engine)
+                self._evict_over_cap(keep=tenant)
+        return reloaded
+
+    def bind_session(self, session_id: str, tenant: str):
+        """Remember which tenant a session belongs to ('' for the default rules)"""
+        self._sessions.put(session_id, tenant)
+
+    def tenant_for_session(self, session_id: Optional[str]) -> Optional[str]:
+        """
+        Tenant a session was bound to, if remembered
+
+        The bindings are a cache of the conversation rows' tenant column;
+        None means the binding is not in memory, '' the default rules.
+        """
+        if not session_id:
+            return None
+        return self._sessions.get(session_id)
+
+    def stats(self) -> Dict:
+        """
+        Get registry statistics
+
+        Returns:
+            Dictionary with loaded tenants and their estimated sizes, the cap,
+            and load/eviction counters
+        """
+        with self._lock:
+            sizes = {tenant: self._sizes.get(tenant, 0) for tenant in self._engines}
+        return {
+            'loaded': list(sizes),
+            'estimated_bytes': sizes,
+            'total_estimated_bytes': sum(sizes.values()),
+            'max_memory_bytes': self.max_memory_bytes,
+            'loads': self.loads,
+            'evictions': self.evictions
+        }
@@ -3,11 +3,16 @@ FastAPI Application Entry Point
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 import logging
 from app.core.config import settings
-from app.core.database import init_db
-from app.api.endpoints import router
+from app.core.database import close_db, init_db
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.rules_watcher import RulesFileWatcher
+from app.api.endpoints import (
+    router, rule_engine, rule_executor, chat_writer, archive_job, session_registry, register_rules
+)
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +21,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+metrics.configure(
+    enabled=settings.METRICS_ENABLED,
+    directory=settings.METRICS_DIR,
+    flush_interval=settings.METRICS_FLUSH_INTERVAL
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -24,9 +35,29 @@ async def lifespan(app: FastAPI):
     logger.info("Starting application...")
     await init_db()
     logger.info("Database initialized")
+    await register_rules(rule_engine)
+    if settings.SESSION_VALIDATION:
+        await session_registry.load()
+    session_registry.start()
+    rule_executor.start()
+    chat_writer.start()
+    archive_job.start()
+    watcher = None
+    if settings.RULES_WATCH:
+        watcher = RulesFileWatcher(rule_engine, interval=settings.RULES_WATCH_INTERVAL)
+        watcher.start()
     yield
     # Shutdown
     logger.info("Shutting down application...")
+    if watcher is not None:
+        watcher.stop()
+    await archive_job.stop()
+    await session_registry.stop()
+    # Commit chat turns still queued by write-behind persistence
+    await chat_writer.stop()
+    rule_executor.shutdown()
+    await close_db()
+    metrics.close()
 
 
 # Create FastAPI application
@@ -49,6 +80,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count requests and latency per route
+app.add_middleware(MetricsMiddleware)
+
 # Include API routes
 app.include_router(router, prefix="/api/v1", tags=["chatbot"])
 
@@ -63,6 +97,12 @@ async def root():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    """Metrics of all worker processes in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/ping")
 async def ping():
     """Simple ping endpoint for connectivity checks"""
@@ -1,9 +1,12 @@
 """
 Database Models for Conversation History
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import (
+    Column, Integer, BigInteger, SmallInteger, String, Date, DateTime, Text, Boolean, Index, UniqueConstraint
+)
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
+import hashlib
 
 Base = declarative_base()
 
@@ -11,24 +14,36 @@ Base = declarative_base()
 class Conversation(Base):
     """Conversation session model"""
     __tablename__ = "conversations"
+    # Finds the active sessions that went idle (see SessionRegistry)
+    __table_args__ = (
+        Index('ix_conversations_active_updated', 'is_active', 'updated_at'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(255), unique=True, index=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Tenant whose rules answer the session (see RuleSetRegistry), None for the default rules
+    tenant = Column(String(64), nullable=True)
 
 
 class Message(Base):
     """Message model for chat history"""
     __tablename__ = "messages"
+    # History is read per session in (timestamp, id) order; the composite index
+    # also serves every lookup by session_id alone
+    __table_args__ = (
+        Index('ix_messages_session_timestamp_id', 'session_id', 'timestamp', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String(255), index=True, nullable=False)
+    session_id = Column(String(255), nullable=False)
     message = Column(Text, nullable=False)
     is_user = Column(Boolean, nullable=False)
-    intent = Column(String(100), nullable=True)
-    sentiment = Column(String(50), nullable=True)
+    # References to intent_names and sentiment_labels (see RuleCatalog)
+    intent_id = Column(Integer, nullable=True)
+    sentiment_id = Column(SmallInteger, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 
@@ -38,7 +53,90 @@ class Analytics(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(255), index=True)
-    intent = Column(String(100), nullable=True)
-    matched_pattern = Column(Text, nullable=True)
+    # References to intent_names, rule_patterns (None for fallbacks) and rule_versions
+    intent_id = Column(Integer, nullable=True)
+    pattern_id = Column(Integer, nullable=True)
+    rule_version_id = Column(Integer, nullable=True)
     response_time_ms = Column(Integer)
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+
+class RuleVersion(Base):
+    """A rules file version that classified stored messages, identified by its content hash"""
+    __tablename__ = "rule_versions"
+    
+    id = Column(Integer, primary_key=True)
+    source_hash = Column(String(64), unique=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IntentName(Base):
+    """Dictionary of intent names referenced by messages and analytics"""
+    __tablename__ = "intent_names"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+
+
+class SentimentLabel(Base):
+    """Dictionary of sentiment labels referenced by messages"""
+    __tablename__ = "sentiment_labels"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)
+
+
+def pattern_hash(source: str) -> str:
+    """Key of a pattern source in the rule_patterns dictionary"""
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+class RulePattern(Base):
+    """Dictionary of matched patterns, one row per intent and pattern source"""
+    __tablename__ = "rule_patterns"
+    __table_args__ = (
+        UniqueConstraint('intent_id', 'source_hash', name='uq_rule_patterns_intent_source'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    intent_id = Column(Integer, nullable=False)
+    # sha1 of the source, so long regexes are not compared or indexed in full
+    source_hash = Column(String(40), nullable=False)
+    source = Column(Text, nullable=False)
+    # Rules version the pattern was first seen in
+    version_id = Column(Integer, nullable=True)
+
+
+class AnalyticsRollup(Base):
+    """Running analytics totals per session and intent, updated with every Analytics insert"""
+    __tablename__ = "analytics_rollups"
+    
+    session_id = Column(String(255), primary_key=True)
+    # Analytics rows without an intent are counted under 'unknown'
+    intent = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_response_time_ms = Column(BigInteger, nullable=False, default=0)
+    max_response_time_ms = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AnalyticsBucket(Base):
+    """Global analytics counter for one metric in one minute or hour, across all sessions"""
+    __tablename__ = "analytics_buckets"
+    
+    granularity = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    # interactions, fallbacks, response_time_ms (sum), intent (per label) or latency_ms (per upper bound)
+    metric = Column(String(32), primary_key=True)
+    label = Column(String(100), primary_key=True, default='')
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class ArchivedDay(Base):
+    """Days of a session whose rows were moved to archive segments"""
+    __tablename__ = "archived_days"
+    
+    session_id = Column(String(255), primary_key=True)
+    day = Column(Date, primary_key=True)
+    messages = Column(Integer, nullable=False, default=0)
+    analytics = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,337 @@
+"""
+Chat History Archival
+Moves old messages and analytics out of the database into gzip-compressed
+per-day segment files, and reads them back for sessions that ask for them
+"""
+import os
+import gzip
+import json
+import zlib
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from app.services.conversation_service import ConversationService
+
+logger = logging.getLogger(__name__)
+
+# Kinds of archived rows (one sub-directory each)
+ARCHIVE_KINDS = ('messages', 'analytics')
+
+# Sessions are spread over this many shard directories per day; a session's
+# rows are always in one shard. Changing it hides existing sharded segments.
+ARCHIVE_SHARDS = 256
+
+_SEGMENT_SUFFIX = '.ndjson.gz'
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive {type(value).__name__}")
+
+
+class ArchiveStore:
+    """
+    Segment files under <directory>/<kind>/<YYYY-MM-DD>/<shard>/
+
+    Each archival batch writes one gzip-compressed NDJSON segment per day and
+    session shard it covers, named after the first and last row id. Reading
+    a session only opens its own shard, so the cost depends on the sessions
+    sharing it rather than on everything archived that day. Segments are
+    written to a temporary file and renamed into place, so readers never see
+    partial files. A row may briefly exist both in the database and in a
+    segment if the job stops between the two; readers drop duplicate ids.
+    Segments written before sharding (directly in the day directory) are
+    still read.
+    """
+
+    def __init__(self, directory: str, compress_level: int = 6):
+        """
+        Initialize the store
+
+        Args:
+            directory: Root directory of the segments
+            compress_level: gzip compression level (1-9)
+        """
+        self.directory = Path(directory)
+        self.compress_level = compress_level
+
+    def _day_dir(self, kind: str, day: date) -> Path:
+        if kind not in ARCHIVE_KINDS:
+            raise ValueError(f"Unknown archive kind '{kind}'")
+        return self.directory / kind / day.isoformat()
+
+    @staticmethod
+    def shard(session_id: str) -> str:
+        """Shard directory name of a session"""
+        return f"{zlib.crc32(session_id.encode('utf-8')) % ARCHIVE_SHARDS:03d}"
+
+    def _segments(self, kind: str, day: date, session_id: Optional[str] = None) -> List[Path]:
+        """Segments of a day, or only those that can hold a session's rows"""
+        folder = self._day_dir(kind, day)
+        if not folder.is_dir():
+            return []
+        pattern = f"{self.shard(session_id)}/*{_SEGMENT_SUFFIX}" if session_id else f"*/*{_SEGMENT_SUFFIX}"
+        # Unsharded segments from before sharding hold every session
+        return sorted(folder.glob(f"*{_SEGMENT_SUFFIX}")) + sorted(folder.glob(pattern))
+
+    def _write(self, path: Path, rows: Iterable[Dict]):
+        """Atomically replace a segment file with the given rows"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(path.name + '.tmp')
+        with open(temporary, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=self.compress_level) as segment:
+                for row in rows:
+                    segment.write(json.dumps(row, default=_encode).encode() + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temporary, path)
+
+    @staticmethod
+    def _read(path: Path) -> List[Dict]:
+        with gzip.open(path, 'rt', encoding='utf-8') as segment:
+            rows = [json.loads(line) for line in segment if line.strip()]
+        for row in rows:
+            row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        return rows
+
+    def write_segment(self, kind: str, day: date, rows: List[Dict]) -> List[Path]:
+        """
+        Write rows from the same day, one segment per session shard
+
+        Args:
+            kind: 'messages' or 'analytics'
+            day: Day the rows' timestamps fall on
+            rows: Column dictionaries in id order
+
+        Returns:
+            Paths of the segments
+        """
+        shards: Dict[str, List[Dict]] = {}
+        for row in rows:
+            shards.setdefault(self.shard(row['session_id']), []).append(row)
+        paths = []
+        for shard, shard_rows in sorted(shards.items()):
+            name = f"{shard_rows[0]['id']:012d}-{shard_rows[-1]['id']:012d}{_SEGMENT_SUFFIX}"
+            path = self._day_dir(kind, day) / shard / name
+            self._write(path, shard_rows)
+            paths.append(path)
+        return paths
+
+    def read_session(self, kind: str, days: Iterable[date], session_id: str) -> List[Dict]:
+        """
+        Read a session's archived rows
+
+        Args:
+            kind: 'messages' or 'analytics'
+            days: Days holding the session's rows
+            session_id: Conversation session ID
+
+        Returns:
+            Row dictionaries ordered by (timestamp, id)
+        """
+        rows: Dict[int, Dict] = {}
+        for day in days:
+            for path in self._segments(kind, day, session_id):
+                for row in self._read(path):
+                    if row['session_id'] == session_id:
+                        rows[row['id']] = row
+        return sorted(rows.values(), key=lambda row: (row['timestamp'], row['id']))
+
+    def purge_session(self, days: Iterable[date], session_id: str) -> int:
+        """
+        Remove a session's rows of every kind by rewriting the affected segments
+
+        Args:
+            days: Days holding the session's rows
+            session_id: Conversation session ID
+
+        Returns:
+            Number of rows removed
+        """
+        removed = 0
+        for day in days:
+            for kind in ARCHIVE_KINDS:
+                for path in self._segments(kind, day, session_id):
+                    rows = self._read(path)
+                    kept = [row for row in rows if row['session_id'] != session_id]
+                    if len(kept) == len(rows):
+                        continue
+                    removed += len(rows) - len(kept)
+                    if kept:
+                        self._write(path, kept)
+                    else:
+                        path.unlink()
+        return removed
+
+    def iter_rows(self, kind: str) -> Iterator[List[Dict]]:
+        """
+        Read every archived row of a kind, one segment at a time
+
+        Args:
+            kind: 'messages' or 'analytics'
+
+        Yields:
+            Rows of one segment, without ids already yielded for the same day
+        """
+        root = self.directory / kind
+        if not root.is_dir():
+            return
+        for folder in sorted(root.iterdir()):
+            if not folder.is_dir():
+                continue
+            seen = set()
+            for path in self._segments(kind, date.fromisoformat(folder.name)):
+                rows = [row for row in self._read(path) if row['id'] not in seen]
+                seen.update(row['id'] for row in rows)
+                if rows:
+                    yield rows
+
+    def stats(self) -> Dict:
+        """
+        Get archive statistics
+
+        Returns:
+            Dictionary with the number of segments and their compressed size per kind
+        """
+        stats = {}
+        for kind in ARCHIVE_KINDS:
+            segments = list((self.directory / kind).rglob(f"*{_SEGMENT_SUFFIX}"))
+            stats[kind] = {
+                'segments': len(segments),
+                'bytes': sum(path.stat().st_size for path in segments)
+            }
+        return stats
+
+
+class ArchiveJob:
+    """
+    Background task moving rows older than max_age_days into an ArchiveStore
+
+    Every interval_s it archives messages and analytics batch_size rows per
+    transaction until none older than the cutoff remain. Session rollups and
+    global time buckets are kept, so analytics endpoints are unaffected.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        store: ArchiveStore,
+        max_age_days: float = 30,
+        interval_s: float = 3600,
+        batch_size: int = 5000,
+        on_archived: Optional[Callable[[datetime], None]] = None,
+        read_session_factory=None
+    ):
+        """
+        Initialize the job
+
+        Args:
+            session_factory: Callable returning an AsyncSession context manager
+            store: Archive receiving the rows
+            max_age_days: Age after which rows are archived (0 disables the job)
+            interval_s: Seconds between archival runs
+            batch_size: Rows moved per transaction
+            on_archived: Called with the cutoff after messages were archived
+            read_session_factory: Session factory for selecting the rows
+                (defaults to session_factory)
+        """
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.store = store
+        self.max_age = timedelta(days=max_age_days)
+        self.interval_s = max(interval_s, 1)
+        self.batch_size = max(batch_size, 1)
+        self.on_archived = on_archived
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+        self.runs = 0
+        self.failures = 0
+        self.archived = {kind: 0 for kind in ARCHIVE_KINDS}
+        self.last_run: Optional[datetime] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age > timedelta(0)
+
+    def start(self):
+        """Start the periodic archival task"""
+        if not self.enabled or self._task is not None:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        logger.info(f"Started archival of rows older than {self.max_age.days} days to {self.store.directory}")
+
+    async def stop(self):
+        """Stop the task after the batch in progress"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Archival run failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Archive every row older than the cutoff
+
+        Args:
+            now: Reference time for the cutoff (defaults to the current UTC time)
+
+        Returns:
+            Number of rows archived per kind
+        """
+        cutoff = (now or datetime.utcnow()) - self.max_age
+        moved = {kind: 0 for kind in ARCHIVE_KINDS}
+        for kind in ARCHIVE_KINDS:
+            while self._stopping is None or not self._stopping.is_set():
+                async with self.session_factory() as db:
+                    if self.read_session_factory is None:
+                        count = await ConversationService.archive_rows(db, self.store, kind, cutoff, self.batch_size)
+                    else:
+                        async with self.read_session_factory() as read_db:
+                            count = await ConversationService.archive_rows(
+                                db, self.store, kind, cutoff, self.batch_size, read_db=read_db
+                            )
+                if not count:
+                    break
+                moved[kind] += count
+                self.archived[kind] += count
+        if moved['messages'] and self.on_archived is not None:
+            self.on_archived(cutoff)
+        self.runs += 1
+        self.last_run = datetime.utcnow()
+        if any(moved.values()):
+            logger.info(f"Archived {moved['messages']} messages and {moved['analytics']} analytics rows")
+        return moved
+
+    def stats(self) -> Dict:
+        """
+        Get archival statistics
+
+        Returns:
+            Dictionary with the configuration, run counters and segment sizes
+        """
+        return {
+            'enabled': self.enabled,
+            'max_age_days': self.max_age.days,
+            'runs': self.runs,
+            'failures': self.failures,
+            'archived': dict(self.archived),
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'store': self.store.stats()
+        }
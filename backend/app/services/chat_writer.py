@@ -0,0 +1,287 @@
+"""
+Chat Turn Persistence
+Saves chat turns either synchronously in one transaction per request, or
+write-behind: queued in memory and group-committed in bulk by a background task
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.metrics import metrics
+from app.services.conversation_service import ConversationService
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_MODES = ('sync', 'write_behind')
+
+# How long after a lost turn the writer reports itself unhealthy
+FAILURE_WINDOW = timedelta(minutes=5)
+
+
+class ChatWriter:
+    """
+    Persists chat turns according to the configured persistence mode
+
+    - sync: the request saves its session, messages and analytics in a single
+      transaction before responding (one commit per request)
+    - write_behind: the request only enqueues the turn; a background task
+      commits queued turns together once max_batch turns are waiting or
+      flush_interval_ms after the oldest one arrived. Turns still queued when
+      the process dies are lost, and /history may lag by up to one interval.
+
+    A batch that fails to commit is retried, then written one turn at a time
+    so a single bad turn cannot discard the others. Turns that still fail are
+    lost: they are logged as errors, counted in the
+    chatbot_persistence_failed_turns_total metric and reported by health().
+    A session whose creating turn was lost is created by its next turn.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        mode: str = 'sync',
+        max_batch: int = 500,
+        flush_interval_ms: float = 50,
+        max_queue: int = 10000,
+        history_buffer=None,
+        retries: int = 2
+    ):
+        """
+        Initialize the writer
+
+        Args:
+            session_factory: Callable returning an AsyncSession context manager
+                (used by the background task)
+            mode: Persistence mode ('sync' or 'write_behind')
+            max_batch: Turns committed together at most
+            flush_interval_ms: Longest time a queued turn waits for more to join its commit
+            max_queue: Queued turns before requests wait for the writer (backpressure)
+            history_buffer: HistoryBuffer receiving the messages once committed
+            retries: Extra attempts for a failed commit, with exponential backoff
+        """
+        if mode not in PERSISTENCE_MODES:
+            raise ValueError(f"Unknown persistence mode '{mode}', expected one of {list(PERSISTENCE_MODES)}")
+        self.session_factory = session_factory
+        self.mode = mode
+        self.max_batch = max(max_batch, 1)
+        self.flush_interval = max(flush_interval_ms, 0) / 1000
+        self.max_queue = max(max_queue, 1)
+        self.history_buffer = history_buffer
+        self.retries = max(retries, 0)
+        # New sessions whose conversation row was lost with a failed turn
+        self._uncreated_sessions = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._enqueued = 0
+        self._written = 0
+        self._failed = 0
+        self._commits = 0
+        self._last_batch = 0
+        self._max_batch_seen = 0
+        self._retried = 0
+        self._split_batches = 0
+        self._last_failure: Optional[datetime] = None
+        self._last_error: Optional[str] = None
+
+    def start(self):
+        """Start the background writer task (done lazily on first use if not called)"""
+        if self.mode != 'write_behind' or self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(
+            f"Started write-behind persistence (batch {self.max_batch}, "
+            f"interval {self.flush_interval * 1000:g} ms)"
+        )
+
+    async def stop(self):
+        """Commit every queued turn and stop the background task"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+        logger.info(f"Stopped write-behind persistence ({self._written} turns written)")
+
+    async def save(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        messages: List[str],
+        results: List[Dict],
+        response_time_ms: int,
+        new_session: bool = False,
+        rules_hash: Optional[str] = None,
+        tenant: Optional[str] = None
+    ):
+        """
+        Persist the messages, responses and analytics of one request
+
+        Args:
+            db: Request database session (used in sync mode)
+            session_id: Conversation session ID
+            messages: User messages in input order
+            results: Rule engine results matching the messages
+            response_time_ms: Response time attributed to each message
+            new_session: Also create the conversation row for session_id
+            rules_hash: Source hash of the rules that classified the messages
+            tenant: Tenant recorded on a new session's conversation row
+        """
+        if self.mode == 'sync':
+            rows = await ConversationService.save_batch(
+                db=db,
+                session_id=session_id,
+                messages=messages,
+                results=results,
+                response_time_ms=response_time_ms,
+                new_session=new_session,
+                rules_hash=rules_hash,
+                tenant=tenant
+            )
+            if self.history_buffer is not None:
+                self.history_buffer.record(rows, [session_id] if new_session else [])
+            return
+
+        self.start()
+        # Waits when the queue is full, so a slow disk slows requests down instead of growing memory
+        await self._queue.put({
+            'session_id': session_id,
+            'messages': messages,
+            'results': results,
+            'response_time_ms': response_time_ms,
+            'new_session': new_session,
+            'timestamp': datetime.utcnow(),
+            'rules_hash': rules_hash,
+            'tenant': tenant
+        })
+        self._enqueued += 1
+
+    async def _run(self):
+        """Collect queued turns into batches and commit them until stopped"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            turn = await self._queue.get()
+            if turn is None:
+                break
+            batch = [turn]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout > 0:
+                        turn = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        turn = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if turn is None:
+                    stopping = True
+                    break
+                batch.append(turn)
+            await self._write(batch)
+
+    async def _commit(self, batch: List[Dict]) -> Optional[List[Dict]]:
+        """Commit turns in one transaction, retrying; the saved rows, or None if every attempt failed"""
+        for turn in batch:
+            if turn['session_id'] in self._uncreated_sessions:
+                turn['new_session'] = True
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session_factory() as db:
+                    rows = await ConversationService.save_turns(db, batch)
+            except Exception as e:
+                self._last_error = str(e)
+                if attempt < self.retries:
+                    self._retried += 1
+                    logger.warning(f"Retrying commit of {len(batch)} queued chat turns: {e}")
+                    await asyncio.sleep(0.05 * 2 ** attempt)
+                continue
+            for turn in batch:
+                self._uncreated_sessions.discard(turn['session_id'])
+            return rows
+        return None
+
+    async def _write(self, batch: List[Dict]):
+        """Commit a batch of turns in one transaction, falling back to one transaction per turn"""
+        rows = await self._commit(batch)
+        saved = batch
+        if rows is None:
+            if len(batch) > 1:
+                self._split_batches += 1
+                logger.warning(f"Writing {len(batch)} queued chat turns one at a time after failed batch commits")
+            rows, saved = [], []
+            for turn in batch:
+                turn_rows = await self._commit([turn]) if len(batch) > 1 else None
+                if turn_rows is None:
+                    self._lose(turn)
+                else:
+                    rows.extend(turn_rows)
+                    saved.append(turn)
+            if not saved:
+                return
+
+        if self.history_buffer is not None:
+            self.history_buffer.record(rows, [turn['session_id'] for turn in saved if turn['new_session']])
+        self._written += len(saved)
+        self._commits += 1
+        self._last_batch = len(saved)
+        self._max_batch_seen = max(self._max_batch_seen, len(saved))
+
+    def _lose(self, turn: Dict):
+        """Give up on a turn that could not be committed"""
+        if turn['new_session']:
+            self._uncreated_sessions.add(turn['session_id'])
+        self._failed += 1
+        self._last_failure = datetime.utcnow()
+        metrics.inc('chatbot_persistence_failed_turns_total')
+        logger.error(
+            f"Lost chat turn of session {turn['session_id']} ({len(turn['messages'])} messages) "
+            f"after {self.retries + 1} attempts: {self._last_error}"
+        )
+
+    async def flush(self):
+        """Wait until every turn queued so far has been committed (or has failed)"""
+        if self._task is None:
+            return
+        target = self._enqueued
+        while self._written + self._failed < target and not self._task.done():
+            await asyncio.sleep(self.flush_interval / 4 or 0.001)
+
+    def stats(self) -> Dict:
+        """
+        Get persistence statistics
+
+        Returns:
+            Dictionary with the mode, queue depth and turn/commit counters
+        """
+        return {
+            'mode': self.mode,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'enqueued': self._enqueued,
+            'written': self._written,
+            'failed': self._failed,
+            'commits': self._commits,
+            'last_batch': self._last_batch,
+            'max_batch': self._max_batch_seen,
+            'retried': self._retried,
+            'split_batches': self._split_batches
+        }
+
+    def health(self) -> Dict:
+        """
+        Get persistence health
+
+        Returns:
+            Dictionary with healthy (no turn lost within FAILURE_WINDOW), the
+            number of lost turns, and the time and error of the last loss
+        """
+        return {
+            'healthy': self._last_failure is None or datetime.utcnow() - self._last_failure > FAILURE_WINDOW,
+            'failed_turns': self._failed,
+            'last_failure': self._last_failure.isoformat() if self._last_failure else None,
+            'last_error': self._last_error if self._last_failure else None
+        }
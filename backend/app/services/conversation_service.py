@@ -3,20 +3,290 @@ Conversation Service
 Handles conversation history, session management, and analytics
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from app.models.conversation import Conversation, Message, Analytics
-from datetime import datetime
-from typing import List, Optional, Dict
+from sqlalchemy import select, and_, bindparam, insert, tuple_, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+from app.models.conversation import (
+    Conversation, Message, Analytics, AnalyticsBucket, AnalyticsRollup, ArchivedDay, IntentName, SentimentLabel
+)
+from app.core.metrics import timed_stage
+from app.services.rule_catalog import rule_catalog
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, List, Optional, Dict, Tuple
+import asyncio
+import base64
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Time bucket sizes of the global analytics counters
+ANALYTICS_GRANULARITIES = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1)}
+
+# Upper bounds (ms) of the response time histogram kept per bucket
+ANALYTICS_LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Largest number of buckets one analytics range query may span
+MAX_ANALYTICS_BUCKETS = 10080
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the time bucket a timestamp falls in"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def encode_cursor(timestamp: datetime, message_id: int) -> str:
+    """Opaque pagination cursor for a message's (timestamp, id) position"""
+    raw = f"{timestamp.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a pagination cursor
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, message_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor '{cursor}'") from None
+
+
+# Message fields returned by the history endpoints
+_HISTORY_FIELDS = ('id', 'message', 'is_user', 'intent', 'sentiment', 'timestamp')
+
+
+def build_history_page(rows: List[Dict], limit: int, descending: bool, after: bool, before: bool) -> Dict:
+    """
+    Turn up to limit + 1 message rows, fetched in page direction, into a history page
+    
+    Args:
+        rows: History rows (timestamp still a datetime) in the fetch order
+        limit: Page size; a row beyond it means another page follows
+        descending: Rows were fetched newest first
+        after: The page was requested with an 'after' cursor
+        before: The page was requested with a 'before' cursor
+        
+    Returns:
+        Dictionary with messages (oldest first), prev_cursor and next_cursor
+    """
+    more = len(rows) > limit
+    rows = list(rows[:limit])
+    if descending:
+        rows.reverse()
+        has_older, has_newer = more, before
+    else:
+        has_older, has_newer = after, more
+    
+    return {
+        'messages': [{**row, 'timestamp': row['timestamp'].isoformat()} for row in rows],
+        'prev_cursor': encode_cursor(rows[0]['timestamp'], rows[0]['id']) if rows and has_older else None,
+        'next_cursor': encode_cursor(rows[-1]['timestamp'], rows[-1]['id']) if rows and has_newer else None
+    }
+
+
+def _history_query():
+    """Select of the history fields, with intent and sentiment decoded from their dictionaries"""
+    return (
+        select(
+            Message.id,
+            Message.message,
+            Message.is_user,
+            IntentName.name.label('intent'),
+            SentimentLabel.name.label('sentiment'),
+            Message.timestamp
+        )
+        .select_from(Message)
+        .outerjoin(IntentName, IntentName.id == Message.intent_id)
+        .outerjoin(SentimentLabel, SentimentLabel.id == Message.sentiment_id)
+    )
+
+
+async def _encode_rows(
+    db: AsyncSession,
+    message_rows: List[Dict],
+    analytics_rows: List[Dict]
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Replace the strings of message and analytics rows with dictionary IDs
+    
+    Args:
+        db: Database session (new dictionary rows join its transaction)
+        message_rows: Rows with session_id, message, is_user, intent, sentiment and timestamp
+        analytics_rows: Rows with session_id, intent, matched_pattern, rules_hash
+            (source hash of the rules that classified the message), response_time_ms
+            and timestamp
+        
+    Returns:
+        The message and analytics rows as stored
+    """
+    intents = await rule_catalog.intent_ids(
+        db, {row['intent'] for row in message_rows + analytics_rows if row['intent']}
+    )
+    sentiments = await rule_catalog.sentiment_ids(db, {row['sentiment'] for row in message_rows if row['sentiment']})
+    versions = {}
+    patterns = {}
+    for rules_hash in {row.get('rules_hash') for row in analytics_rows}:
+        if rules_hash:
+            versions[rules_hash] = await rule_catalog.version_id(db, rules_hash)
+        matched = {
+            (row['intent'] or 'unknown', row['matched_pattern'])
+            for row in analytics_rows
+            if row.get('rules_hash') == rules_hash and row['matched_pattern'] is not None
+        }
+        patterns.update(await rule_catalog.pattern_ids(db, matched, versions.get(rules_hash)))
+    
+    messages = [
+        {
+            'session_id': row['session_id'],
+            'message': row['message'],
+            'is_user': row['is_user'],
+            'intent_id': intents.get(row['intent']),
+            'sentiment_id': sentiments.get(row['sentiment']),
+            'timestamp': row['timestamp']
+        }
+        for row in message_rows
+    ]
+    analytics = [
+        {
+            'session_id': row['session_id'],
+            'intent_id': intents.get(row['intent']),
+            'pattern_id': (
+                patterns[(row['intent'] or 'unknown', row['matched_pattern'])]
+                if row['matched_pattern'] is not None else None
+            ),
+            'rule_version_id': versions.get(row.get('rules_hash')),
+            'response_time_ms': row['response_time_ms'],
+            'timestamp': row['timestamp']
+        }
+        for row in analytics_rows
+    ]
+    return messages, analytics
+
+
+def _rollup_deltas(analytics_rows: List[Dict]) -> List[Dict]:
+    """Aggregate analytics rows into one rollup increment per session and intent"""
+    deltas: Dict[Tuple[str, str], Dict] = {}
+    for row in analytics_rows:
+        key = (row['session_id'], row['intent'] or 'unknown')
+        response_time = row['response_time_ms'] or 0
+        delta = deltas.get(key)
+        if delta is None:
+            deltas[key] = {
+                'session_id': key[0],
+                'intent': key[1],
+                'count': 1,
+                'total_response_time_ms': response_time,
+                'max_response_time_ms': response_time,
+                'updated_at': row.get('timestamp') or datetime.utcnow()
+            }
+        else:
+            delta['count'] += 1
+            delta['total_response_time_ms'] += response_time
+            delta['max_response_time_ms'] = max(delta['max_response_time_ms'], response_time)
+    return list(deltas.values())
+
+
+def _bucket_deltas(analytics_rows: List[Dict]) -> List[Dict]:
+    """Aggregate analytics rows into counter increments for every time bucket they fall in"""
+    values: Dict[Tuple[str, datetime, str, str], int] = {}
+    
+    def add(key, amount):
+        values[key] = values.get(key, 0) + amount
+    
+    now = datetime.utcnow()
+    for row in analytics_rows:
+        timestamp = row.get('timestamp') or now
+        response_time = row['response_time_ms'] or 0
+        latency_bound = next(
+            (str(bound) for bound in ANALYTICS_LATENCY_BUCKETS_MS if response_time <= bound), '+Inf'
+        )
+        for granularity in ANALYTICS_GRANULARITIES:
+            start = bucket_start(timestamp, granularity)
+            add((granularity, start, 'interactions', ''), 1)
+            add((granularity, start, 'response_time_ms', ''), response_time)
+            add((granularity, start, 'intent', row['intent'] or 'unknown'), 1)
+            add((granularity, start, 'latency_ms', latency_bound), 1)
+            if row['pattern_id'] is None:
+                add((granularity, start, 'fallbacks', ''), 1)
+    
+    return [
+        {'granularity': granularity, 'bucket_start': start, 'metric': metric, 'label': label, 'value': value}
+        for (granularity, start, metric, label), value in values.items()
+    ]
+
+
+async def _upsert_increments(
+    db: AsyncSession,
+    model,
+    deltas: List[Dict],
+    sums: Tuple[str, ...],
+    maxima: Tuple[str, ...] = ()
+):
+    """
+    Add counter increments to the transaction, creating missing rows
+    
+    Args:
+        db: Database session
+        model: Mapped class whose primary key identifies a counter row
+        deltas: Rows with the primary key columns and the increments
+        sums: Columns increased by the delta
+        maxima: Columns raised to the delta if it is larger
+    """
+    if not deltas:
+        return
+    table = model.__table__.c
+    keys = [column.name for column in model.__table__.primary_key]
+    touched = [name for name in deltas[0] if name not in keys and name not in sums and name not in maxima]
+    dialect = db.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        statement = (sqlite if dialect == 'sqlite' else postgresql).insert(model)
+        excluded = statement.excluded
+        greatest = func.max if dialect == 'sqlite' else func.greatest
+        set_ = {name: table[name] + excluded[name] for name in sums}
+        set_.update({name: greatest(table[name], excluded[name]) for name in maxima})
+        set_.update({name: excluded[name] for name in touched})
+        statement = statement.on_conflict_do_update(index_elements=[table[name] for name in keys], set_=set_)
+        await db.execute(statement, deltas)
+        return
+    
+    # Databases without INSERT ... ON CONFLICT: read, then update or insert
+    for delta in deltas:
+        row = await db.get(model, tuple(delta[name] for name in keys))
+        if row is None:
+            db.add(model(**delta))
+            continue
+        for name in sums:
+            setattr(row, name, getattr(row, name) + delta[name])
+        for name in maxima:
+            setattr(row, name, max(getattr(row, name), delta[name]))
+        for name in touched:
+            setattr(row, name, delta[name])
+
+
+async def _record_analytics(db: AsyncSession, analytics_rows: List[Dict]):
+    """Update the session rollups and global time buckets for new analytics rows (with intent names)"""
+    await _upsert_increments(
+        db,
+        AnalyticsRollup,
+        _rollup_deltas(analytics_rows),
+        sums=('count', 'total_response_time_ms'),
+        maxima=('max_response_time_ms',)
+    )
+    await _upsert_increments(db, AnalyticsBucket, _bucket_deltas(analytics_rows), sums=('value',))
+
 
 class ConversationService:
     """Service for managing conversations and chat history"""
     
     @staticmethod
+    @timed_stage('db.create_session')
     async def create_session(db: AsyncSession) -> str:
         """
         Create a new conversation session
@@ -35,6 +305,98 @@ class ConversationService:
         return session_id
     
     @staticmethod
+    @timed_stage('db.session_exists')
+    async def session_exists(db: AsyncSession, session_id: str) -> bool:
+        """
+        Check whether a conversation session exists
+        
+        Args:
+            db: Database session
+            session_id: Conversation session ID
+            
+        Returns:
+            True if the conversations table has the session
+        """
+        result = await db.execute(
+            select(Conversation.id).where(Conversation.session_id == session_id).limit(1)
+        )
+        return result.first() is not None
+    
+    @staticmethod
+    @timed_stage('db.get_session_tenant')
+    async def get_session_tenant(db: AsyncSession, session_id: str) -> Optional[str]:
+        """
+        Get the tenant a conversation session was started with
+        
+        Args:
+            db: Database session
+            session_id: Conversation session ID
+            
+        Returns:
+            Tenant name, or None for unknown sessions and the default rules
+        """
+        result = await db.execute(
+            select(Conversation.tenant).where(Conversation.session_id == session_id).limit(1)
+        )
+        return result.scalar()
+    
+    @staticmethod
+    async def iter_session_ids(db: AsyncSession, batch_size: int = 10000) -> AsyncIterator[str]:
+        """
+        Stream every session ID
+        
+        Args:
+            db: Database session (must stay open while iterating)
+            batch_size: Rows fetched per round trip
+            
+        Yields:
+            Session IDs
+        """
+        result = await db.stream(
+            select(Conversation.session_id).execution_options(yield_per=batch_size)
+        )
+        async for row in result:
+            yield row.session_id
+    
+    @staticmethod
+    @timed_stage('db.touch_sessions')
+    async def touch_sessions(
+        db: AsyncSession,
+        last_seen: Dict[str, datetime],
+        idle_before: Optional[datetime] = None
+    ) -> int:
+        """
+        Record session activity in one transaction
+        
+        Args:
+            db: Database session
+            last_seen: Time of the latest message per session ID; those
+                sessions get updated_at set and are marked active
+            idle_before: Mark active sessions not updated since then inactive
+            
+        Returns:
+            Number of sessions marked inactive
+        """
+        if last_seen:
+            await db.execute(
+                update(Conversation.__table__)
+                .where(Conversation.session_id == bindparam('sid'))
+                .values(updated_at=bindparam('seen'), is_active=True),
+                [{'sid': session_id, 'seen': seen} for session_id, seen in last_seen.items()]
+            )
+        deactivated = 0
+        if idle_before is not None:
+            result = await db.execute(
+                update(Conversation)
+                .where(and_(Conversation.is_active.is_(True), Conversation.updated_at < idle_before))
+                .values(is_active=False)
+            )
+            deactivated = result.rowcount
+        await db.commit()
+        return deactivated
+    
+    @staticmethod
+    @timed_stage('db.save_message')
     async def save_message(
         db: AsyncSession,
         session_id: str,
@@ -54,21 +416,165 @@ class ConversationService:
             intent: Detected intent
             sentiment: Detected sentiment
         """
-        msg = Message(
-            session_id=session_id,
-            message=message,
-            is_user=is_user,
-            intent=intent,
-            sentiment=sentiment
-        )
-        db.add(msg)
+        rows, _ = await _encode_rows(db, [{
+            'session_id': session_id,
+            'message': message,
+            'is_user': is_user,
+            'intent': intent,
+            'sentiment': sentiment,
+            'timestamp': datetime.utcnow()
+        }], [])
+        db.add(Message(**rows[0]))
+        await db.commit()
+    
+    @staticmethod
+    @timed_stage('db.save_batch')
+    async def save_batch(
+        db: AsyncSession,
+        session_id: str,
+        messages: List[str],
+        results: List[Dict],
+        response_time_ms: int,
+        new_session: bool = False,
+        timestamp: Optional[datetime] = None,
+        rules_hash: Optional[str] = None,
+        tenant: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Save a batch of user messages, bot responses and analytics in one transaction
+        
+        Args:
+            db: Database session
+            session_id: Conversation session ID
+            messages: User messages in input order
+            results: Rule engine results matching the messages
+            response_time_ms: Response time attributed to each message
+            new_session: Also create the conversation row for session_id
+            timestamp: Time the messages were received (defaults to now)
+            rules_hash: Source hash of the rules that classified the messages
+            tenant: Tenant recorded on a new session's conversation row
+            
+        Returns:
+            The saved message rows (with 'id' where the database returns it)
+        """
+        rows = await ConversationService._insert_turns(db, [{
+            'session_id': session_id,
+            'messages': messages,
+            'results': results,
+            'response_time_ms': response_time_ms,
+            'new_session': new_session,
+            'timestamp': timestamp,
+            'rules_hash': rules_hash,
+            'tenant': tenant
+        }])
+        await db.commit()
+        return rows
+    
+    @staticmethod
+    @timed_stage('db.save_turns')
+    async def save_turns(db: AsyncSession, turns: List[Dict]) -> List[Dict]:
+        """
+        Save chat turns of any number of sessions with one bulk insert per table
+        
+        Args:
+            db: Database session
+            turns: Dictionaries with the save_batch arguments (session_id,
+                messages, results, response_time_ms, new_session, timestamp, rules_hash)
+            
+        Returns:
+            The saved message rows (with 'id' where the database returns it)
+        """
+        rows = await ConversationService._insert_turns(db, turns)
         await db.commit()
+        return rows
+    
+    @staticmethod
+    async def _insert_turns(db: AsyncSession, turns: List[Dict]) -> List[Dict]:
+        """
+        Add the conversation, message and analytics rows of chat turns to the transaction
+        
+        Intents, sentiments, patterns and rules versions are stored as
+        dictionary IDs (see RuleCatalog).
+        
+        Returns:
+            The inserted message rows with intent and sentiment names, and
+            their 'id' when the database returns generated keys for bulk inserts
+        """
+        now = datetime.utcnow()
+        conversation_rows = []
+        message_rows = []
+        analytics_rows = []
+        for turn in turns:
+            session_id = turn['session_id']
+            timestamp = turn.get('timestamp') or now
+            if turn.get('new_session'):
+                conversation_rows.append({
+                    'session_id': session_id,
+                    'created_at': timestamp,
+                    'updated_at': timestamp,
+                    'is_active': True,
+                    'tenant': turn.get('tenant')
+                })
+            for message, result in zip(turn['messages'], turn['results']):
+                message_rows.append({
+                    'session_id': session_id,
+                    'message': message,
+                    'is_user': True,
+                    'intent': None,
+                    'sentiment': None,
+                    'timestamp': timestamp
+                })
+                message_rows.append({
+                    'session_id': session_id,
+                    'message': result['response'],
+                    'is_user': False,
+                    'intent': result['intent'],
+                    'sentiment': result['sentiment'],
+                    'timestamp': timestamp
+                })
+                analytics_rows.append({
+                    'session_id': session_id,
+                    'intent': result['intent'],
+                    'matched_pattern': result['matched_pattern'],
+                    'rules_hash': turn.get('rules_hash'),
+                    'response_time_ms': turn['response_time_ms'],
+                    'timestamp': timestamp
+                })
+        
+        if conversation_rows:
+            dialect = db.get_bind().dialect.name
+            if dialect in ('sqlite', 'postgresql'):
+                # A retried write-behind turn may create a session whose row already exists
+                statement = (sqlite if dialect == 'sqlite' else postgresql).insert(Conversation)
+                statement = statement.on_conflict_do_nothing(index_elements=[Conversation.session_id])
+            else:
+                statement = insert(Conversation)
+            await db.execute(statement, conversation_rows)
+        if not message_rows:
+            return message_rows
+        stored_messages, stored_analytics = await _encode_rows(db, message_rows, analytics_rows)
+        if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+            result = await db.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                stored_messages
+            )
+            for row, message_id in zip(message_rows, result.scalars().all()):
+                row['id'] = message_id
+        else:
+            await db.execute(insert(Message), stored_messages)
+        await db.execute(insert(Analytics), stored_analytics)
+        await _record_analytics(db, [
+            {**stored, 'intent': row['intent']} for stored, row in zip(stored_analytics, analytics_rows)
+        ])
+        return message_rows
     
     @staticmethod
+    @timed_stage('db.get_conversation_history')
     async def get_conversation_history(
         db: AsyncSession,
         session_id: str,
-        limit: int = 50
+        limit: int = 50,
+        archive=None
     ) -> List[Dict]:
         """
         Retrieve conversation history for a session
@@ -77,37 +583,260 @@ class ConversationService:
             db: Database session
             session_id: Conversation session ID
             limit: Maximum number of messages to retrieve
+            archive: ArchiveStore to also read archived messages from
             
         Returns:
-            List of message dictionaries
+            List of message dictionaries, oldest first
         """
+        page = await ConversationService.get_history_page(db, session_id, limit, archive=archive)
+        return page['messages']
+    
+    @staticmethod
+    @timed_stage('db.get_history_page')
+    async def get_history_page(
+        db: AsyncSession,
+        session_id: str,
+        limit: int = 50,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        latest: bool = False,
+        archive=None
+    ) -> Dict:
+        """
+        Retrieve one page of a session's history with keyset pagination
+        
+        Pages are ordered by (timestamp, id) and located with the composite
+        (session_id, timestamp, id) index, so every page costs the same no
+        matter how deep into the session it is.
+        
+        Args:
+            db: Database session
+            session_id: Conversation session ID
+            limit: Maximum number of messages in the page
+            after: Cursor of a message; return the messages following it
+            before: Cursor of a message; return the messages preceding it
+            latest: Without a cursor, return the newest page instead of the oldest
+            archive: ArchiveStore to merge the session's archived messages from
+                (read in full, so slower than the hot table alone)
+            
+        Returns:
+            Dictionary with messages (oldest first), prev_cursor (older
+            messages exist) and next_cursor (newer messages exist)
+            
+        Raises:
+            ValueError: If a cursor is malformed or both after and before are given
+        """
+        if after and before:
+            raise ValueError("Use either 'after' or 'before', not both")
+        cursor = decode_cursor(after or before) if after or before else None
+        key = tuple_(Message.timestamp, Message.id)
+        query = _history_query().where(Message.session_id == session_id)
+        
+        descending = bool(before) or (latest and not after)
+        if after:
+            query = query.where(key > tuple_(*cursor))
+        elif before:
+            query = query.where(key < tuple_(*cursor))
+        if descending:
+            query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+        else:
+            query = query.order_by(Message.timestamp.asc(), Message.id.asc())
+        
+        # One extra row tells whether another page follows in this direction
+        rows = [dict(row) for row in (await db.execute(query.limit(limit + 1))).mappings().all()]
+        
+        if archive is not None:
+            archived = await ConversationService._archived_messages(db, archive, session_id)
+            if after:
+                archived = [row for row in archived if (row['timestamp'], row['id']) > cursor]
+            elif before:
+                archived = [row for row in archived if (row['timestamp'], row['id']) < cursor]
+            if archived:
+                hot_ids = {row['id'] for row in rows}
+                rows.extend(row for row in archived if row['id'] not in hot_ids)
+                rows.sort(key=lambda row: (row['timestamp'], row['id']), reverse=descending)
+                rows = rows[:limit + 1]
+        
+        return build_history_page(rows, limit, descending, after=bool(after), before=bool(before))
+    
+    @staticmethod
+    async def _archived_days(db: AsyncSession, session_id: str) -> List[date]:
+        """Days of a session with archived rows"""
         result = await db.execute(
-            select(Message)
-            .where(Message.session_id == session_id)
-            .order_by(Message.timestamp.asc())
-            .limit(limit)
+            select(ArchivedDay.day)
+            .where(ArchivedDay.session_id == session_id)
+            .order_by(ArchivedDay.day)
         )
-        messages = result.scalars().all()
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def _archived_messages(db: AsyncSession, archive, session_id: str, days=None) -> List[Dict]:
+        """A session's archived messages in history format, ordered by (timestamp, id)"""
+        if days is None:
+            days = await ConversationService._archived_days(db, session_id)
+        if not days:
+            return []
+        rows = await asyncio.to_thread(archive.read_session, 'messages', days, session_id)
         
+        # Segments written before dictionary encoding hold the names themselves
+        names = {}
+        for field, model in (('intent', IntentName), ('sentiment', SentimentLabel)):
+            ids = {row[f'{field}_id'] for row in rows if row.get(f'{field}_id') is not None}
+            if ids:
+                result = await db.execute(select(model.id, model.name).where(model.id.in_(ids)))
+                names[field] = dict(result.all())
         return [
             {
-                'id': msg.id,
-                'message': msg.message,
-                'is_user': msg.is_user,
-                'intent': msg.intent,
-                'sentiment': msg.sentiment,
-                'timestamp': msg.timestamp.isoformat()
+                **{name: row[name] for name in _HISTORY_FIELDS if name in row},
+                **{
+                    field: names.get(field, {}).get(row.get(f'{field}_id'))
+                    for field in ('intent', 'sentiment') if field not in row
+                }
             }
-            for msg in messages
+            for row in rows
         ]
     
     @staticmethod
+    async def _archived_analytics_count(db: AsyncSession, session_id: Optional[str] = None) -> int:
+        """Number of analytics rows moved to the archive, per archived_days"""
+        query = select(func.coalesce(func.sum(ArchivedDay.analytics), 0))
+        if session_id:
+            query = query.where(ArchivedDay.session_id == session_id)
+        return (await db.execute(query)).scalar()
+    
+    @staticmethod
+    async def _iter_archived_analytics(
+        db: AsyncSession,
+        archive,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Stream archived analytics rows with intent names, one segment at a time
+        
+        Rows still present in the analytics table (archival interrupted before
+        its delete) are skipped, so they are not counted twice.
+        """
+        if session_id:
+            days = await ConversationService._archived_days(db, session_id)
+            chunks = iter([await asyncio.to_thread(archive.read_session, 'analytics', days, session_id)])
+        else:
+            chunks = archive.iter_rows('analytics')
+        while True:
+            rows = await asyncio.to_thread(next, chunks, None)
+            if rows is None:
+                return
+            hot = set()
+            for offset in range(0, len(rows), 500):
+                ids = [row['id'] for row in rows[offset:offset + 500]]
+                hot.update((await db.execute(select(Analytics.id).where(Analytics.id.in_(ids)))).scalars().all())
+            rows = [row for row in rows if row['id'] not in hot]
+            intent_ids = {row['intent_id'] for row in rows if row.get('intent_id') is not None}
+            names = {}
+            if intent_ids:
+                result = await db.execute(select(IntentName.id, IntentName.name).where(IntentName.id.in_(intent_ids)))
+                names = dict(result.all())
+            yield [
+                {
+                    'session_id': row['session_id'],
+                    'intent': row['intent'] if 'intent' in row else names.get(row.get('intent_id')),
+                    # Segments written before dictionary encoding hold the pattern itself
+                    'pattern_id': row.get('pattern_id', row.get('matched_pattern')),
+                    'response_time_ms': row['response_time_ms'],
+                    'timestamp': row['timestamp']
+                }
+                for row in rows
+            ]
+    
+    @staticmethod
+    async def _add_archived_analytics(db: AsyncSession, archive, session_id: Optional[str], add) -> int:
+        """
+        Feed archived analytics rows to a rebuild
+        
+        Args:
+            db: Database session of the rebuild transaction
+            archive: ArchiveStore holding the rows (may be None if nothing is archived)
+            session_id: Limit to one session
+            add: Coroutine function receiving each chunk of rows
+            
+        Returns:
+            Number of archived rows added
+            
+        Raises:
+            ValueError: If archived_days records rows the archive cannot provide;
+                the transaction is rolled back
+        """
+        expected = await ConversationService._archived_analytics_count(db, session_id)
+        if not expected:
+            return 0
+        if archive is None:
+            await db.rollback()
+            raise ValueError(f"{expected} analytics rows are archived; pass the archive to include them")
+        added = 0
+        async for rows in ConversationService._iter_archived_analytics(db, archive, session_id):
+            await add(rows)
+            added += len(rows)
+        if added < expected:
+            await db.rollback()
+            raise ValueError(f"The archive holds {added} of {expected} archived analytics rows; nothing was rebuilt")
+        return added
+    
+    @staticmethod
+    async def iter_conversation_history(
+        db: AsyncSession,
+        session_id: str,
+        batch_size: int = 500,
+        archive=None
+    ) -> AsyncIterator[Dict]:
+        """
+        Stream a session's whole history, oldest first
+        
+        Rows are fetched from a server-side cursor batch_size at a time as
+        plain column tuples, so memory use does not grow with the session.
+        
+        Args:
+            db: Database session (must stay open while iterating)
+            session_id: Conversation session ID
+            batch_size: Rows fetched per round trip
+            archive: ArchiveStore to read archived messages from first (one day
+                at a time)
+            
+        Yields:
+            Message dictionaries
+        """
+        archived_ids = set()
+        if archive is not None:
+            for day in await ConversationService._archived_days(db, session_id):
+                for row in await ConversationService._archived_messages(db, archive, session_id, days=[day]):
+                    archived_ids.add(row['id'])
+                    yield {**row, 'timestamp': row['timestamp'].isoformat()}
+        
+        result = await db.stream(
+            _history_query()
+            .where(Message.session_id == session_id)
+            .order_by(Message.timestamp.asc(), Message.id.asc())
+            .execution_options(yield_per=batch_size)
+        )
+        async for row in result:
+            if row.id in archived_ids:
+                continue
+            yield {
+                'id': row.id,
+                'message': row.message,
+                'is_user': row.is_user,
+                'intent': row.intent,
+                'sentiment': row.sentiment,
+                'timestamp': row.timestamp.isoformat()
+            }
+    
+    @staticmethod
+    @timed_stage('db.save_analytics')
     async def save_analytics(
         db: AsyncSession,
         session_id: str,
         intent: Optional[str],
         matched_pattern: Optional[str],
-        response_time_ms: int
+        response_time_ms: int,
+        rules_hash: Optional[str] = None
     ):
         """
         Save analytics data
@@ -118,21 +847,29 @@ class ConversationService:
             intent: Detected intent
             matched_pattern: Matched regex pattern
             response_time_ms: Response time in milliseconds
+            rules_hash: Source hash of the rules that classified the message
         """
-        analytics = Analytics(
-            session_id=session_id,
-            intent=intent,
-            matched_pattern=matched_pattern,
-            response_time_ms=response_time_ms
-        )
-        db.add(analytics)
+        _, rows = await _encode_rows(db, [], [{
+            'session_id': session_id,
+            'intent': intent,
+            'matched_pattern': matched_pattern,
+            'rules_hash': rules_hash,
+            'response_time_ms': response_time_ms,
+            'timestamp': datetime.utcnow()
+        }])
+        db.add(Analytics(**rows[0]))
+        await _record_analytics(db, [{**rows[0], 'intent': intent}])
         await db.commit()
     
     @staticmethod
+    @timed_stage('db.get_session_analytics')
     async def get_session_analytics(db: AsyncSession, session_id: str) -> Dict:
         """
         Get analytics for a specific session
         
+        Read from the per-intent rollup rows, so the cost grows with the
+        number of intents seen in the session rather than its length.
+        
         Args:
             db: Database session
             session_id: Conversation session ID
@@ -141,44 +878,436 @@ class ConversationService:
             Analytics summary dictionary
         """
         result = await db.execute(
-            select(Analytics)
-            .where(Analytics.session_id == session_id)
+            select(
+                AnalyticsRollup.intent,
+                AnalyticsRollup.count,
+                AnalyticsRollup.total_response_time_ms,
+                AnalyticsRollup.max_response_time_ms
+            )
+            .where(AnalyticsRollup.session_id == session_id)
         )
-        analytics_records = result.scalars().all()
+        rows = result.all()
+        
+        if not rows:
+            # Sessions written before the rollup existed (until backfilled)
+            intent = func.coalesce(IntentName.name, 'unknown')
+            result = await db.execute(
+                select(
+                    intent,
+                    func.count(),
+                    func.coalesce(func.sum(Analytics.response_time_ms), 0),
+                    func.coalesce(func.max(Analytics.response_time_ms), 0)
+                )
+                .select_from(Analytics)
+                .outerjoin(IntentName, IntentName.id == Analytics.intent_id)
+                .where(Analytics.session_id == session_id)
+                .group_by(intent)
+            )
+            rows = result.all()
         
-        if not analytics_records:
+        if not rows:
             return {
                 'total_interactions': 0,
                 'avg_response_time_ms': 0,
+                'max_response_time_ms': 0,
                 'intent_distribution': {}
             }
         
-        total = len(analytics_records)
-        avg_response_time = sum(a.response_time_ms for a in analytics_records) / total
-        
-        intent_distribution = {}
-        for record in analytics_records:
-            intent = record.intent or 'unknown'
-            intent_distribution[intent] = intent_distribution.get(intent, 0) + 1
+        total = sum(row[1] for row in rows)
+        avg_response_time = sum(row[2] for row in rows) / total
         
         return {
             'total_interactions': total,
             'avg_response_time_ms': round(avg_response_time, 2),
-            'intent_distribution': intent_distribution
+            'max_response_time_ms': max(row[3] for row in rows),
+            'intent_distribution': {row[0]: row[1] for row in rows}
         }
     
     @staticmethod
-    async def clear_session(db: AsyncSession, session_id: str):
+    @timed_stage('db.rebuild_analytics_rollups')
+    async def rebuild_analytics_rollups(
+        db: AsyncSession,
+        session_id: Optional[str] = None,
+        archive=None
+    ) -> int:
         """
-        Clear conversation history for a session
+        Recompute analytics rollups from the Analytics table and the archive
+        
+        Used to backfill data written before rollups existed; safe to re-run.
+        Archived analytics rows are counted too, so rollups keep covering them.
         
         Args:
             db: Database session
-            session_id: Conversation session ID
+            session_id: Limit the rebuild to one session
+            archive: ArchiveStore holding archived analytics rows
+            
+        Returns:
+            Number of rollup rows written
+            
+        Raises:
+            ValueError: If rows were archived and the archive is missing or
+                incomplete (nothing is changed)
         """
-        # Delete messages
+        intent = func.coalesce(IntentName.name, 'unknown')
+        query = (
+            select(
+                Analytics.session_id,
+                intent,
+                func.count(),
+                func.coalesce(func.sum(Analytics.response_time_ms), 0),
+                func.coalesce(func.max(Analytics.response_time_ms), 0),
+                func.max(Analytics.timestamp)
+            )
+            .select_from(Analytics)
+            .outerjoin(IntentName, IntentName.id == Analytics.intent_id)
+            .group_by(Analytics.session_id, intent)
+        )
+        clear = delete(AnalyticsRollup)
+        if session_id:
+            query = query.where(Analytics.session_id == session_id)
+            clear = clear.where(AnalyticsRollup.session_id == session_id)
+        
+        await db.execute(clear)
         await db.execute(
-            Message.__table__.delete().where(Message.session_id == session_id)
+            insert(AnalyticsRollup).from_select(
+                ['session_id', 'intent', 'count', 'total_response_time_ms', 'max_response_time_ms', 'updated_at'],
+                query
+            )
+        )
+        
+        async def add(rows):
+            await _upsert_increments(
+                db,
+                AnalyticsRollup,
+                _rollup_deltas(rows),
+                sums=('count', 'total_response_time_ms'),
+                maxima=('max_response_time_ms', 'updated_at')
+            )
+        
+        archived = await ConversationService._add_archived_analytics(db, archive, session_id, add)
+        count = select(func.count()).select_from(AnalyticsRollup)
+        if session_id:
+            count = count.where(AnalyticsRollup.session_id == session_id)
+        written = (await db.execute(count)).scalar()
+        await db.commit()
+        
+        logger.info(f"Rebuilt {written} analytics rollups ({archived} archived rows)")
+        return written
+    
+    @staticmethod
+    @timed_stage('db.get_analytics_buckets')
+    async def get_analytics_buckets(
+        db: AsyncSession,
+        granularity: str,
+        start: datetime,
+        end: datetime
+    ) -> Dict:
+        """
+        Get global analytics per time bucket
+        
+        Reads the precomputed bucket counters, so the cost depends on the
+        number of buckets in the range, not on the number of analytics rows.
+        
+        Args:
+            db: Database session
+            granularity: Bucket size ('minute' or 'hour')
+            start: Range start (inclusive, rounded down to a bucket)
+            end: Range end (exclusive)
+            
+        Returns:
+            Dictionary with the non-empty buckets in time order and totals over the range
+            
+        Raises:
+            ValueError: If the granularity is unknown or the range is empty or too long
+        """
+        if granularity not in ANALYTICS_GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}', expected one of {list(ANALYTICS_GRANULARITIES)}")
+        if end <= start:
+            raise ValueError("The range end must be after its start")
+        if (end - start) / ANALYTICS_GRANULARITIES[granularity] > MAX_ANALYTICS_BUCKETS:
+            raise ValueError(f"The range spans more than {MAX_ANALYTICS_BUCKETS} {granularity} buckets")
+        result = await db.execute(
+            select(AnalyticsBucket.bucket_start, AnalyticsBucket.metric, AnalyticsBucket.label, AnalyticsBucket.value)
+            .where(and_(
+                AnalyticsBucket.granularity == granularity,
+                AnalyticsBucket.bucket_start >= bucket_start(start, granularity),
+                AnalyticsBucket.bucket_start < end
+            ))
+            .order_by(AnalyticsBucket.bucket_start)
         )
+        
+        buckets: Dict[datetime, Dict] = {}
+        for started, metric, label, value in result.all():
+            bucket = buckets.get(started)
+            if bucket is None:
+                bucket = buckets[started] = {
+                    'start': started.isoformat(),
+                    'interactions': 0,
+                    'fallbacks': 0,
+                    'response_time_ms': 0,
+                    'intents': {},
+                    'latency_ms': {}
+                }
+            if metric == 'intent':
+                bucket['intents'][label] = value
+            elif metric == 'latency_ms':
+                bucket['latency_ms'][label] = value
+            else:
+                bucket[metric] = value
+        
+        totals = {'interactions': 0, 'fallbacks': 0, 'response_time_ms': 0, 'intents': {}, 'latency_ms': {}}
+        for bucket in buckets.values():
+            for name in ('interactions', 'fallbacks', 'response_time_ms'):
+                totals[name] += bucket[name]
+            for name in ('intents', 'latency_ms'):
+                for label, value in bucket[name].items():
+                    totals[name][label] = totals[name].get(label, 0) + value
+        
+        def summarize(counters: Dict) -> Dict:
+            interactions = counters.pop('interactions')
+            response_time = counters.pop('response_time_ms')
+            return {
+                'interactions': interactions,
+                'fallback_rate': round(counters['fallbacks'] / interactions, 4) if interactions else 0.0,
+                'avg_response_time_ms': round(response_time / interactions, 2) if interactions else 0.0,
+                **counters
+            }
+        
+        return {
+            'granularity': granularity,
+            'latency_buckets_ms': [str(bound) for bound in ANALYTICS_LATENCY_BUCKETS_MS] + ['+Inf'],
+            'buckets': [{'start': bucket.pop('start'), **summarize(bucket)} for bucket in buckets.values()],
+            'totals': summarize(totals)
+        }
+    
+    @staticmethod
+    @timed_stage('db.rebuild_analytics_buckets')
+    async def rebuild_analytics_buckets(db: AsyncSession, batch_size: int = 10000, archive=None) -> int:
+        """
+        Recompute the global time buckets from the Analytics table and the archive
+        
+        Used to backfill data written before buckets existed; safe to re-run.
+        Rows are read in batches of batch_size (archived rows one segment at a
+        time) and committed in one transaction.
+        
+        Args:
+            db: Database session
+            batch_size: Analytics rows read per query
+            archive: ArchiveStore holding archived analytics rows
+            
+        Returns:
+            Number of analytics rows counted
+            
+        Raises:
+            ValueError: If rows were archived and the archive is missing or
+                incomplete (nothing is changed)
+        """
+        await db.execute(delete(AnalyticsBucket))
+        counted = 0
+        last_id = 0
+        while True:
+            rows = (await db.execute(
+                select(
+                    Analytics.id,
+                    IntentName.name.label('intent'),
+                    Analytics.pattern_id,
+                    Analytics.response_time_ms,
+                    Analytics.timestamp
+                )
+                .select_from(Analytics)
+                .outerjoin(IntentName, IntentName.id == Analytics.intent_id)
+                .where(Analytics.id > last_id)
+                .order_by(Analytics.id)
+                .limit(batch_size)
+            )).mappings().all()
+            if not rows:
+                break
+            await _upsert_increments(db, AnalyticsBucket, _bucket_deltas(rows), sums=('value',))
+            counted += len(rows)
+            last_id = rows[-1]['id']
+        
+        async def add(rows):
+            await _upsert_increments(db, AnalyticsBucket, _bucket_deltas(rows), sums=('value',))
+        
+        counted += await ConversationService._add_archived_analytics(db, archive, None, add)
+        await db.commit()
+        
+        logger.info(f"Rebuilt analytics buckets from {counted} rows")
+        return counted
+    
+    @staticmethod
+    @timed_stage('db.rescore_sentiment')
+    async def rescore_sentiment(
+        db: AsyncSession,
+        analyzer,
+        session_id: Optional[str] = None,
+        batch_size: int = 1000
+    ) -> int:
+        """
+        Re-score the sentiment of stored fallback replies in batches
+        
+        Sentiment is stored on the bot row of each turn. Matched intents take
+        it from their configured `sentiment`, which is kept; only fallback
+        replies were scored by the lexicon, so only those are re-scored from
+        the user message preceding them in their session. Sentiments left on
+        user rows by earlier re-scoring runs are cleared.
+        
+        Args:
+            db: Database session
+            analyzer: SentimentAnalyzer providing analyze_batch
+            session_id: Limit re-scoring to one session
+            batch_size: Number of rows read, scored and updated per transaction
+            
+        Returns:
+            Number of messages re-scored
+        """
+        prompt = aliased(Message)
+        user_message = (
+            select(prompt.message)
+            .where(and_(
+                prompt.session_id == Message.session_id,
+                prompt.is_user.is_(True),
+                tuple_(prompt.timestamp, prompt.id) < tuple_(Message.timestamp, Message.id)
+            ))
+            .order_by(prompt.timestamp.desc(), prompt.id.desc())
+            .limit(1)
+            .correlate(Message)
+            .scalar_subquery()
+        )
+        
+        fallback_id = (await rule_catalog.intent_ids(db, ['fallback']))['fallback']
+        updated = 0
+        last_id = 0
+        while True:
+            query = (
+                select(Message.id, user_message.label('user_message'))
+                .where(and_(Message.is_user.is_(False), Message.intent_id == fallback_id, Message.id > last_id))
+                .order_by(Message.id)
+                .limit(batch_size)
+            )
+            if session_id:
+                query = query.where(Message.session_id == session_id)
+            
+            rows = (await db.execute(query)).all()
+            if not rows:
+                break
+            
+            answered = [row for row in rows if row.user_message is not None]
+            sentiments = analyzer.analyze_batch([row.user_message for row in answered])
+            sentiment_ids = await rule_catalog.sentiment_ids(db, set(sentiments))
+            if answered:
+                await db.execute(
+                    update(Message),
+                    [
+                        {'id': row.id, 'sentiment_id': sentiment_ids[sentiment]}
+                        for row, sentiment in zip(answered, sentiments)
+                    ]
+                )
+            await db.commit()
+            
+            updated += len(answered)
+            last_id = rows[-1].id
+        
+        cleared = update(Message).where(and_(Message.is_user.is_(True), Message.sentiment_id.is_not(None)))
+        if session_id:
+            cleared = cleared.where(Message.session_id == session_id)
+        await db.execute(cleared.values(sentiment_id=None))
+        await db.commit()
+        
+        logger.info(f"Re-scored sentiment of {updated} messages")
+        return updated
+    
+    @staticmethod
+    @timed_stage('db.archive_rows')
+    async def archive_rows(
+        db: AsyncSession,
+        archive,
+        kind: str,
+        cutoff: datetime,
+        batch_size: int = 5000,
+        read_db: Optional[AsyncSession] = None
+    ) -> int:
+        """
+        Move one batch of rows older than a cutoff into the archive
+        
+        The rows are selected, and their transaction ended, before the
+        segments are written, so no connection is held during file I/O.
+        Only then are the rows deleted, in the transaction that records
+        which session days were archived.
+        
+        Args:
+            db: Database session for the deletes
+            archive: ArchiveStore receiving the rows
+            kind: 'messages' or 'analytics'
+            cutoff: Rows with an earlier timestamp are archived
+            batch_size: Maximum number of rows moved
+            read_db: Read-only session for selecting the rows (defaults to db)
+            
+        Returns:
+            Number of rows archived (0 when none are left)
+        """
+        model = Message if kind == 'messages' else Analytics
+        reader = read_db if read_db is not None else db
+        result = await reader.execute(
+            select(model.__table__)
+            .where(model.timestamp < cutoff)
+            .order_by(model.id)
+            .limit(batch_size)
+        )
+        rows = [dict(row) for row in result.mappings().all()]
+        # Give the connection back before the segments are written
+        await reader.rollback()
+        if not rows:
+            return 0
+        
+        rows_by_day: Dict[date, List[Dict]] = {}
+        counts: Dict[Tuple[str, date], int] = {}
+        for row in rows:
+            day = row['timestamp'].date()
+            rows_by_day.setdefault(day, []).append(row)
+            counts[(row['session_id'], day)] = counts.get((row['session_id'], day), 0) + 1
+        
+        for day, day_rows in rows_by_day.items():
+            await asyncio.to_thread(archive.write_segment, kind, day, day_rows)
+        await _upsert_increments(
+            db,
+            ArchivedDay,
+            [
+                {
+                    'session_id': session_id,
+                    'day': day,
+                    'messages': count if kind == 'messages' else 0,
+                    'analytics': count if kind == 'analytics' else 0
+                }
+                for (session_id, day), count in counts.items()
+            ],
+            sums=('messages', 'analytics')
+        )
+        # Every row up to the last selected id that is older than the cutoff was selected
+        await db.execute(delete(model).where(and_(model.id <= rows[-1]['id'], model.timestamp < cutoff)))
+        await db.commit()
+        return len(rows)
+    
+    @staticmethod
+    @timed_stage('db.clear_session')
+    async def clear_session(db: AsyncSession, session_id: str, archive=None):
+        """
+        Clear conversation history and analytics for a session
+        
+        Removes its messages, analytics rows and rollups, and its archived
+        rows when an archive is given. Global time buckets keep their counts.
+        
+        Args:
+            db: Database session
+            session_id: Conversation session ID
+            archive: ArchiveStore holding the session's archived rows
+        """
+        for model in (Message, Analytics, AnalyticsRollup):
+            await db.execute(delete(model).where(model.session_id == session_id))
+        
+        days = await ConversationService._archived_days(db, session_id)
+        if days and archive is not None:
+            await asyncio.to_thread(archive.purge_session, days, session_id)
+            await db.execute(delete(ArchivedDay).where(ArchivedDay.session_id == session_id))
         await db.commit()
         logger.info(f"Cleared session: {session_id}")
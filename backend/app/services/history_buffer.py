@@ -0,0 +1,257 @@
+"""
+Hot History Buffer
+Keeps the most recent messages of active sessions in memory so history pages
+can be served without a database query
+"""
+import bisect
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.services.conversation_service import build_history_page, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Rough bytes per buffered message besides its text (dict, strings, datetime)
+_MESSAGE_OVERHEAD = 400
+
+
+class _SessionBuffer:
+    """Newest messages of one session, ordered by (timestamp, id)"""
+
+    __slots__ = ('keys', 'rows', 'ids', 'complete', 'bytes')
+
+    def __init__(self, complete: bool):
+        self.keys: List[Tuple[datetime, int]] = []
+        self.rows: List[Dict] = []
+        self.ids = set()
+        # True when the buffer holds every stored message of the session
+        self.complete = complete
+        self.bytes = 0
+
+
+def _row_bytes(row: Dict) -> int:
+    return len(row['message']) + _MESSAGE_OVERHEAD
+
+
+class HistoryBuffer:
+    """
+    Per-session ring buffers of recent messages with a global memory cap
+
+    The chat path appends messages once they are committed. Each session
+    keeps at most session_size messages; a session whose buffer has always
+    held all of its messages (created in this process, or loaded whole from
+    the database) can serve any page. Otherwise the buffer is a contiguous
+    run of the newest messages and serves the pages that fall inside it. When
+    the estimated memory of all buffers exceeds the cap, the least recently
+    used sessions are dropped.
+
+    Buffers only see writes made by this process, so with several worker
+    processes writing the same sessions the buffer should be disabled.
+    """
+
+    def __init__(self, session_size: int = 200, max_memory_mb: float = 64):
+        """
+        Initialize the buffer
+
+        Args:
+            session_size: Messages kept per session (0 disables the buffer)
+            max_memory_mb: Estimated memory cap for all sessions
+        """
+        self.session_size = max(session_size, 0)
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self._sessions: 'OrderedDict[str, _SessionBuffer]' = OrderedDict()
+        self._bytes = 0
+        # Bumped whenever messages are removed, so stale database reads are not seeded
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.session_size > 0
+
+    def generation(self) -> int:
+        """Token to pass to seed() for a database read started now"""
+        return self._generation
+
+    def _add(self, session_id: str, buffer: _SessionBuffer, rows: Iterable[Dict]):
+        for row in rows:
+            if row['id'] in buffer.ids:
+                continue
+            key = (row['timestamp'], row['id'])
+            position = bisect.bisect_right(buffer.keys, key)
+            buffer.keys.insert(position, key)
+            buffer.rows.insert(position, row)
+            buffer.ids.add(row['id'])
+            buffer.bytes += _row_bytes(row)
+            self._bytes += _row_bytes(row)
+        while len(buffer.rows) > self.session_size:
+            buffer.keys.pop(0)
+            row = buffer.rows.pop(0)
+            buffer.ids.discard(row['id'])
+            buffer.bytes -= _row_bytes(row)
+            self._bytes -= _row_bytes(row)
+            buffer.complete = False
+        self._sessions.move_to_end(session_id)
+        self._evict_over_cap(keep=session_id)
+
+    def _evict_over_cap(self, keep: str):
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id, buffer = next(iter(self._sessions.items()))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self.evictions += 1
+
+    def _drop(self, session_id: str):
+        buffer = self._sessions.pop(session_id, None)
+        if buffer is not None:
+            self._bytes -= buffer.bytes
+
+    def record(self, rows: List[Dict], new_sessions: Iterable[str] = ()):
+        """
+        Append committed messages
+
+        Args:
+            rows: Saved message rows (session_id, id, message, is_user, intent,
+                sentiment, timestamp); rows without an id drop their session's
+                buffer, since pages need message ids
+            new_sessions: Sessions these rows started (their buffers are complete)
+        """
+        if not self.enabled:
+            return
+        new_sessions = set(new_sessions)
+        by_session: Dict[str, List[Dict]] = {}
+        for row in rows:
+            by_session.setdefault(row['session_id'], []).append(row)
+
+        for session_id, session_rows in by_session.items():
+            if any('id' not in row for row in session_rows):
+                self._drop(session_id)
+                continue
+            buffer = self._sessions.get(session_id)
+            if buffer is None:
+                buffer = self._sessions[session_id] = _SessionBuffer(complete=session_id in new_sessions)
+            self._add(session_id, buffer, (
+                {
+                    'id': row['id'],
+                    'message': row['message'],
+                    'is_user': row['is_user'],
+                    'intent': row['intent'],
+                    'sentiment': row['sentiment'],
+                    'timestamp': row['timestamp']
+                }
+                for row in session_rows
+            ))
+
+    def seed(self, session_id: str, messages: List[Dict], generation: int):
+        """
+        Load a session's complete history read from the database
+
+        Args:
+            session_id: Conversation session ID
+            messages: Every stored message of the session, as returned by a history page
+            generation: Value of generation() before the read; the seed is
+                ignored if messages were removed since
+        """
+        if not self.enabled or generation != self._generation or not 0 < len(messages) <= self.session_size:
+            return
+        buffer = self._sessions.get(session_id)
+        if buffer is None:
+            buffer = self._sessions[session_id] = _SessionBuffer(complete=True)
+        buffer.complete = True
+        self._add(session_id, buffer, (
+            {**message, 'timestamp': datetime.fromisoformat(message['timestamp'])} for message in messages
+        ))
+
+    def clear(self, session_id: str):
+        """Forget a session's messages (after its history was deleted)"""
+        self._generation += 1
+        self._drop(session_id)
+
+    def drop_before(self, cutoff: datetime):
+        """Forget messages older than a cutoff in every session (after archival)"""
+        self._generation += 1
+        for session_id in list(self._sessions):
+            buffer = self._sessions[session_id]
+            position = bisect.bisect_left(buffer.keys, (cutoff, -1))
+            if not position:
+                continue
+            for row in buffer.rows[:position]:
+                buffer.ids.discard(row['id'])
+                buffer.bytes -= _row_bytes(row)
+                self._bytes -= _row_bytes(row)
+            del buffer.keys[:position]
+            del buffer.rows[:position]
+            if not buffer.rows:
+                self._drop(session_id)
+
+    def page(
+        self,
+        session_id: str,
+        limit: int,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        latest: bool = False
+    ) -> Optional[Dict]:
+        """
+        Serve a history page from memory, with the same arguments and result as
+        ConversationService.get_history_page
+
+        Returns:
+            The page, or None if the buffer cannot answer it exactly
+
+        Raises:
+            ValueError: If a cursor is malformed or both after and before are given
+        """
+        if after and before:
+            raise ValueError("Use either 'after' or 'before', not both")
+        cursor = decode_cursor(after or before) if after or before else None
+        buffer = self._sessions.get(session_id) if self.enabled else None
+        if buffer is None:
+            self.misses += 1
+            return None
+
+        descending = bool(before) or (latest and not after)
+        rows = None
+        if descending:
+            end = bisect.bisect_left(buffer.keys, cursor) if before else len(buffer.keys)
+            if buffer.complete or end > limit:
+                rows = buffer.rows[max(end - limit - 1, 0):end][::-1]
+        elif after:
+            if buffer.complete or (buffer.keys and cursor >= buffer.keys[0]):
+                start = bisect.bisect_right(buffer.keys, cursor)
+                rows = buffer.rows[start:start + limit + 1]
+        elif buffer.complete:
+            rows = buffer.rows[:limit + 1]
+
+        if rows is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._sessions.move_to_end(session_id)
+        return build_history_page(rows, limit, descending, after=bool(after), before=bool(before))
+
+    def stats(self) -> Dict:
+        """
+        Get buffer statistics
+
+        Returns:
+            Dictionary with buffered sessions and messages, estimated memory
+            against the cap, and hit/miss/eviction counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'sessions': len(self._sessions),
+            'messages': sum(len(buffer.rows) for buffer in self._sessions.values()),
+            'estimated_bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions
+        }
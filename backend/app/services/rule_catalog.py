@@ -0,0 +1,193 @@
+"""
+Rule Catalog
+Assigns the small integer IDs that messages and analytics rows store in place
+of intent names, sentiment labels, pattern sources and rules versions
+"""
+import logging
+import weakref
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from sqlalchemy import event, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.conversation import IntentName, RulePattern, RuleVersion, SentimentLabel, pattern_hash
+
+logger = logging.getLogger(__name__)
+
+# Keys looked up per query
+_LOOKUP_CHUNK = 500
+
+
+class RuleCatalog:
+    """
+    Dictionary IDs of intents, sentiments, patterns and rules versions
+
+    IDs are rows of the dictionary tables, so every process and every rules
+    version shares them. Each rules version is registered when it is loaded,
+    which assigns IDs to all of its intents and patterns up front; anything
+    not registered yet (a version published by the file watcher, a sentiment
+    label seen for the first time) is resolved on the write path in the
+    caller's transaction: looked up, inserted if missing, and looked up again.
+
+    Resolved IDs are cached per database engine once the transaction that
+    resolved them commits, so steady-state writes encode without a query.
+    """
+
+    def __init__(self):
+        self._caches: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+        self.lookups = 0
+        self.inserted = 0
+
+    def _cache(self, db: AsyncSession) -> Dict[str, Dict[Hashable, int]]:
+        bind = db.get_bind()
+        cache = self._caches.get(bind)
+        if cache is None:
+            cache = self._caches[bind] = {'intents': {}, 'sentiments': {}, 'patterns': {}, 'versions': {}}
+        return cache
+
+    async def _lookup(self, db: AsyncSession, model, columns: Tuple[str, ...], keys: List[Tuple]) -> Dict[Tuple, int]:
+        table = model.__table__.c
+        found = {}
+        for offset in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[offset:offset + _LOOKUP_CHUNK]
+            if len(columns) == 1:
+                condition = table[columns[0]].in_([key[0] for key in chunk])
+            else:
+                condition = tuple_(*(table[name] for name in columns)).in_(chunk)
+            result = await db.execute(select(table.id, *(table[name] for name in columns)).where(condition))
+            for row in result.all():
+                found[tuple(row[1:])] = row[0]
+        self.lookups += 1
+        return found
+
+    async def _resolve(
+        self,
+        db: AsyncSession,
+        kind: str,
+        model,
+        columns: Tuple[str, ...],
+        rows: Dict[Tuple, Dict]
+    ) -> Dict[Tuple, int]:
+        """
+        IDs of dictionary rows, inserting the missing ones
+
+        Args:
+            db: Database session whose transaction the inserts join
+            kind: Cache the IDs are kept in
+            model: Dictionary table
+            columns: Columns of its unique key
+            rows: Column values of each wanted row, by key
+
+        Returns:
+            ID per key
+        """
+        cache = self._cache(db)[kind]
+        ids = {key: cache[key] for key in rows if key in cache}
+        missing = [key for key in rows if key not in ids]
+        if not missing:
+            return ids
+
+        resolved = await self._lookup(db, model, columns, missing)
+        absent = [key for key in missing if key not in resolved]
+        if absent:
+            dialect = db.get_bind().dialect.name
+            if dialect in ('sqlite', 'postgresql'):
+                statement = (sqlite if dialect == 'sqlite' else postgresql).insert(model)
+                statement = statement.on_conflict_do_nothing(index_elements=list(columns))
+                await db.execute(statement, [rows[key] for key in absent])
+            else:
+                await db.execute(insert(model), [rows[key] for key in absent])
+            resolved.update(await self._lookup(db, model, columns, absent))
+            self.inserted += len(absent)
+
+        # Rows inserted by this transaction only become shared once it commits
+        event.listen(db.sync_session, 'after_commit', lambda session: cache.update(resolved), once=True)
+        ids.update(resolved)
+        return ids
+
+    async def intent_ids(self, db: AsyncSession, names: Iterable[str]) -> Dict[str, int]:
+        """IDs of intent names"""
+        ids = await self._resolve(
+            db, 'intents', IntentName, ('name',), {(name,): {'name': name} for name in names}
+        )
+        return {key[0]: value for key, value in ids.items()}
+
+    async def sentiment_ids(self, db: AsyncSession, names: Iterable[str]) -> Dict[str, int]:
+        """IDs of sentiment labels"""
+        ids = await self._resolve(
+            db, 'sentiments', SentimentLabel, ('name',), {(name,): {'name': name} for name in names}
+        )
+        return {key[0]: value for key, value in ids.items()}
+
+    async def version_id(self, db: AsyncSession, source_hash: str) -> int:
+        """ID of a rules version"""
+        ids = await self._resolve(
+            db, 'versions', RuleVersion, ('source_hash',), {(source_hash,): {'source_hash': source_hash}}
+        )
+        return ids[(source_hash,)]
+
+    async def pattern_ids(
+        self,
+        db: AsyncSession,
+        patterns: Iterable[Tuple[str, str]],
+        version_id: Optional[int] = None
+    ) -> Dict[Tuple[str, str], int]:
+        """
+        IDs of matched patterns
+
+        Args:
+            db: Database session
+            patterns: (intent name, pattern source) pairs
+            version_id: Rules version recorded for patterns seen for the first time
+
+        Returns:
+            ID per (intent name, pattern source)
+        """
+        patterns = set(patterns)
+        intents = await self.intent_ids(db, {intent for intent, _ in patterns})
+        keys = {(intent, source): (intents[intent], pattern_hash(source)) for intent, source in patterns}
+        ids = await self._resolve(db, 'patterns', RulePattern, ('intent_id', 'source_hash'), {
+            keys[(intent, source)]: {
+                'intent_id': keys[(intent, source)][0],
+                'source_hash': keys[(intent, source)][1],
+                'source': source,
+                'version_id': version_id
+            }
+            for intent, source in patterns
+        })
+        return {pattern: ids[key] for pattern, key in keys.items()}
+
+    async def register(self, db: AsyncSession, snapshot) -> Optional[int]:
+        """
+        Assign IDs to a rules version and all of its intents and patterns
+
+        Args:
+            db: Database session (committed)
+            snapshot: RuleSnapshot of the loaded rules
+
+        Returns:
+            ID of the rules version, or None for rules without a source hash
+        """
+        version_id = await self.version_id(db, snapshot.source_hash) if snapshot.source_hash else None
+        names = [intent.get('intent', 'unknown') for intent in snapshot.intents]
+        await self.intent_ids(db, names + ['fallback'])
+        await self.pattern_ids(db, [(compiled.intent_name, compiled.source) for compiled in snapshot.patterns], version_id)
+        await db.commit()
+        logger.info(f"Registered rules version {snapshot.version} ({len(snapshot.patterns)} patterns)")
+        return version_id
+
+    def stats(self) -> Dict:
+        """
+        Get catalog statistics
+
+        Returns:
+            Dictionary with the cached IDs per kind, dictionary lookups and inserted rows
+        """
+        cached = {'intents': 0, 'sentiments': 0, 'patterns': 0, 'versions': 0}
+        for cache in self._caches.values():
+            for kind, ids in cache.items():
+                cached[kind] += len(ids)
+        return {'cached': cached, 'lookups': self.lookups, 'inserted': self.inserted}
+
+
+# Shared by the write paths of the process
+rule_catalog = RuleCatalog()
@@ -0,0 +1,185 @@
+"""
+Session Registry
+Validates client-supplied session IDs in memory and batches session activity
+updates, in front of the conversations table
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import BloomFilter, LRUCache
+from app.services.conversation_service import ConversationService
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRegistry:
+    """
+    Known session IDs: an LRU of recently used sessions backed by a Bloom
+    filter of every session ID in the database
+
+    A session in the LRU is valid without a query. An ID the filter has never
+    seen is confirmed in the database, since another worker process (with its
+    own filter) may have created it; with authoritative=True (a single
+    process) it is rejected without a query. IDs the filter may contain are
+    looked up once and then cached.
+
+    Activity is recorded in memory and written by a background task every
+    touch_interval_s: one batched update of updated_at/is_active for the
+    sessions seen since the last flush, and is_active=False for sessions idle
+    longer than idle_minutes.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        cache_size: int = 100_000,
+        filter_capacity: int = 1_000_000,
+        filter_error_rate: float = 0.01,
+        authoritative: bool = False,
+        touch_interval_s: float = 5,
+        idle_minutes: float = 30
+    ):
+        """
+        Initialize the registry
+
+        Args:
+            session_factory: Callable returning an AsyncSession context manager
+                (used at startup and by the background task)
+            cache_size: Recently used sessions kept in the LRU
+            filter_capacity: Session IDs the filter is sized for
+            filter_error_rate: False positive rate of the filter at capacity
+            authoritative: Trust the filter's negative answers without a query
+            touch_interval_s: Seconds between activity flushes
+            idle_minutes: Inactivity after which a session is marked inactive (0 never)
+        """
+        self.session_factory = session_factory
+        self.authoritative = authoritative
+        self.touch_interval_s = max(touch_interval_s, 0.01)
+        self.idle = timedelta(minutes=idle_minutes)
+        self._sessions = LRUCache(cache_size)
+        self._filter = BloomFilter(filter_capacity, filter_error_rate)
+        self._last_seen: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.loaded = False
+
+        self.lookups = 0
+        self.rejected = 0
+        self.touch_flushes = 0
+        self.touched = 0
+        self.deactivated = 0
+
+    async def load(self):
+        """(Re)build the filter from every stored session ID"""
+        bloom = BloomFilter(self._filter.capacity, self._filter.error_rate)
+        async with self.session_factory() as db:
+            async for session_id in ConversationService.iter_session_ids(db):
+                bloom.add(session_id)
+        self._filter = bloom
+        self.loaded = True
+        if self._filter.count > self._filter.capacity:
+            logger.warning(
+                f"{self._filter.count} sessions exceed the session filter capacity "
+                f"({self._filter.capacity}); raise SESSION_FILTER_CAPACITY"
+            )
+        logger.info(f"Loaded {self._filter.count} session IDs into the session filter")
+
+    def register(self, session_id: str):
+        """Record a session created by this process"""
+        self._filter.add(session_id)
+        self._sessions.put(session_id, True)
+
+    async def exists(self, db: AsyncSession, session_id: str) -> bool:
+        """
+        Whether a session exists
+
+        Args:
+            db: Database session for lookups the memory cannot answer
+            session_id: Client-supplied session ID
+
+        Returns:
+            True if the session exists
+        """
+        if self._sessions.get(session_id):
+            return True
+        if self.loaded and self.authoritative and session_id not in self._filter:
+            self.rejected += 1
+            return False
+
+        self.lookups += 1
+        if not await ConversationService.session_exists(db, session_id):
+            self.rejected += 1
+            return False
+        self._filter.add(session_id)
+        self._sessions.put(session_id, True)
+        return True
+
+    def touch(self, session_id: str):
+        """Record activity on a session (written by the next flush)"""
+        self._last_seen[session_id] = datetime.utcnow()
+
+    def start(self):
+        """Start the background activity flush"""
+        if self._task is not None:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task after a final flush"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.touch_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to update session activity: {e}")
+
+    async def flush(self):
+        """Write recorded activity and mark idle sessions inactive"""
+        last_seen, self._last_seen = self._last_seen, {}
+        idle_before = datetime.utcnow() - self.idle if self.idle > timedelta(0) else None
+        if not last_seen and idle_before is None:
+            return
+        try:
+            async with self.session_factory() as db:
+                deactivated = await ConversationService.touch_sessions(db, last_seen, idle_before)
+        except Exception:
+            # Keep the activity for the next flush unless newer activity was recorded
+            for session_id, seen in last_seen.items():
+                self._last_seen.setdefault(session_id, seen)
+            raise
+        self.touch_flushes += 1
+        self.touched += len(last_seen)
+        self.deactivated += deactivated
+
+    def stats(self) -> Dict:
+        """
+        Get registry statistics
+
+        Returns:
+            Dictionary with the LRU and filter statistics, database lookups,
+            rejected IDs and activity flush counters
+        """
+        return {
+            'cache': self._sessions.stats(),
+            'filter': self._filter.stats(),
+            'authoritative': self.authoritative,
+            'lookups': self.lookups,
+            'rejected': self.rejected,
+            'pending_touches': len(self._last_seen),
+            'touch_flushes': self.touch_flushes,
+            'touched': self.touched,
+            'deactivated': self.deactivated
+        }
@@ -0,0 +1,357 @@
+"""
+Rule Engine and Conversation Service Benchmarks
+
+Measures rule load time, memory, per-message latency percentiles and
+throughput on the shipped rules and on synthetic rule sets, plus the
+database write/read paths, and writes the results as JSON.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --sizes base,1000,10000 --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json --output new.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import yaml
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.rule_engine import RuleEngine  # noqa: E402
+from synthetic import generate_corpus, generate_rules  # noqa: E402
+
+BENCHMARK_FORMAT = 1
+
+BASE_RULES_FILE = os.path.join(os.path.dirname(__file__), '../rules/chatbot_rules.yaml')
+
+# Metrics where a larger value is better; every other numeric metric is a cost
+_HIGHER_IS_BETTER = ('msgs_per_s', 'rows_per_s', 'expected_intent_rate')
+
+
+def _percentiles(samples_ns: List[int]) -> Dict:
+    """Latency summary in microseconds"""
+    ordered = sorted(samples_ns)
+    count = len(ordered)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(int(count * fraction), count - 1)] / 1000, 2) if count else 0.0
+
+    total_s = sum(ordered) / 1e9
+    return {
+        'count': count,
+        'p50_us': at(0.50),
+        'p95_us': at(0.95),
+        'p99_us': at(0.99),
+        'max_us': round(ordered[-1] / 1000, 2) if count else 0.0,
+        'msgs_per_s': round(count / total_s, 1) if total_s else 0.0
+    }
+
+
+def _time_each(func: Callable, messages: Sequence[str]) -> List[int]:
+    samples = []
+    clock = time.perf_counter_ns
+    for message in messages:
+        start = clock()
+        func(message)
+        samples.append(clock() - start)
+    return samples
+
+
+def _load_ms(rules_file: str, engine_kwargs: Dict) -> float:
+    start = time.perf_counter()
+    RuleEngine(rules_file, **engine_kwargs)
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def bench_rule_set(name: str, rules_file: str, engine_kwargs: Dict, corpus_size: int, memory: bool) -> Dict:
+    """
+    Benchmark one rule set
+
+    Args:
+        name: Label of the rule set in the output
+        rules_file: YAML rules file to load
+        engine_kwargs: Extra RuleEngine arguments (matching strategy, scoring, ...)
+        corpus_size: Number of matching and of non-matching messages
+        memory: Also measure the memory retained by the loaded engine
+
+    Returns:
+        Result dictionary for the rule set
+    """
+    cold_ms = _load_ms(rules_file, {**engine_kwargs, 'artifact_cache': False})
+    _load_ms(rules_file, {**engine_kwargs, 'artifact_cache': True})  # writes the artifact
+    artifact_ms = _load_ms(rules_file, {**engine_kwargs, 'artifact_cache': True})
+
+    memory_kb = None
+    if memory:
+        tracemalloc.start()
+        engine = RuleEngine(rules_file, **engine_kwargs)
+        memory_kb = round(tracemalloc.get_traced_memory()[0] / 1024, 1)
+        tracemalloc.stop()
+    else:
+        engine = RuleEngine(rules_file, **engine_kwargs)
+
+    matching, non_matching = generate_corpus(engine.patterns, corpus_size)
+    matching_messages = [message for message, _ in matching]
+
+    # Warm up lazily built structures before timing
+    for message in matching_messages[:50] + non_matching[:50]:
+        engine.process_message(message)
+
+    matched = _percentiles(_time_each(engine.process_message, matching_messages))
+    expected = sum(
+        engine.process_message(message)['intent'] == intent for message, intent in matching
+    )
+    matched['expected_intent_rate'] = round(expected / len(matching), 4) if matching else 0.0
+    unmatched = _percentiles(_time_each(engine.process_message, non_matching))
+
+    mixed = matching_messages + non_matching
+    start = time.perf_counter()
+    engine.process_batch(mixed)
+    batch_s = time.perf_counter() - start
+
+    return {
+        'rule_set': name,
+        'intents': len(engine.intents),
+        'patterns': len(engine.patterns),
+        'load_ms': cold_ms,
+        'load_artifact_ms': artifact_ms,
+        'memory_kb': memory_kb,
+        'matching': matched,
+        'non_matching': unmatched,
+        'batch': {
+            'count': len(mixed),
+            'msgs_per_s': round(len(mixed) / batch_s, 1) if batch_s else 0.0
+        }
+    }
+
+
+async def bench_conversation_service(chats: int, batch_size: int) -> Dict:
+    """
+    Benchmark the ConversationService write and read paths on a scratch SQLite file
+
+    Args:
+        chats: Number of single chat turns to save (message, reply, analytics)
+        batch_size: Messages per save_batch call
+
+    Returns:
+        Result dictionary with latency summaries per operation
+    """
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.models.conversation import Base
+    from app.services.conversation_service import ConversationService
+
+    engine = RuleEngine(BASE_RULES_FILE)
+    messages = ["hello", "what are your prices?", "i need help", "xazo quwh", "bye"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_engine = create_async_engine(f"sqlite+aiosqlite:///{directory}/bench.db")
+        async with db_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+
+        clock = time.perf_counter_ns
+        async with session_factory() as db:
+            session_id = await ConversationService.create_session(db)
+
+            chat_ns = []
+            for index in range(chats):
+                message = messages[index % len(messages)]
+                start = clock()
+                await ConversationService.save_message(db, session_id, message, is_user=True)
+                result = engine.process_message(message)
+                await ConversationService.save_message(
+                    db, session_id, result['response'], is_user=False,
+                    intent=result['intent'], sentiment=result['sentiment']
+                )
+                await ConversationService.save_analytics(
+                    db, session_id, result['intent'], result['matched_pattern'], 1
+                )
+                chat_ns.append(clock() - start)
+
+            batch = [messages[index % len(messages)] for index in range(batch_size)]
+            batch_ns = []
+            for _ in range(max(chats // batch_size, 1)):
+                start = clock()
+                await ConversationService.save_batch(
+                    db, str(uuid.uuid4()), batch, engine.process_batch(batch), 1, new_session=True
+                )
+                batch_ns.append(clock() - start)
+
+            history_ns = []
+            for _ in range(50):
+                start = clock()
+                await ConversationService.get_conversation_history(db, session_id)
+                history_ns.append(clock() - start)
+
+            analytics_ns = []
+            for _ in range(50):
+                start = clock()
+                await ConversationService.get_session_analytics(db, session_id)
+                analytics_ns.append(clock() - start)
+
+        await db_engine.dispose()
+
+    batch_summary = _percentiles(batch_ns)
+    batch_seconds = sum(batch_ns) / 1e9
+    batch_summary['rows_per_s'] = round(len(batch_ns) * batch_size / batch_seconds, 1) if batch_seconds else 0.0
+    return {
+        'chat_turn': _percentiles(chat_ns),
+        'save_batch': batch_summary,
+        'history': _percentiles(history_ns),
+        'analytics': _percentiles(analytics_ns)
+    }
+
+
+def _flatten(value, prefix: str = '') -> Dict[str, float]:
+    """Flatten nested results into 'path.to.metric' -> number, keying rule sets by name"""
+    flat: Dict[str, float] = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}{key}."))
+    elif isinstance(value, list):
+        for item in value:
+            label = item.get('rule_set', '') if isinstance(item, dict) else ''
+            flat.update(_flatten(item, f"{prefix}{label}."))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix.rstrip('.')] = value
+    return flat
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> List[str]:
+    """
+    Find metrics that got worse than the baseline by more than the tolerance
+
+    Counts, sizes and memory are compared too, so a rule set that grew is reported.
+
+    Args:
+        baseline: Earlier benchmark output
+        current: New benchmark output
+        tolerance: Allowed relative change (0.2 = 20%)
+
+    Returns:
+        Human-readable regression descriptions
+    """
+    old = _flatten({'rule_engine': baseline.get('rule_engine', []),
+                    'conversation_service': baseline.get('conversation_service') or {}})
+    new = _flatten({'rule_engine': current.get('rule_engine', []),
+                    'conversation_service': current.get('conversation_service') or {}})
+
+    regressions = []
+    for key, before in old.items():
+        after = new.get(key)
+        if after is None or not before or key.endswith('.count'):
+            continue
+        change = (after - before) / abs(before)
+        if key.rsplit('.', 1)[-1] in _HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{key}: {before} -> {after} ({change:+.0%} worse)")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Rule engine and conversation service benchmarks")
+    parser.add_argument("--sizes", default="base,100,1000",
+                        help="Comma-separated rule sets: 'base' (shipped rules) or a synthetic intent count")
+    parser.add_argument("--patterns-per-intent", type=int, default=10,
+                        help="Patterns per synthetic intent (10000 intents x 10 = 100k patterns)")
+    parser.add_argument("--messages", type=int, default=2000,
+                        help="Matching and non-matching messages per rule set")
+    parser.add_argument("--strategy", default="loop", help="Matching strategy ('loop' or 'combined')")
+    parser.add_argument("--no-prefilter", action="store_true", help="Disable the literal prefilter")
+    parser.add_argument("--scoring", default="first", help="Intent scoring mode ('first' or 'ranked')")
+    parser.add_argument("--no-memory", action="store_true", help="Skip memory measurement (faster)")
+    parser.add_argument("--db-chats", type=int, default=500,
+                        help="Chat turns for the conversation service benchmark (0 skips it)")
+    parser.add_argument("--db-batch-size", type=int, default=100, help="Messages per save_batch call")
+    parser.add_argument("--output", default=None, help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative slowdown before --compare fails")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    engine_kwargs = {
+        'match_strategy': args.strategy,
+        'prefilter': not args.no_prefilter,
+        'scoring': args.scoring
+    }
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes.split(','):
+            size = size.strip()
+            if size == 'base':
+                # Copy so the artifact cache does not write next to the shipped rules
+                rules_file = os.path.join(directory, 'base.yaml')
+                with open(BASE_RULES_FILE, 'rb') as source, open(rules_file, 'wb') as target:
+                    target.write(source.read())
+            else:
+                rules_file = os.path.join(directory, f'synthetic_{size}.yaml')
+                with open(rules_file, 'w', encoding='utf-8') as file:
+                    yaml.safe_dump(generate_rules(int(size), args.patterns_per_intent), file, allow_unicode=True)
+                size = f'synthetic-{size}x{args.patterns_per_intent}'
+
+            print(f"Benchmarking rule set {size}...", file=sys.stderr)
+            results.append(bench_rule_set(size, rules_file, engine_kwargs, args.messages, not args.no_memory))
+
+    conversation = None
+    if args.db_chats > 0:
+        print("Benchmarking conversation service...", file=sys.stderr)
+        conversation = asyncio.run(bench_conversation_service(args.db_chats, args.db_batch_size))
+
+    report = {
+        'format': BENCHMARK_FORMAT,
+        'created': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {**engine_kwargs, 'messages': args.messages, 'patterns_per_intent': args.patterns_per_intent},
+        'rule_engine': results,
+        'conversation_service': conversation
+    }
+
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(encoded + '\n')
+    else:
+        print(encoded)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            regressions = compare(json.load(file), report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
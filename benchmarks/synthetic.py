@@ -0,0 +1,102 @@
+"""
+Synthetic Rule Sets and Message Corpora
+Generates deterministic rule sets of any size in the chatbot_rules.yaml
+layout, and matching / non-matching messages for a compiled rule table
+"""
+import random
+import itertools
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Pattern words and filler words are built from disjoint syllables, so filler
+# text can never complete a pattern
+_PATTERN_SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vi', 'so', 'de', 'po', 'gu', 'be']
+_FILLER_SYLLABLES = ['xa', 'zo', 'qu', 'fy', 'wh', 'jy']
+
+_SENTIMENTS = ['positive', 'neutral', 'negative']
+
+
+def _words(syllables: Sequence[str], length: int = 3) -> Iterator[str]:
+    """Yield unique pseudo-words made of `length` syllables, then longer ones"""
+    for size in itertools.count(length):
+        for combo in itertools.product(syllables, repeat=size):
+            yield ''.join(combo)
+
+
+def _pattern(style: int, words: Iterator[str]) -> str:
+    """Build a pattern in one of the styles used by chatbot_rules.yaml"""
+    if style == 0:
+        return '^(' + '|'.join(next(words) for _ in range(4)) + r')\b'
+    if style == 1:
+        return r'\b' + next(words) + ' ' + next(words) + r'\b'
+    if style == 2:
+        return r'\b(' + next(words) + '|' + next(words) + r')\b'
+    return r'\b' + next(words) + r'\b'
+
+
+def generate_rules(intent_count: int, patterns_per_intent: int = 10, seed: int = 0) -> Dict:
+    """
+    Generate a rules mapping with unique vocabulary per pattern
+
+    Args:
+        intent_count: Number of intents
+        patterns_per_intent: Patterns per intent
+        seed: Random seed for sentiments and pattern styles
+
+    Returns:
+        Rules mapping with intents, fallback_responses and sentiment_modifiers
+    """
+    rng = random.Random(seed)
+    words = _words(_PATTERN_SYLLABLES)
+    intents = []
+    for index in range(intent_count):
+        intents.append({
+            'intent': f'intent_{index:05d}',
+            'patterns': [_pattern(rng.randrange(4), words) for _ in range(patterns_per_intent)],
+            'responses': [f'Response {index}.{n}' for n in range(2)],
+            'sentiment': rng.choice(_SENTIMENTS)
+        })
+    return {
+        'intents': intents,
+        'fallback_responses': ["I'm not sure I understand. Can you rephrase that?"],
+        'sentiment_modifiers': {'positive': '😊', 'neutral': '👍', 'negative': '😔'}
+    }
+
+
+def _filler(rng: random.Random, count: int) -> str:
+    return ' '.join(
+        ''.join(rng.choice(_FILLER_SYLLABLES) for _ in range(rng.randint(1, 3)))
+        for _ in range(count)
+    )
+
+
+def generate_corpus(patterns: Sequence, size: int, seed: int = 0) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """
+    Generate messages for a compiled rule table
+
+    Matching messages start with a required literal of a random pattern
+    (so anchored patterns match too) followed by filler words, and are only
+    kept if the pattern really matches. Non-matching messages are filler only.
+
+    Args:
+        patterns: CompiledPattern table of a loaded RuleEngine
+        size: Number of messages of each kind
+        seed: Random seed
+
+    Returns:
+        Tuple of ([(message, intent of the pattern it was built from)], [non-matching messages])
+    """
+    rng = random.Random(seed)
+    usable = [compiled for compiled in patterns if compiled.literals]
+
+    matching: List[Tuple[str, str]] = []
+    attempts = 0
+    while usable and len(matching) < size and attempts < size * 20:
+        attempts += 1
+        compiled = rng.choice(usable)
+        literal = rng.choice(sorted(compiled.literals))
+        message = f"{literal} {_filler(rng, rng.randint(1, 8))}"
+        if compiled.regex.search(message):
+            matching.append((message, compiled.intent_name))
+
+    non_matching = [_filler(rng, rng.randint(2, 12)) for _ in range(size)]
+    return matching, non_matching
@@ -2,13 +2,32 @@
 Unit tests for Rule Engine
 """
 import pytest
+import pytest_asyncio
 import sys
 import os
+import json
+import time
+import asyncio
+import threading
 
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
 
-from app.core.rule_engine import RuleEngine
+from app.core.rule_engine import RuleEngine, RuleValidationError, compile_patterns
+from app.core.matchers import build_matcher
+from app.core.prefilter import extract_literals
+from app.core.rules_watcher import RulesFileWatcher
+from app.core.rule_artifact import artifact_path
+from app.core.sentiment import SentimentAnalyzer
+from app.core.redos import analyze_pattern
+from app.core.executor import RuleExecutor
+from app.core.metrics import MetricsRegistry
+from app.core.tenants import RuleSetRegistry, TenantRulesError, UnknownTenantError
+from app.services.chat_writer import ChatWriter
+from app.services.conversation_service import decode_cursor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../benchmarks')))
+from synthetic import generate_corpus, generate_rules
 
 
 @pytest.fixture
@@ -18,6 +37,58 @@ def rule_engine():
     return RuleEngine(rules_file)
 
 
+@pytest.fixture
+def db_schema():
+    """SQL run on the database file before it is initialized (override to test migrations)"""
+    return None
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path, db_schema):
+    """Session factory of a SQLite database file initialized the way init_db does"""
+    import sqlite3
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from app.core.database import _create_missing_columns, _create_missing_indexes, _migrate_dictionary_columns
+    from app.models.conversation import Base
+    
+    path = tmp_path / 'chat.db'
+    if db_schema:
+        legacy = sqlite3.connect(path)
+        legacy.executescript(db_schema)
+        legacy.close()
+    db_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.run_sync(_migrate_dictionary_columns)
+    yield async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+    await db_engine.dispose()
+
+
+@pytest.fixture
+def api_client(tmp_path, monkeypatch):
+    """TestClient of the app with every database session on a fresh SQLite file"""
+    from fastapi.testclient import TestClient
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from app.api import endpoints
+    from app.core import database
+    from app.main import app
+    
+    db_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    factory = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(database, 'engine', db_engine)
+    monkeypatch.setattr(database, 'read_engine', db_engine)
+    for module in (database, endpoints):
+        monkeypatch.setattr(module, 'AsyncSessionLocal', factory)
+        monkeypatch.setattr(module, 'AsyncReadSessionLocal', factory)
+    for component in (endpoints.chat_writer, endpoints.session_registry, endpoints.archive_job):
+        monkeypatch.setattr(component, 'session_factory', factory)
+    monkeypatch.setattr(endpoints.archive_job, 'read_session_factory', factory)
+    with TestClient(app) as client:
+        yield client
+
+
 def test_greeting_intent(rule_engine):
     """Test greeting intent matching"""
     messages = ["hello", "hi", "hey there", "good morning"]
@@ -120,3 +191,1163 @@ def test_pattern_matching_case_insensitive(rule_engine):
     result3 = rule_engine.process_message("HeLLo")
     
     assert result1['intent'] == result2['intent'] == result3['intent']
+
+
+def test_patterns_compiled_at_load(rule_engine):
+    """Test that every intent pattern is precompiled with its source position"""
+    total_patterns = sum(len(intent.get('patterns', [])) for intent in rule_engine.intents)
+    assert len(rule_engine.patterns) == total_patterns
+    
+    first = rule_engine.patterns[0]
+    assert first.intent_index == 0
+    assert first.pattern_index == 0
+    assert first.source == rule_engine.intents[0]['patterns'][0]
+    assert first.regex.search("hello")
+
+
+def test_invalid_pattern_rejected_at_load(tmp_path):
+    """Test that a rules file with a broken regex is rejected when loaded"""
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(
+        "intents:\n"
+        "- intent: broken\n"
+        "  patterns:\n"
+        "  - '(unclosed'\n"
+        "  responses:\n"
+        "  - never\n"
+    )
+    
+    with pytest.raises(RuleValidationError):
+        compile_patterns([{'intent': 'broken', 'patterns': ['(unclosed']}])
+    
+    engine = RuleEngine(str(rules_file))
+    assert 'broken' not in engine.get_available_intents()
+
+
+def test_combined_matcher_matches_loop():
+    """Test that the single-pass matcher returns the same result as the loop matcher"""
+    rules_file = os.path.join(os.path.dirname(__file__), '../rules/chatbot_rules.yaml')
+    loop_engine = RuleEngine(rules_file, match_strategy='loop')
+    combined_engine = RuleEngine(rules_file, match_strategy='combined')
+    assert combined_engine.matcher.name == 'combined'
+    
+    messages = [
+        "hello", "hey there", "bye", "thank you", "help", "what can you do",
+        "who are you", "asdfghjkl", "random gibberish", "i need help, thanks"
+    ]
+    for msg in messages:
+        processed = loop_engine.preprocess_message(msg)
+        assert combined_engine.match_intent(processed) == loop_engine.match_intent(processed)
+
+
+def test_combined_matcher_preserves_priority_order():
+    """Test that an earlier pattern wins even when a later one matches earlier in the text"""
+    intents = [
+        {'intent': 'world', 'patterns': [r'\bworld\b']},
+        {'intent': 'hello', 'patterns': [r'^hello']},
+    ]
+    patterns = compile_patterns(intents)
+    matcher = build_matcher('combined', patterns)
+    
+    assert matcher.name == 'combined'
+    assert matcher.match("hello world").intent_name == 'world'
+    assert matcher.match("hello there").intent_name == 'hello'
+    assert matcher.match("nothing here") is None
+
+
+def test_extract_required_literals():
+    """Test extraction of the literals a pattern cannot match without"""
+    assert extract_literals(r'\bthank you\b') == {'thank you'}
+    assert extract_literals(r'^(hi|hello|hey)\b') == {'hi', 'hello', 'hey'}
+    assert extract_literals(r'\bHELP\b') == {'help'}
+    assert extract_literals(r'\bare you (a )?bot\b') == {'are you bot', 'are you a bot'}
+    assert extract_literals(r'\b(price|cost)s?\b') == {'price', 'cost'}
+    assert extract_literals(r'\b(a|.+)\b') is None
+    assert extract_literals(r'\d+') is None
+
+
+def test_prefilter_matches_full_scan(rule_engine):
+    """Test that the literal prefilter never changes the matched pattern"""
+    unfiltered = build_matcher('loop', rule_engine.patterns, prefilter=False)
+    prefiltered = build_matcher('loop', rule_engine.patterns, prefilter=True)
+    
+    messages = [
+        "hello", "thanks a lot", "what is the price of a laptop", "i need help",
+        "asdfghjkl", "xyz123", "how long until delivery arrives", "PAYMENT options"
+    ]
+    for msg in messages:
+        processed = rule_engine.preprocess_message(msg)
+        assert prefiltered.match(processed) is unfiltered.match(processed)
+
+
+def test_prefilter_skips_impossible_patterns(rule_engine):
+    """Test that an unmatched message only evaluates a handful of patterns"""
+    index = build_matcher('loop', rule_engine.patterns, prefilter=True).index
+    
+    assert index.candidates("asdfghjkl") == sorted(index.always)
+    assert len(index.candidates("thank you")) < len(rule_engine.patterns) // 10
+
+
+def test_result_cache_hits_and_invalidation(tmp_path):
+    """Test that repeated messages are served from the cache until rules reload"""
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(
+        "intents:\n"
+        "- intent: greeting\n"
+        "  patterns:\n"
+        "  - \\bhello\\b\n"
+        "  responses:\n"
+        "  - Hi!\n"
+        "  - Hello!\n"
+    )
+    engine = RuleEngine(str(rules_file), cache_size=2)
+    
+    assert engine.process_message("Hello")['intent'] == 'greeting'
+    assert engine.process_message("  hello ")['intent'] == 'greeting'
+    stats = engine.get_cache_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    
+    responses = {engine.process_message("hello")['response'] for _ in range(50)}
+    assert responses == {'Hi!', 'Hello!'}
+    
+    rules_file.write_text(rules_file.read_text().replace('greeting', 'salutation'))
+    engine.reload_rules()
+    assert engine.get_cache_stats()['size'] == 0
+    assert engine.process_message("hello")['intent'] == 'salutation'
+
+
+def test_result_cache_disabled_by_default(rule_engine):
+    """Test that the engine does not cache unless a size is given"""
+    assert rule_engine.get_cache_stats() is None
+
+
+def test_process_batch(rule_engine):
+    """Test that batch processing matches per-message processing in order"""
+    messages = ["hello", "asdfghjkl", "thanks", "  HELLO ", ""]
+    results = rule_engine.process_batch(messages)
+    
+    assert len(results) == len(messages)
+    for msg, result in zip(messages, results):
+        expected = rule_engine.process_message(msg)
+        assert result['intent'] == expected['intent']
+        assert result['matched_pattern'] == expected['matched_pattern']
+        assert result['response'] is not None
+
+
+def test_failed_reload_keeps_last_good_snapshot(tmp_path):
+    """Test that a broken rules edit does not replace the active rules"""
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(
+        "intents:\n"
+        "- intent: greeting\n"
+        "  patterns:\n"
+        "  - \\bhello\\b\n"
+        "  responses:\n"
+        "  - Hi!\n"
+    )
+    engine = RuleEngine(str(rules_file))
+    snapshot = engine.snapshot
+    
+    rules_file.write_text("intents:\n- intent: broken\n  patterns:\n  - '(unclosed'\n")
+    assert engine.reload_rules() is False
+    assert engine.snapshot is snapshot
+    assert engine.process_message("hello")['intent'] == 'greeting'
+    
+    rules_file.unlink()
+    assert engine.reload_rules() is False
+    assert engine.snapshot is snapshot
+
+
+def test_rules_watcher_reloads_on_change(tmp_path):
+    """Test that the file watcher publishes a new snapshot when the file changes"""
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text("intents:\n- intent: first\n  patterns:\n  - \\bhello\\b\n")
+    engine = RuleEngine(str(rules_file))
+    watcher = RulesFileWatcher(engine)
+    
+    assert watcher.check() is False
+    
+    rules_file.write_text("intents:\n- intent: second\n  patterns:\n  - \\bhello\\b\n  - \\bhi\\b\n")
+    assert watcher.check() is True
+    assert engine.get_available_intents() == ['second']
+    assert watcher.check() is False
+
+
+def test_compiled_artifact_cache(tmp_path, monkeypatch):
+    """Test that a fresh artifact is used instead of the YAML and its analysis, and rebuilt when stale"""
+    from app.core import rule_engine as rule_engine_module
+    
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(
+        "intents:\n"
+        "- intent: greeting\n"
+        "  patterns:\n"
+        "  - ^(hi|hello)\\b\n"
+        "  - (a+)+$\n"
+        "- intent: farewell\n"
+        "  patterns:\n"
+        "  - \\bbye\\b\n"
+    )
+    # The default location is the user cache, never the rules file's directory
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / "cache"))
+    artifact = artifact_path(str(rules_file))
+    assert artifact.parent == tmp_path / "cache" / "chatbot" / "rules"
+    
+    engine = RuleEngine(str(rules_file), artifact_cache=True)
+    assert artifact.exists() and not list(tmp_path.glob("rules.yaml*.json"))
+    
+    # Loading from the artifact runs no pattern analysis
+    def analyze_pattern(*args):
+        raise AssertionError("pattern analyzed despite a fresh artifact")
+    analyze = rule_engine_module.analyze_pattern
+    monkeypatch.setattr(rule_engine_module, 'analyze_pattern', analyze_pattern)
+    cached = RuleEngine(str(rules_file), artifact_cache=True)
+    assert cached.snapshot.source_hash == engine.snapshot.source_hash
+    assert cached.patterns[0].literals == {'hi', 'hello'}
+    assert cached.get_redos_risks() == engine.get_redos_risks() != []
+    assert cached.process_message("hello")['intent'] == 'greeting'
+    monkeypatch.setattr(rule_engine_module, 'analyze_pattern', analyze)
+    
+    rules_file.write_text(rules_file.read_text().replace('farewell', 'goodbye'))
+    cached.reload_rules()
+    assert cached.get_available_intents() == ['greeting', 'goodbye']
+    assert json.loads(artifact.read_text())['source_sha256'] == cached.snapshot.source_hash
+
+
+def test_reload_reuses_unchanged_intents(tmp_path):
+    """Test that reloading only recompiles intents whose content changed"""
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(
+        "intents:\n"
+        "- intent: greeting\n"
+        "  patterns:\n"
+        "  - \\bhello\\b\n"
+        "- intent: farewell\n"
+        "  patterns:\n"
+        "  - \\bbye\\b\n"
+    )
+    engine = RuleEngine(str(rules_file))
+    greeting, farewell = engine.patterns
+    
+    rules_file.write_text(rules_file.read_text().replace('\\bbye\\b', '\\bgoodbye\\b'))
+    assert engine.reload_rules()
+    
+    assert engine.patterns[0].regex is greeting.regex
+    assert engine.patterns[1].regex is not farewell.regex
+    assert engine.process_message("goodbye")['intent'] == 'farewell'
+
+
+def test_sentiment_matches_whole_tokens_only(rule_engine):
+    """Test that sentiment words inside other words are not counted"""
+    assert rule_engine.analyze_sentiment("where is my badge") == 'neutral'
+    assert rule_engine.analyze_sentiment("the crusade continues") == 'neutral'
+    assert rule_engine.analyze_sentiment("bad service") == 'negative'
+
+
+def test_sentiment_negation(rule_engine):
+    """Test that negations flip polarity until the end of the clause"""
+    assert rule_engine.analyze_sentiment("this is not good") == 'negative'
+    assert rule_engine.analyze_sentiment("i don't hate it") == 'positive'
+    assert rule_engine.analyze_sentiment("not now, but great work") == 'positive'
+
+
+def test_sentiment_lexicon_from_config():
+    """Test weights, word lists and batch mode of a configured analyzer"""
+    analyzer = SentimentAnalyzer.from_config({
+        'positive': {'nice': 0.5},
+        'negative': ['broken'],
+        'negations': ['hardly']
+    })
+    
+    assert analyzer.score("nice but broken") == -0.5
+    assert analyzer.analyze("hardly broken") == 'positive'
+    assert analyzer.analyze_batch(["nice", "broken", "nice", ""]) == [
+        'positive', 'negative', 'positive', 'neutral'
+    ]
+
+
+def test_redos_static_analysis(rule_engine):
+    """Test that backtracking-prone constructs are flagged and shipped rules are clean"""
+    for source in [r'(a+)+$', r'(\w+\s?)*$', r'(a|aa)+$', r'\w*\w*x']:
+        assert analyze_pattern(source), source
+    for source in [r'(a|b)+', r'\d+\s+\d+', r'^(hi|hello)\b', r'.*thanks?']:
+        assert analyze_pattern(source) == (), source
+    
+    assert rule_engine.get_redos_risks() == []
+
+
+def test_redos_reject_policy():
+    """Test that the reject policy refuses risky patterns and the warn policy records them"""
+    intents = [{'intent': 'risky', 'patterns': [r'^(a+)+$']}]
+    
+    with pytest.raises(RuleValidationError):
+        compile_patterns(intents, redos_policy='reject')
+    
+    compiled = compile_patterns(intents)
+    assert compiled[0].risks
+
+
+def test_match_time_budget_falls_back(tmp_path):
+    """Test that a message matching over budget gets the fallback and is reported"""
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(
+        "intents:\n"
+        "- intent: slow\n"
+        "  patterns:\n"
+        "  - '^(a|aa)+$'\n"
+        "  responses:\n"
+        "  - never\n"
+        "fallback_responses:\n"
+        "- fallback\n"
+    )
+    engine = RuleEngine(str(rules_file), cache_size=8, match_time_budget_ms=0.001)
+    
+    result = engine.process_message("a" * 24 + "!")
+    assert result['intent'] == 'fallback'
+    assert result['confidence'] == 0.0
+    assert engine.get_cache_stats()['size'] == 0
+    
+    violations = engine.get_budget_violations()
+    assert violations[0]['intent'] == 'slow'
+    assert violations[0]['count'] == 1
+    
+    # Under a budget every pattern gets an interruptible copy, not only flagged ones
+    rules_file.write_text("intents:\n- {intent: hi, patterns: ['\\bhi\\b'], responses: [ok]}\n")
+    assert all(compiled.guarded is not None for compiled in RuleEngine(str(rules_file), match_time_budget_ms=50).patterns)
+    assert all(compiled.guarded is None for compiled in RuleEngine(str(rules_file)).patterns)
+
+
+def test_ranked_scoring_returns_alternates():
+    """Test that ranked mode scores every matching intent and keeps the top k"""
+    rules_file = os.path.join(os.path.dirname(__file__), '../rules/chatbot_rules.yaml')
+    engine = RuleEngine(rules_file, scoring='ranked', top_k=2)
+    
+    result = engine.process_message("hi, can you help me?")
+    assert result['intent'] == 'greeting'
+    assert len(result['alternates']) == 1
+    assert result['alternates'][0]['intent'] == 'help'
+    assert 0 < result['alternates'][0]['confidence'] <= result['confidence'] < 1
+    
+    exact = engine.process_message("hello")
+    assert exact['intent'] == 'greeting'
+    assert exact['confidence'] > result['confidence']
+    assert exact['alternates'] == []
+    
+    fallback = engine.process_message("xyzabc123")
+    assert fallback['intent'] == 'fallback'
+    assert fallback['alternates'] == []
+
+
+def test_ranked_scoring_agrees_across_matchers():
+    """Test that ranked results do not depend on the matching strategy"""
+    rules_file = os.path.join(os.path.dirname(__file__), '../rules/chatbot_rules.yaml')
+    loop = RuleEngine(rules_file, scoring='ranked', prefilter=False)
+    combined = RuleEngine(rules_file, match_strategy='combined', scoring='ranked')
+    
+    for msg in ["hi, can you help me?", "thank you, goodbye", "what can you do", "random text"]:
+        processed = loop.preprocess_message(msg)
+        assert loop.classify_message(processed)[1:] == combined.classify_message(processed)[1:]
+
+
+@pytest.mark.parametrize("mode", ["inline", "thread", "process"])
+def test_executor_modes(rule_engine, mode):
+    """Test that every execution mode gives the engine's answers and records metrics"""
+    executor = RuleExecutor(RuleEngine(rule_engine.rules_file, cache_size=16), mode=mode, workers=1)
+    
+    async def run():
+        single = await executor.process_message("hello")
+        batch = await executor.process_batch(["goodbye", "xyzabc123"])
+        return single, batch
+    
+    try:
+        single, batch = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    
+    assert single['intent'] == 'greeting'
+    assert [result['intent'] for result in batch] == ['farewell', 'fallback']
+    stats = executor.stats()
+    assert stats['mode'] == mode
+    assert stats['completed'] == 2
+    assert stats['in_flight'] == 0
+    assert stats['queue_depth'] == 0
+    # Process workers report their cache lookups back to the parent
+    cache = executor.cache_stats()
+    assert cache['misses'] == 3 and cache['hits'] == 0 and cache['size'] == 3
+
+
+def test_process_worker_reports_and_reloads_once_per_parent_version(tmp_path, monkeypatch):
+    """Test that a worker call reports cache lookups and violations and reloads only to follow the parent"""
+    from collections import OrderedDict
+    from app.core import executor as executor_module
+    
+    monkeypatch.setattr(executor_module, '_worker_engines', OrderedDict())
+    monkeypatch.setattr(executor_module, '_worker_targets', {})
+    rules_file = tmp_path / "rules.yaml"
+    
+    def write_rules(word):
+        rules_file.write_text(
+            f"intents:\n- {{intent: slow, patterns: ['^(a|aa)+$'], responses: [never]}}\n"
+            f"- {{intent: {word}, patterns: ['\\b{word}\\b'], responses: [ok]}}\n"
+        )
+    
+    write_rules("widget")
+    parent = RuleEngine(str(rules_file), cache_size=8, match_time_budget_ms=20)
+    kwargs = parent.constructor_kwargs()
+    slow = "a" * 48 + "!"
+    
+    def run(*messages):
+        _, results, report = executor_module._run_in_worker(
+            'process_batch', kwargs, parent.snapshot.source_hash, list(messages)
+        )
+        executor = RuleExecutor(parent, mode='process')
+        executor._merge_report(parent, report)
+        return [result['intent'] for result in results], report
+    
+    intents, report = run("widget", "widget", slow)
+    assert intents == ['widget', 'widget', 'fallback']
+    assert report['cache'] == {'hits': 0, 'misses': 2, 'size': 1}
+    assert [(entry['intent'], entry['count']) for entry in report['violations']] == [('slow', 1)]
+    assert parent.get_budget_violations()[0]['count'] == 1
+    worker = executor_module._worker_engines[str(rules_file)]
+    
+    # The parent moves to a new version but the file changes again before the worker runs
+    write_rules("gadget")
+    parent.reload_rules()
+    write_rules("sprocket")
+    assert run("sprocket")[0] == ['sprocket']
+    loaded = worker.snapshot
+    write_rules("cog")
+    # Still behind the parent, but the worker does not reload again for the same parent version
+    assert run("sprocket")[0] == ['sprocket'] and worker.snapshot is loaded
+    assert run(slow)[1]['violations'][0]['count'] == 1
+
+
+def test_synthetic_benchmark_rules(tmp_path):
+    """Test that synthetic rule sets load and their corpora match as generated"""
+    import yaml
+    rules_file = tmp_path / "synthetic.yaml"
+    rules_file.write_text(yaml.safe_dump(generate_rules(50, patterns_per_intent=4)))
+    engine = RuleEngine(str(rules_file))
+    assert len(engine.patterns) == 200
+    
+    matching, non_matching = generate_corpus(engine.patterns, 100)
+    assert len(matching) == 100
+    for message, intent in matching:
+        assert engine.process_message(message)['intent'] == intent
+    for message in non_matching:
+        assert engine.process_message(message)['intent'] == 'fallback'
+
+
+def test_metrics_render_and_aggregate_across_processes(tmp_path):
+    """Test Prometheus rendering and merging of another worker's snapshot"""
+    worker = MetricsRegistry()
+    worker.configure(directory=str(tmp_path))
+    worker.record_result({'intent': 'greeting', 'matched_pattern': r'\bhi\b'})
+    worker.record_result({'intent': 'fallback', 'matched_pattern': None})
+    worker.observe('chatbot_stage_duration_seconds', 0.003, ('rule_engine',))
+    worker.flush()
+    # Pretend the snapshot was written by a different worker process
+    os.replace(worker._snapshot_path(), tmp_path / "metrics-999999.json")
+    
+    local = MetricsRegistry()
+    local.configure(directory=str(tmp_path))
+    local.record_result({'intent': 'greeting', 'matched_pattern': r'\bhi\b'})
+    text = local.render()
+    
+    assert 'chatbot_messages_total 3' in text
+    assert 'chatbot_intent_total{intent="greeting"} 2' in text
+    assert 'chatbot_pattern_matches_total{intent="greeting",pattern="\\\\bhi\\\\b"} 2' in text
+    assert 'chatbot_stage_duration_seconds_bucket{stage="rule_engine",le="0.0025"} 0' in text
+    assert 'chatbot_stage_duration_seconds_bucket{stage="rule_engine",le="0.005"} 1' in text
+    assert 'chatbot_stage_duration_seconds_count{stage="rule_engine"} 1' in text
+    assert 'chatbot_fallback_ratio 0.3333' in text
+    
+    # Concurrent flushes each write their own temporary file and leave none behind
+    threads = [threading.Thread(target=local.flush) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(os.listdir(tmp_path)) == sorted(["metrics-999999.json", os.path.basename(local._snapshot_path())])
+    assert json.loads(open(local._snapshot_path()).read()) == local.snapshot()
+    local.close()
+    worker.close()
+    
+    # Recording never writes; the background thread does
+    background = MetricsRegistry()
+    background.configure(directory=str(tmp_path / "background"), flush_interval=0.01)
+    background.inc('chatbot_messages_total')
+    deadline = time.monotonic() + 5
+    while not os.path.exists(background._snapshot_path()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    background.close()
+    assert json.loads(open(background._snapshot_path()).read()) == background.snapshot()
+
+
+def test_adaptive_order_within_priority_groups(tmp_path):
+    """Test that hot intents move up inside their priority group only"""
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(
+        "intents:\n"
+        "- {intent: apple, priority: 1, patterns: ['\\bapple\\b'], responses: [a]}\n"
+        "- {intent: cherry, priority: 1, patterns: ['\\bcherry\\b'], responses: [c]}\n"
+        "- {intent: fruit, patterns: ['fruit'], responses: [f]}\n"
+        "- {intent: grape, priority: 1, patterns: ['grape'], responses: [g]}\n"
+    )
+    engine = RuleEngine(str(rules_file), adaptive_order=True, reorder_interval=5)
+    assert engine.snapshot.priority_groups == ((0, 1), (2,), (3,))
+    
+    for _ in range(10):
+        engine.process_message("cherry")
+    assert engine.get_evaluation_order() == ['cherry', 'apple', 'fruit', 'grape']
+    
+    # Groups keep file order, so 'fruit' still beats the hot 'grape'
+    for _ in range(10):
+        engine.process_message("grape")
+    assert engine.process_message("grape fruit")['intent'] == 'fruit'
+    assert engine.process_message("apple")['intent'] == 'apple'
+
+
+def test_priority_must_be_integer():
+    """Test that a non-integer priority is rejected"""
+    from app.core.rule_engine import priority_groups
+    with pytest.raises(RuleValidationError):
+        priority_groups([{'intent': 'x', 'priority': 'high'}])
+
+
+def test_tenant_registry_lazy_load_evict_and_reload(tmp_path):
+    """Test lazy per-tenant loading, LRU eviction under the cap and isolated reloads"""
+    for tenant, word in [("acme", "widget"), ("globex", "gadget"), ("initech", "stapler")]:
+        (tmp_path / f"{tenant}.yaml").write_text(
+            f"intents:\n- {{intent: {word}, patterns: ['\\b{word}\\b'], responses: [ok]}}\n"
+        )
+    registry = RuleSetRegistry(str(tmp_path), max_memory_mb=100)
+    assert registry.available() == ["acme", "globex", "initech"]
+    assert not registry.is_loaded("acme")
+    
+    acme = registry.get("acme")
+    assert registry.get("acme") is acme and registry.loads == 1
+    assert acme.process_message("my widget")['intent'] == 'widget'
+    assert registry.get("globex").process_message("my widget")['intent'] == 'fallback'
+    
+    with pytest.raises(UnknownTenantError):
+        registry.get("../acme")
+    with pytest.raises(UnknownTenantError):
+        registry.get("umbrella")
+    
+    # Reloading one tenant leaves the others' snapshots alone
+    globex_snapshot = registry.get("globex").snapshot
+    (tmp_path / "acme.yaml").write_text("intents:\n- {intent: sprocket, patterns: ['sprocket'], responses: [ok]}\n")
+    assert registry.reload("acme") is True
+    assert acme.get_available_intents() == ['sprocket']
+    assert registry.get("globex").snapshot is globex_snapshot
+    
+    # A cap that fits one tenant keeps only the most recently used one
+    registry.max_memory_bytes = registry.stats()['estimated_bytes']['acme']
+    registry.get("initech")
+    assert registry.stats()['loaded'] == ["initech"]
+    assert registry.evictions == 2
+
+
+def test_tenant_registry_rejects_broken_rules_file(tmp_path):
+    """Test that a tenant whose rules fail to load is not served the default rules"""
+    (tmp_path / "acme.yaml").write_text("intents: [unclosed\n")
+    registry = RuleSetRegistry(str(tmp_path))
+    
+    for _ in range(2):
+        with pytest.raises(TenantRulesError):
+            registry.get("acme")
+    assert not registry.is_loaded("acme") and registry.loads == 0
+    
+    # Fixing the file makes the next request load it
+    (tmp_path / "acme.yaml").write_text("intents:\n- {intent: widget, patterns: ['widget'], responses: [ok]}\n")
+    assert registry.get("acme").process_message("my widget")['intent'] == 'widget'
+
+
+def test_fuzzy_fallback_for_typos(tmp_path):
+    """Test that misspelled keywords match with reduced confidence, only when regexes miss"""
+    rules_file = os.path.join(os.path.dirname(__file__), '../rules/chatbot_rules.yaml')
+    engine = RuleEngine(rules_file, fuzzy_fallback=True)
+    
+    for message, intent in [("helo", "greeting"), ("thnaks", "gratitude"), ("prodcts", "product_info")]:
+        result = engine.process_message(message)
+        assert result['intent'] == intent
+        assert 0.3 < result['confidence'] < 0.95
+    
+    assert engine.process_message("hello")['confidence'] == 0.95
+    assert engine.process_message("the weather is nice")['intent'] == 'fallback'
+    assert RuleEngine(rules_file).process_message("helo")['intent'] == 'fallback'
+    
+    # Real words are not typos of the keywords they resemble
+    for message in ["hell", "jello", "shopping", "prize", "produce", "score", "change my order"]:
+        assert engine.process_message(message)['intent'] == 'fallback'
+    
+    # The index follows reloads
+    custom = tmp_path / "rules.yaml"
+    custom.write_text("intents:\n- {intent: order, patterns: ['\\border status\\b'], responses: [ok]}\n")
+    engine = RuleEngine(str(custom), fuzzy_fallback=True)
+    assert engine.process_message("ordr staus")['intent'] == 'order'
+    custom.write_text("intents:\n- {intent: refund, patterns: ['\\brefund\\b'], responses: [ok]}\n")
+    engine.reload_rules()
+    assert engine.process_message("ordr staus")['intent'] == 'fallback'
+    assert engine.process_message("refnud")['intent'] == 'refund'
+
+
+def test_fuzzy_fallback_known_words_come_from_rules_and_vocabulary(tmp_path):
+    """Test that words of the responses, known_words and the vocabulary file are never corrected"""
+    custom = tmp_path / "rules.yaml"
+    intents = "intents:\n- {intent: locations, patterns: ['\\bstore\\b'], responses: [Find a store near you]}\n"
+    custom.write_text(intents)
+    engine = RuleEngine(str(custom), fuzzy_fallback=True)
+    assert [engine.process_message(m)['intent'] for m in ["score", "stores", "stroe"]] == ['locations'] * 3
+    
+    # Words of the responses and the known_words list are real words
+    custom.write_text(intents.replace("near you", "near you, all stores") + "known_words: [score]\n")
+    engine.reload_rules()
+    assert [engine.process_message(m)['intent'] for m in ["score", "stores", "stroe"]] == [
+        'fallback', 'fallback', 'locations'
+    ]
+    
+    # So are the words of a vocabulary file, such as a frequency list
+    words = tmp_path / "words.txt"
+    words.write_text("# word frequency list\nstores 1200\nscore 800\n")
+    custom.write_text(intents)
+    engine = RuleEngine(str(custom), fuzzy_fallback=True, fuzzy_vocabulary_file=str(words))
+    assert [engine.process_message(m)['intent'] for m in ["score", "stores", "stroe"]] == [
+        'fallback', 'fallback', 'locations'
+    ]
+    unreadable = RuleEngine(str(custom), fuzzy_fallback=True, fuzzy_vocabulary_file=str(tmp_path / "missing"))
+    assert unreadable.process_message("score")['intent'] == 'locations'
+
+
+@pytest.mark.asyncio
+async def test_write_behind_group_commits_and_flushes_on_stop(session_factory, rule_engine):
+    """Test that queued chat turns are committed together and flushed on stop"""
+    from sqlalchemy import func, select
+    from app.models.conversation import Analytics, Conversation, Message
+    
+    writer = ChatWriter(session_factory, mode='write_behind', max_batch=100, flush_interval_ms=10_000)
+    for index, message in enumerate(["hello", "thanks", "bye"]):
+        await writer.save(None, "s1", [message], [rule_engine.process_message(message)], 5, new_session=index == 0)
+    assert writer.stats()['written'] == 0
+    
+    await writer.stop()
+    async with session_factory() as db:
+        counts = [
+            (await db.execute(select(func.count()).select_from(model))).scalar()
+            for model in (Conversation, Message, Analytics)
+        ]
+    assert counts == [1, 6, 3]
+    assert writer.stats()['written'] == 3 and writer.stats()['commits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_write_behind_isolates_failing_turns(session_factory, rule_engine):
+    """Test that a failed batch is retried turn by turn and lost turns are reported"""
+    from sqlalchemy import func, select
+    from app.models.conversation import Conversation, Message
+    
+    writer = ChatWriter(session_factory, mode='write_behind', max_batch=100, flush_interval_ms=10_000, retries=0)
+    hello = rule_engine.process_message("hello")
+    # A None message violates NOT NULL, failing its turn and any batch holding it
+    turns = [("s1", "hello", True), ("s2", None, True), ("s1", "hello", False), ("s2", "hello", False)]
+    for session_id, message, new_session in turns:
+        await writer.save(None, session_id, [message], [hello], 5, new_session=new_session)
+    await writer.stop()
+    async with session_factory() as db:
+        sessions = (await db.execute(select(Conversation.session_id).order_by(Conversation.session_id))).scalars().all()
+        messages = (await db.execute(select(func.count()).select_from(Message))).scalar()
+    
+    # s2's creating turn was lost; its next turn created the session
+    assert sessions == ["s1", "s2"] and messages == 6
+    stats, health = writer.stats(), writer.health()
+    assert stats['written'] == 3 and stats['failed'] == 1 and stats['split_batches'] == 1
+    assert not health['healthy'] and health['failed_turns'] == 1 and health['last_error']
+
+
+def test_chat_is_read_back_by_history_and_analytics(api_client):
+    """Test that a turn answered by /chat is visible to /history and /analytics right away"""
+    first = api_client.post("/api/v1/chat", json={"message": "hello"})
+    assert first.status_code == 200
+    session_id = first.json()['session_id']
+    second = api_client.post("/api/v1/chat", json={"message": "xyzzy", "session_id": session_id})
+    assert second.status_code == 200 and second.json()['intent'] == 'fallback'
+    
+    # From the history buffer and from the database
+    for params in ({}, {'include_archived': True}):
+        history = api_client.get(f"/api/v1/history/{session_id}", params=params).json()
+        assert [(m['message'], m['is_user']) for m in history['messages']] == [
+            ("hello", True), (first.json()['response'], False), ("xyzzy", True), (second.json()['response'], False)
+        ]
+        assert [m['intent'] for m in history['messages'] if not m['is_user']] == ['greeting', 'fallback']
+    
+    analytics = api_client.get(f"/api/v1/analytics/{session_id}").json()
+    assert analytics['total_interactions'] == 2
+    assert analytics['intent_distribution'] == {'greeting': 1, 'fallback': 1}
+
+
+@pytest.mark.asyncio
+async def test_history_keyset_pagination_and_export(session_factory, rule_engine):
+    """Test paging history in both directions and streaming the full export"""
+    from app.services.conversation_service import ConversationService
+    
+    async with session_factory() as db:
+        messages = [f"hello {index}" for index in range(5)]
+        await ConversationService.save_batch(
+            db, "s1", messages, [rule_engine.process_message(m) for m in messages], 1, new_session=True
+        )
+        
+        first = await ConversationService.get_history_page(db, "s1", limit=4)
+        second = await ConversationService.get_history_page(db, "s1", limit=4, after=first['next_cursor'])
+        third = await ConversationService.get_history_page(db, "s1", limit=4, after=second['next_cursor'])
+        back = await ConversationService.get_history_page(db, "s1", limit=4, before=third['prev_cursor'])
+        newest = await ConversationService.get_history_page(db, "s1", limit=3, latest=True)
+        exported = [m async for m in ConversationService.iter_conversation_history(db, "s1", batch_size=3)]
+    
+    ids = [m['id'] for m in exported]
+    assert len(ids) == 10 and ids == sorted(ids)
+    assert exported[0]['message'] == "hello 0" and exported[0]['is_user']
+    
+    assert [m['id'] for m in first['messages'] + second['messages'] + third['messages']] == ids
+    assert first['prev_cursor'] is None and third['next_cursor'] is None
+    assert back['messages'] == second['messages']
+    assert [m['id'] for m in newest['messages']] == ids[-3:] and newest['next_cursor'] is None
+    
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_analytics_rollup_matches_rows_and_backfill(session_factory, rule_engine):
+    """Test that session analytics come from rollups kept in step with analytics rows"""
+    from sqlalchemy import delete
+    from app.models.conversation import AnalyticsRollup
+    from app.services.conversation_service import ConversationService
+    
+    async with session_factory() as db:
+        messages = ["hello", "hi there", "thanks"]
+        await ConversationService.save_batch(
+            db, "s1", messages, [rule_engine.process_message(m) for m in messages], 10, new_session=True
+        )
+        await ConversationService.save_turns(db, [{
+            'session_id': "s1",
+            'messages': ["hello", "xyzzy"],
+            'results': [rule_engine.process_message("hello"), rule_engine.process_message("xyzzy")],
+            'response_time_ms': 40
+        }])
+        await ConversationService.save_analytics(db, "s1", None, None, 25)
+        live = await ConversationService.get_session_analytics(db, "s1")
+        assert live['total_interactions'] == 6
+        assert live['avg_response_time_ms'] == round((3 * 10 + 2 * 40 + 25) / 6, 2)
+        assert live['max_response_time_ms'] == 40
+        assert live['intent_distribution']['greeting'] == 3
+        assert live['intent_distribution']['fallback'] == 1 and live['intent_distribution']['unknown'] == 1
+        
+        # Data written before rollups existed: answered from rows, then backfilled
+        await db.execute(delete(AnalyticsRollup))
+        await db.commit()
+        assert await ConversationService.get_session_analytics(db, "s1") == live
+        assert await ConversationService.rebuild_analytics_rollups(db) == len(live['intent_distribution'])
+        assert await ConversationService.get_session_analytics(db, "s1") == live
+
+
+@pytest.mark.asyncio
+async def test_global_analytics_buckets(session_factory, rule_engine):
+    """Test that time buckets count turns across sessions and match a rebuild"""
+    from datetime import datetime, timedelta
+    from app.services.conversation_service import ConversationService
+    
+    first_hour = datetime(2024, 5, 1, 9, 59, 30)
+    window = (first_hour - timedelta(hours=1), first_hour + timedelta(hours=2))
+    async with session_factory() as db:
+        await ConversationService.save_turns(db, [
+            {'session_id': "a", 'messages': ["hello", "xyzzy"],
+             'results': [rule_engine.process_message("hello"), rule_engine.process_message("xyzzy")],
+             'response_time_ms': 3, 'timestamp': first_hour},
+            {'session_id': "b", 'messages': ["hello"], 'results': [rule_engine.process_message("hello")],
+             'response_time_ms': 300, 'timestamp': first_hour + timedelta(seconds=45)},
+        ])
+        hourly = await ConversationService.get_analytics_buckets(db, 'hour', *window)
+        minutes = await ConversationService.get_analytics_buckets(db, 'minute', *window)
+        await ConversationService.rebuild_analytics_buckets(db, batch_size=2)
+        assert await ConversationService.get_analytics_buckets(db, 'hour', *window) == hourly
+        with pytest.raises(ValueError):
+            await ConversationService.get_analytics_buckets(db, 'minute', window[0], window[0] + timedelta(days=30))
+    
+    assert [bucket['start'] for bucket in hourly['buckets']] == ["2024-05-01T09:00:00", "2024-05-01T10:00:00"]
+    assert [bucket['start'] for bucket in minutes['buckets']] == ["2024-05-01T09:59:00", "2024-05-01T10:00:00"]
+    
+    totals = hourly['totals']
+    assert totals['interactions'] == 3 and totals['fallbacks'] == 1
+    assert totals['fallback_rate'] == round(1 / 3, 4)
+    assert totals['avg_response_time_ms'] == 102.0
+    assert totals['intents'] == {'greeting': 2, 'fallback': 1}
+    assert totals['latency_ms'] == {'5': 2, '500': 1}
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_rows_and_history_reads_them(session_factory, rule_engine, tmp_path):
+    """Test archiving old rows into day segments, merged history reads and clearing a session"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import func, select
+    from app.models.conversation import Analytics, Message
+    from app.services.archive import ArchiveJob, ArchiveStore
+    from app.services.conversation_service import ConversationService
+    
+    now = datetime(2024, 6, 30, 12, 0)
+    store = ArchiveStore(str(tmp_path / 'archive'))
+    async with session_factory() as db:
+        turns = []
+        for days_ago, session_id in ((40, "s1"), (35, "s1"), (35, "s2"), (1, "s1")):
+            message = f"hello {days_ago}"
+            turns.append({
+                'session_id': session_id, 'messages': [message], 'results': [rule_engine.process_message(message)],
+                'response_time_ms': 2, 'timestamp': now - timedelta(days=days_ago)
+            })
+        await ConversationService.save_turns(db, turns)
+    
+    # No writer transaction is open while segments are written
+    writers = []
+    def writer_factory():
+        writers.append(session_factory())
+        return writers[-1]
+    write_segment = store.write_segment
+    def checked_write_segment(*args):
+        assert not any(db.in_transaction() for db in writers)
+        return write_segment(*args)
+    store.write_segment = checked_write_segment
+    
+    job = ArchiveJob(writer_factory, store, max_age_days=30, batch_size=3, read_session_factory=session_factory)
+    assert await job.run_once(now=now) == {'messages': 6, 'analytics': 3}
+    store.write_segment = write_segment
+    async with session_factory() as db:
+        assert (await db.execute(select(func.count()).select_from(Message))).scalar() == 2
+        hot_only = await ConversationService.get_history_page(db, "s1", limit=10)
+        assert len(hot_only['messages']) == 2
+        
+        first = await ConversationService.get_history_page(db, "s1", limit=3, archive=store)
+        rest = await ConversationService.get_history_page(
+            db, "s1", limit=3, after=first['next_cursor'], archive=store
+        )
+        exported = [m async for m in ConversationService.iter_conversation_history(db, "s1", archive=store)]
+        paged = first['messages'] + rest['messages']
+        assert [m['message'] for m in paged if m['is_user']] == ["hello 40", "hello 35", "hello 1"]
+        assert rest['next_cursor'] is None and paged == exported
+        analytics = await ConversationService.get_session_analytics(db, "s1")
+        assert analytics['total_interactions'] == 3
+        
+        # Rebuilds count archived rows, and refuse to run without the archive
+        with pytest.raises(ValueError):
+            await ConversationService.rebuild_analytics_rollups(db)
+        await ConversationService.rebuild_analytics_rollups(db, archive=store)
+        assert await ConversationService.rebuild_analytics_buckets(db, archive=store) == 4
+        assert await ConversationService.get_session_analytics(db, "s1") == analytics
+        
+        await ConversationService.clear_session(db, "s1", archive=store)
+        cleared = await ConversationService.get_history_page(db, "s1", limit=10, archive=store)
+        other = await ConversationService.get_history_page(db, "s2", limit=10, archive=store)
+        leftover = (await db.execute(
+            select(func.count()).select_from(Analytics).where(Analytics.session_id == "s1")
+        )).scalar()
+    
+    assert cleared['messages'] == [] and leftover == 0
+    assert [m['message'] for m in other['messages'] if m['is_user']] == ["hello 35"]
+    # Segments holding only the cleared session were removed
+    assert store.stats()['messages']['segments'] == 1
+    
+    # Segments are split by session shard; unsharded segments from before sharding are still read
+    store = ArchiveStore(str(tmp_path / 'archive'))
+    remaining = list((tmp_path / 'archive' / 'messages').rglob('*.ndjson.gz'))
+    assert [path.parent.name for path in remaining] == [store.shard("s2")]
+    legacy_day = datetime(2024, 1, 1)
+    store._write(
+        store._day_dir('messages', legacy_day.date()) / '000000000100-000000000100.ndjson.gz',
+        [{'id': 100, 'session_id': "s9", 'message': "old", 'timestamp': legacy_day}]
+    )
+    assert [row['id'] for row in store.read_session('messages', [legacy_day.date()], "s9")] == [100]
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test Bloom filter membership and its false positive rate"""
+    from app.core.cache import BloomFilter
+    
+    bloom = BloomFilter(capacity=2000, error_rate=0.01)
+    for index in range(2000):
+        bloom.add(f"session-{index}")
+    assert all(f"session-{index}" in bloom for index in range(2000))
+    false_positives = sum(f"other-{index}" in bloom for index in range(10000))
+    assert false_positives < 300
+    assert bloom.stats()['keys'] == 2000
+
+
+@pytest.mark.asyncio
+async def test_session_registry_validates_and_batches_activity(session_factory):
+    """Test session validation from memory and batched activity updates"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import select
+    from app.models.conversation import Conversation
+    from app.services.conversation_service import ConversationService
+    from app.services.session_registry import SessionRegistry
+    
+    async with session_factory() as db:
+        stored = await ConversationService.create_session(db)
+        idle = await ConversationService.create_session(db)
+        await db.execute(
+            Conversation.__table__.update()
+            .where(Conversation.session_id == idle)
+            .values(updated_at=datetime.utcnow() - timedelta(hours=2))
+        )
+        await db.commit()
+    
+    registry = SessionRegistry(session_factory, cache_size=10, authoritative=True, idle_minutes=30)
+    await registry.load()
+    registry.register("fresh")
+    async with session_factory() as db:
+        answers = [
+            await registry.exists(db, session_id)
+            for session_id in (stored, stored, "fresh", "unknown")
+        ]
+    assert answers == [True, True, True, False]
+    
+    registry.touch(stored)
+    await registry.flush()
+    async with session_factory() as db:
+        rows = dict((await db.execute(select(Conversation.session_id, Conversation.is_active))).all())
+    stats = registry.stats()
+    # Only the first check of a stored session reaches the database; unknown IDs never do
+    assert stats['lookups'] == 1 and stats['rejected'] == 1
+    assert stats['touched'] == 1 and stats['deactivated'] == 1
+    assert rows[stored] and not rows[idle]
+
+
+@pytest.mark.asyncio
+async def test_session_registries_share_sessions_through_database(session_factory):
+    """Test that a session created through one worker's registry is valid on another's"""
+    from app.services.conversation_service import ConversationService
+    from app.services.session_registry import SessionRegistry
+    
+    # One registry per worker process, both loaded before the session exists
+    worker_a, worker_b = SessionRegistry(session_factory), SessionRegistry(session_factory)
+    await worker_a.load()
+    await worker_b.load()
+    async with session_factory() as db:
+        session_id = await ConversationService.create_session(db)
+        worker_a.register(session_id)
+        
+        assert await worker_a.exists(db, session_id)
+        assert await worker_b.exists(db, session_id)
+        assert not await worker_b.exists(db, "unknown")
+    assert worker_a.stats()['lookups'] == 0
+    assert worker_b.stats()['lookups'] == 2 and worker_b.stats()['rejected'] == 1
+
+
+@pytest.mark.asyncio
+async def test_history_buffer_pages_match_database(session_factory, rule_engine):
+    """Test that history pages served from memory equal the database pages"""
+    from app.services.conversation_service import ConversationService
+    from app.services.history_buffer import HistoryBuffer
+    
+    full = HistoryBuffer(session_size=100)
+    tail = HistoryBuffer(session_size=6)
+    async with session_factory() as db:
+        for index in range(5):
+            message = f"hello {index}"
+            rows = await ConversationService.save_batch(
+                db, "s1", [message], [rule_engine.process_message(message)], 1, new_session=index == 0
+            )
+            full.record(rows, ["s1"] if index == 0 else [])
+            tail.record(rows, ["s1"] if index == 0 else [])
+        
+        pairs = []
+        for buffer in (full, tail):
+            for kwargs in ({}, {'latest': True}):
+                page = buffer.page("s1", 4, **kwargs)
+                pairs.append((page, await ConversationService.get_history_page(db, "s1", 4, **kwargs)))
+                for direction in ('next_cursor', 'prev_cursor'):
+                    if page and page[direction]:
+                        argument = {'next_cursor': 'after', 'prev_cursor': 'before'}[direction]
+                        pairs.append((
+                            buffer.page("s1", 4, **{argument: page[direction]}),
+                            await ConversationService.get_history_page(db, "s1", 4, **{argument: page[direction]})
+                        ))
+    
+    served = [(page, expected) for page, expected in pairs if page is not None]
+    assert all(page == expected for page, expected in served)
+    # The complete buffer answers every page; the 6-message tail only the newest one
+    assert len(pairs) == 7 and len(served) == 5
+    assert full.stats()['hits'] == 4 and full.stats()['messages'] == 10
+    assert tail.page("s1", 4) is None and tail.stats()['messages'] == 6
+    
+    full.clear("s1")
+    assert full.page("s1", 4) is None and full.stats()['estimated_bytes'] == 0
+
+
+LEGACY_SCHEMA = """
+    CREATE TABLE conversations (id INTEGER PRIMARY KEY, session_id VARCHAR(255) NOT NULL UNIQUE,
+        created_at DATETIME, updated_at DATETIME, is_active BOOLEAN);
+    CREATE TABLE messages (id INTEGER PRIMARY KEY, session_id VARCHAR(255) NOT NULL, message TEXT NOT NULL,
+        is_user BOOLEAN NOT NULL, intent VARCHAR(100), sentiment VARCHAR(50), timestamp DATETIME);
+    CREATE TABLE analytics (id INTEGER PRIMARY KEY, session_id VARCHAR(255), intent VARCHAR(100),
+        matched_pattern TEXT, response_time_ms INTEGER, timestamp DATETIME);
+    INSERT INTO conversations (session_id, is_active) VALUES ('old', 1);
+    INSERT INTO messages VALUES (1, 'old', 'hi', 1, NULL, NULL, '2024-01-01 00:00:00'),
+        (2, 'old', 'Hello!', 0, 'greeting', 'positive', '2024-01-01 00:00:00');
+    INSERT INTO analytics VALUES (1, 'old', 'greeting', '\\bhi\\b', 7, '2024-01-01 00:00:00');
+"""
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('db_schema', [LEGACY_SCHEMA])
+async def test_dictionary_encoded_rows_and_legacy_migration(session_factory, rule_engine, tmp_path):
+    """Test that rows store dictionary IDs, read back as names, and legacy string rows are migrated"""
+    import sqlite3
+    from sqlalchemy import select
+    from app.core.database import _drop_legacy_columns, _migrate_dictionary_columns
+    from app.models.conversation import Analytics, RulePattern
+    from app.services.conversation_service import ConversationService
+    from app.services.rule_catalog import RuleCatalog
+    
+    # Migrating again is a no-op
+    async with session_factory.kw['bind'].begin() as conn:
+        await conn.run_sync(_migrate_dictionary_columns)
+    
+    catalog = RuleCatalog()
+    async with session_factory() as db:
+        version_id = await catalog.register(db, rule_engine.snapshot)
+        messages = ["hello", "xyzzy"]
+        await ConversationService.save_batch(
+            db, "s1", messages, [rule_engine.process_message(m) for m in messages], 5,
+            new_session=True, rules_hash=rule_engine.snapshot.source_hash
+        )
+        greeting, fallback = (await db.execute(
+            select(Analytics.intent_id, Analytics.pattern_id, Analytics.rule_version_id, RulePattern.source)
+            .outerjoin(RulePattern, RulePattern.id == Analytics.pattern_id)
+            .where(Analytics.session_id == "s1")
+            .order_by(Analytics.id)
+        )).all()
+        history = await ConversationService.get_conversation_history(db, "s1")
+        old = await ConversationService.get_conversation_history(db, "old")
+        old_analytics = await ConversationService.get_session_analytics(db, "old")
+    
+    assert all(isinstance(value, int) for value in greeting[:3]) and greeting[2] == version_id
+    assert greeting[3] == rule_engine.process_message("hello")['matched_pattern']
+    assert fallback[1] is None and fallback[2] == version_id
+    assert [(m['intent'], m['sentiment']) for m in history if not m['is_user']] == [
+        ('greeting', rule_engine.process_message("hello")['sentiment']), ('fallback', 'neutral')
+    ]
+    assert [(m['message'], m['intent'], m['sentiment']) for m in old] == [
+        ('hi', None, None), ('Hello!', 'greeting', 'positive')
+    ]
+    assert old_analytics['intent_distribution'] == {'greeting': 1}
+    
+    # Startup keeps the string columns so the previous release can still read them
+    columns = {row[1] for row in sqlite3.connect(tmp_path / 'chat.db').execute("PRAGMA table_info(analytics)")}
+    assert {'matched_pattern', 'intent'} <= columns
+    
+    async with session_factory.kw['bind'].begin() as conn:
+        await conn.run_sync(_drop_legacy_columns)
+    async with session_factory() as db:
+        assert await ConversationService.get_conversation_history(db, "old") == old
+    columns = {row[1] for row in sqlite3.connect(tmp_path / 'chat.db').execute("PRAGMA table_info(analytics)")}
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        assert 'matched_pattern' not in columns and 'intent' not in columns
+
+
+@pytest.mark.asyncio
+async def test_rescore_sentiment_updates_fallback_rows_only(session_factory, rule_engine):
+    """Test that re-scoring rescores fallback replies from their user message and keeps intent sentiment"""
+    from sqlalchemy import update
+    from app.models.conversation import Message
+    from app.services.conversation_service import ConversationService
+    from app.services.rule_catalog import rule_catalog
+    
+    analyzer = rule_engine.snapshot.sentiment
+    messages = ["I love this chatbot it's great", "this is terrible and awful", "hello", "thank you"]
+    results = [rule_engine.process_message(m) for m in messages]
+    async with session_factory() as db:
+        await ConversationService.save_batch(db, "s1", messages, results, 5, new_session=True)
+        # Stale scores on every row, including user rows left by an earlier re-scoring run
+        neutral = (await rule_catalog.sentiment_ids(db, {'neutral'}))['neutral']
+        fallback = (await rule_catalog.intent_ids(db, {'fallback'}))['fallback']
+        await db.execute(
+            update(Message)
+            .where((Message.is_user.is_(True)) | (Message.intent_id == fallback))
+            .values(sentiment_id=neutral)
+        )
+        await db.commit()
+        assert await ConversationService.rescore_sentiment(db, analyzer, batch_size=1) == 2
+        history = await ConversationService.get_conversation_history(db, "s1")
+    
+    replies = [m for m in history if not m['is_user']]
+    assert [m['sentiment'] for m in history if m['is_user']] == [None] * 4
+    assert [m['intent'] for m in replies] == ['fallback', 'fallback', 'greeting', 'gratitude']
+    # Fallbacks get the lexicon score; matched intents keep their configured sentiment
+    assert [m['sentiment'] for m in replies] == ['positive', 'negative', 'positive', 'positive']
+    assert [m['sentiment'] for m in replies] == [result['sentiment'] for result in results]
+    assert analyzer.analyze("hello") == 'neutral'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('db_schema', [LEGACY_SCHEMA])
+async def test_session_tenant_is_stored_on_conversation_row(session_factory, rule_engine):
+    """Test that a session's tenant is persisted and existing databases gain the column"""
+    from app.services.conversation_service import ConversationService
+    
+    async with session_factory() as db:
+        hello = [rule_engine.process_message("hello")]
+        await ConversationService.save_batch(db, "s1", ["hello"], hello, 5, new_session=True, tenant="acme")
+        await ConversationService.save_batch(db, "s2", ["hello"], hello, 5, new_session=True)
+        tenants = [
+            await ConversationService.get_session_tenant(db, session_id)
+            for session_id in ("s1", "s2", "old", "unknown")
+        ]
+    assert tenants == ["acme", None, None, None]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_profile_engines(tmp_path, monkeypatch):
+    """Test the writer's pragmas, read-only reader connections and the shared engine fallback"""
+    from sqlalchemy import exc, text
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from app.core import database
+    from app.core.config import settings
+    
+    monkeypatch.setattr(settings, 'DATABASE_URL', f"sqlite+aiosqlite:///{tmp_path / 'chat.db'}")
+    monkeypatch.setattr(settings, 'SQLITE_STORAGE_PROFILE', True)
+    writer, reader = database._create_engines()
+    assert writer is not reader
+    try:
+        async with writer.begin() as conn:
+            pragmas = {
+                name: (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'query_only')
+            }
+            await conn.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY)"))
+            await conn.execute(text("INSERT INTO notes VALUES (1)"))
+        assert pragmas == {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': settings.SQLITE_BUSY_TIMEOUT_MS,
+            'cache_size': -settings.SQLITE_CACHE_SIZE_KB, 'mmap_size': settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024,
+            'query_only': 0
+        }
+        
+        read_session = async_sessionmaker(reader, class_=AsyncSession)
+        async with read_session() as db:
+            assert (await db.execute(text("SELECT count(*) FROM notes"))).scalar() == 1
+            assert (await db.execute(text("PRAGMA query_only"))).scalar() == 1
+            with pytest.raises(exc.OperationalError):
+                await db.execute(text("INSERT INTO notes VALUES (2)"))
+    finally:
+        await writer.dispose()
+        await reader.dispose()
+    
+    # In-memory and URI databases, or the profile turned off, share one engine
+    for url, profile in (("sqlite+aiosqlite:///:memory:", True), ("sqlite+aiosqlite://", True),
+                         (f"sqlite+aiosqlite:///file:{tmp_path / 'uri.db'}?uri=true", True),
+                         (f"sqlite+aiosqlite:///{tmp_path / 'plain.db'}", False)):
+        monkeypatch.setattr(settings, 'DATABASE_URL', url)
+        monkeypatch.setattr(settings, 'SQLITE_STORAGE_PROFILE', profile)
+        writer, reader = database._create_engines()
+        assert writer is reader
+        await writer.dispose()